@@ -0,0 +1,22 @@
+"""
+Lets pytest run the tests of the snapshots app; python manage.py test runs them as well.
+"""
+import os
+
+import django
+import pytest
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'snapshot_manager.settings')
+django.setup()
+
+
+@pytest.fixture(scope='session', autouse=True)
+def django_test_databases():
+    """Creates the test databases once, like the test runner of manage.py test."""
+    from django.test.utils import setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+
+    setup_test_environment()
+    old_config = setup_databases(verbosity=0, interactive=False)
+    yield
+    teardown_databases(old_config, verbosity=0)
+    teardown_test_environment()
@@ -18,185 +18,3826 @@ Usage:
 This software is licensed under the GNU General Public License (GPL) v3.0. You may copy, modify, and distribute it under the same license.
 """
 import logging
-from logging.handlers import RotatingFileHandler
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
 import requests
+from requests.adapters import HTTPAdapter
 import json
 import uuid
+import hashlib
+import threading
+import contextvars
+from contextlib import contextmanager
+import atexit
+import functools
+import heapq
+import sys
+import zlib
+import time
+import random
 import re
+import fnmatch
 import os
 from dotenv import load_dotenv
 from datetime import datetime
+from email.utils import parsedate_to_datetime
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from jinja2 import Environment, FileSystemLoader
+from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache, select_autoescape
 import pytz
+from concurrent.futures import ThreadPoolExecutor
+import queue
+import asyncio
+
+try:
+    import aiohttp
+except ImportError:  # Only required by AsyncContaboSnapshotManager
+    aiohttp = None
+
+try:
+    import prometheus_client
+except ImportError:  # Only required for metrics
+    prometheus_client = None
+
+try:
+    from opentelemetry import trace as otel_trace
+except ImportError:  # Only required to export spans to OpenTelemetry
+    otel_trace = None
+
+
+# Directory of the email templates, resolved from this file (the project's BASE_DIR) rather than the working directory
+EMAIL_TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates', 'email')
+
+_email_environment = None
+_email_environment_lock = threading.Lock()
+
+
+def get_email_environment():
+    """
+    Returns the process-wide Jinja environment of the email templates (EMAIL_TEMPLATE_DIR by default).
+
+    Templates are compiled once per process, and the compiled bytecode is cached on disk in
+    EMAIL_TEMPLATE_CACHE_DIR (default: a per-user directory in the temp dir), so new worker
+    processes do not compile them again.
+    """
+    global _email_environment
+    with _email_environment_lock:
+        if _email_environment is None:
+            cache_dir = os.getenv('EMAIL_TEMPLATE_CACHE_DIR')
+            if cache_dir:
+                os.makedirs(cache_dir, exist_ok=True)
+            _email_environment = Environment(
+                loader=FileSystemLoader(os.getenv('EMAIL_TEMPLATE_DIR') or EMAIL_TEMPLATE_DIR),
+                bytecode_cache=FileSystemBytecodeCache(cache_dir) if cache_dir else FileSystemBytecodeCache(),
+                autoescape=select_autoescape(['html']),
+            )
+        return _email_environment
+
+
+def build_email_data(snapshot_results, timezone, timings=None):
+    """
+    Builds the context of the summary email template in one pass over the results.
+
+    With SNAPSHOT_EMAIL_MODE=condensed (or 'auto' above SNAPSHOT_EMAIL_CONDENSE_THRESHOLD instances)
+    the successful snapshots are listed in a compact table and only the problems are expanded.
+    Each section lists at most SNAPSHOT_EMAIL_PAGE_SIZE instances and counts the rest, so the size
+    of the email stays bounded on large fleets.
+
+    Parameters:
+        snapshot_results (list): The result entries, as tracked in ContaboSnapshotManager.snapshot_results.
+        timezone (tzinfo): The timezone of the timestamps in the email.
+        timings (dict): The timing summary of the run, as returned by SnapshotTracer.summary(), if any.
+
+    Returns:
+        dict: The template context.
+    """
+    mode = os.getenv('SNAPSHOT_EMAIL_MODE', 'auto').lower()
+    condensed = mode == 'condensed' or (mode == 'auto' and len(snapshot_results) > int(os.getenv('SNAPSHOT_EMAIL_CONDENSE_THRESHOLD', 100)))
+    page_size = max(1, int(os.getenv('SNAPSHOT_EMAIL_PAGE_SIZE', 500)))
+
+    successes, problems, skipped = [], [], []
+    successful_snapshots = unverified_snapshots = 0
+    for result in snapshot_results:
+        if result.get('status') == 'skipped':
+            skipped.append(result)
+        elif result.get('status') == 'unverified':
+            # Created but not completed by the deadline, worth a closer look
+            successful_snapshots += 1
+            unverified_snapshots += 1
+            problems.append(result)
+        elif result.get('success', False):
+            successful_snapshots += 1
+            successes.append(result)
+        else:
+            problems.append(result)
+
+    return {
+        'timestamp': datetime.now(timezone).strftime('%Y-%m-%d %H:%M:%S'),
+        'total_instances': len(snapshot_results),
+        'successful_snapshots': successful_snapshots,
+        'failed_snapshots': len(snapshot_results) - successful_snapshots - len(skipped),
+        'skipped_instances': len(skipped),
+        'unverified_snapshots': unverified_snapshots,
+        'instances': snapshot_results[:page_size],
+        'hidden_instances': max(0, len(snapshot_results) - page_size),
+        'condensed': condensed,
+        'successes': successes[:page_size],
+        'hidden_successes': max(0, len(successes) - page_size),
+        'problems': problems[:page_size],
+        'hidden_problems': max(0, len(problems) - page_size),
+        'skipped': skipped[:page_size],
+        'hidden_skipped': max(0, len(skipped) - page_size),
+        'timings': timings,
+    }
+
+
+def render_summary_email(snapshot_results, timezone, timings=None):
+    """
+    Renders the summary email of snapshot operations, see build_email_data.
+
+    Returns:
+        str: The HTML of the email.
+    """
+    return render_email(build_email_data(snapshot_results, timezone, timings))
+
+
+def render_email(email_data):
+    """
+    Renders the summary email template with the context built by build_email_data.
+    """
+    return get_email_environment().get_template('snapshot_summary.html').render(**email_data)
+
+
+def build_report(snapshot_results, timezone, timings=None, title=None):
+    """
+    Builds the report of a run as sent by the notification channels.
+
+    Parameters:
+        snapshot_results (list): The result entries, as tracked in ContaboSnapshotManager.snapshot_results.
+        timezone (tzinfo): The timezone of the timestamps in the report.
+        timings (dict): The timing summary of the run, as returned by SnapshotTracer.summary(), if any.
+        title (str): Distinguishes reports sent together, e.g. the account of a run.
+
+    Returns:
+        dict: 'subject', 'html' (the email), 'text' (a short plain text summary) and 'payload'
+        (the counts, problems and timings for webhooks).
+    """
+    email_data = build_email_data(snapshot_results, timezone, timings)
+    subject = f'Contabo Snapshot Summary - {datetime.now(timezone).strftime("%Y-%m-%d %H:%M")}'
+    if title:
+        subject = f"{subject} ({title})"
+    counts = {
+        key: email_data[key]
+        for key in ('total_instances', 'successful_snapshots', 'failed_snapshots', 'skipped_instances', 'unverified_snapshots')
+    }
+    problems = [
+        {'account': result.get('account'), 'id': result.get('id'), 'status': result.get('status'), 'error': result.get('error')}
+        for result in email_data['problems']
+    ]
+    lines = [
+        f"{subject}: {counts['successful_snapshots']}/{counts['total_instances']} snapshots created, "
+        f"{counts['failed_snapshots']} failed, {counts['skipped_instances']} skipped"
+    ]
+    lines += [
+        f"- {problem['account'] + '/' if problem['account'] else ''}{problem['id']}: {problem['status']} {problem['error'] or ''}".rstrip()
+        for problem in problems[:20]
+    ]
+    if len(problems) + email_data['hidden_problems'] > 20:
+        lines.append(f"... and {len(problems) + email_data['hidden_problems'] - 20} more")
+    return {
+        'subject': subject,
+        'html': render_email(email_data),
+        'text': '\n'.join(lines),
+        'payload': {
+            'title': title,
+            'subject': subject,
+            'timestamp': email_data['timestamp'],
+            **counts,
+            'problems': problems,
+            'timings': timings,
+        },
+    }
+
+
+class NotificationChannel:
+    """
+    NotificationChannel is the base of the channels reports are sent through. Channels are used
+    as context managers, so connections opened for a batch of reports are closed afterwards.
+    """
+
+    name = None
+
+    @classmethod
+    def from_env(cls):
+        """Builds the channel from environment variables."""
+        raise NotImplementedError
+
+    def is_configured(self):
+        """Returns True if the channel has everything it needs to send."""
+        return True
+
+    def send(self, report):
+        """
+        Sends one report, as built by build_report.
+
+        Raises:
+            Exception: If the report could not be sent.
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """Releases the connections of the channel, if any."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class SmtpChannel(NotificationChannel):
+    """
+    Sends reports as HTML email. The SMTP connection is opened by the first report and reused by
+    the following ones until close(), so a batch of reports costs one connect, TLS handshake and login.
+    """
+
+    name = 'smtp'
+
+    def __init__(self, server, port, username, password, sender, recipient, timeout=30):
+        self.server = server
+        self.port = port
+        self.username = username
+        self.password = password
+        self.sender = sender
+        self.recipient = recipient
+        # Per connection timeout; the process-wide socket default is left alone
+        self.timeout = timeout
+        self.connection = None
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            os.getenv('SMTP_SERVER'),
+            int(os.getenv('SMTP_PORT', 587)),
+            os.getenv('SMTP_USERNAME'),
+            os.getenv('SMTP_PASSWORD'),
+            os.getenv('EMAIL_FROM'),
+            os.getenv('ADMIN_EMAIL'),
+            timeout=float(os.getenv('SMTP_TIMEOUT', 30)),
+        )
+
+    def is_configured(self):
+        return all([self.server, self.username, self.password, self.recipient, self.sender])
+
+    def connect(self):
+        """Opens and authenticates the SMTP connection."""
+        connection = smtplib.SMTP(self.server, self.port, timeout=self.timeout)
+        try:
+            connection.starttls()
+            connection.login(self.username, self.password)
+        except Exception:
+            connection.close()
+            raise
+        self.connection = connection
+        return connection
+
+    def get_connection(self):
+        """Returns the open connection, reconnecting if the server closed it in the meantime."""
+        if self.connection is not None:
+            try:
+                if self.connection.noop()[0] == 250:
+                    return self.connection
+            except smtplib.SMTPException:
+                pass
+            self.close()
+        return self.connect()
+
+    def send(self, report):
+        msg = MIMEMultipart('alternative')
+        msg['Subject'] = report['subject']
+        msg['From'] = self.sender
+        msg['To'] = self.recipient
+        msg.attach(MIMEText(report['text'], 'plain'))
+        msg.attach(MIMEText(report['html'], 'html'))
+        self.get_connection().send_message(msg)
+
+    def close(self):
+        if self.connection is not None:
+            try:
+                self.connection.quit()
+            except (smtplib.SMTPException, OSError):
+                self.connection.close()
+            self.connection = None
+
+
+class WebhookChannel(NotificationChannel):
+    """
+    POSTs the JSON payload of each report (counts, problems, timings) to NOTIFY_WEBHOOK_URL.
+    """
+
+    name = 'webhook'
+    url_variable = 'NOTIFY_WEBHOOK_URL'
+
+    def __init__(self, url, timeout=10):
+        self.url = url
+        self.timeout = timeout
+        self.session = None
+
+    @classmethod
+    def from_env(cls):
+        return cls(os.getenv(cls.url_variable), timeout=float(os.getenv('NOTIFY_WEBHOOK_TIMEOUT', 10)))
+
+    def is_configured(self):
+        return bool(self.url)
+
+    def get_body(self, report):
+        """Returns the JSON body posted for a report."""
+        return report['payload']
+
+    def send(self, report):
+        if self.session is None:
+            self.session = requests.Session()
+        response = self.session.post(self.url, json=self.get_body(report), timeout=self.timeout)
+        response.raise_for_status()
+
+    def close(self):
+        if self.session is not None:
+            self.session.close()
+            self.session = None
+
+
+class SlackChannel(WebhookChannel):
+    """
+    Posts the plain text summary of each report to a Slack-compatible incoming webhook (SLACK_WEBHOOK_URL).
+    """
+
+    name = 'slack'
+    url_variable = 'SLACK_WEBHOOK_URL'
+
+    def get_body(self, report):
+        return {'text': report['text']}
+
+
+# Channels selectable in SNAPSHOT_NOTIFY_CHANNELS, by name
+NOTIFICATION_CHANNELS = {channel.name: channel for channel in (SmtpChannel, WebhookChannel, SlackChannel)}
+
+
+def get_notification_channels(logger, names=None):
+    """
+    Returns the configured channels of SNAPSHOT_NOTIFY_CHANNELS (comma separated, default 'smtp').
+
+    Parameters:
+        logger (logging.Logger): The logger unconfigured or unknown channels are reported to.
+        names (list): Restrict the channels to these names, e.g. the ones to retry.
+
+    Returns:
+        list: The channels.
+    """
+    channels = []
+    for name in [name.strip() for name in os.getenv('SNAPSHOT_NOTIFY_CHANNELS', 'smtp').split(',') if name.strip()]:
+        if names is not None and name not in names:
+            continue
+        if name not in NOTIFICATION_CHANNELS:
+            logger.warning(f"Ignoring unknown notification channel '{name}'")
+            continue
+        channel = NOTIFICATION_CHANNELS[name].from_env()
+        if not channel.is_configured():
+            logger.warning(f"Notification channel '{name}' is not configured. Skipping it.")
+            continue
+        channels.append(channel)
+    return channels
+
+
+def dispatch_reports(reports, channels, logger):
+    """
+    Sends the reports through each channel, reusing the channel's connection for the whole batch.
+
+    A failing channel is logged and does not stop the others.
+
+    Parameters:
+        reports (list): The reports, as built by build_report.
+        channels (list): The NotificationChannels.
+        logger (logging.Logger): The logger to report to.
+
+    Returns:
+        list: The names of the channels that failed.
+    """
+    failed = []
+    for channel in channels:
+        try:
+            with channel:
+                for report in reports:
+                    channel.send(report)
+            logger.info(f"Sent {len(reports)} report(s) via {channel.name}")
+        except Exception as e:
+            logger.error(f"Failed to send report(s) via {channel.name}: {e!r}")
+            failed.append(channel.name)
+    return failed
+
+
+def send_summary_email(snapshot_results, timezone, logger, timings=None):
+    """
+    Generates and sends a summary email of snapshot operations, blocking until it is sent.
+
+    The django-q tasks queue snapshots.tasks.send_run_reports instead, which also covers the
+    other notification channels and retries.
+
+    Parameters:
+        snapshot_results (list): The result entries, as tracked in ContaboSnapshotManager.snapshot_results.
+        timezone (tzinfo): The timezone of the timestamps in the email.
+        logger (logging.Logger): The logger to report to.
+        timings (dict): The timing summary of the run, as returned by SnapshotTracer.summary(), if any.
+    """
+    channel = SmtpChannel.from_env()
+    if not channel.is_configured():
+        logger.warning("Email configuration incomplete. Skipping email summary.")
+        logger.warning(f"Missing: SMTP_SERVER={channel.server}, SMTP_USERNAME={channel.username}, SMTP_PASSWORD={'***' if channel.password else 'None'}, ADMIN_EMAIL={channel.recipient}, EMAIL_FROM={channel.sender}")
+        return
+    logger.info(f"Sending summary email via {channel.server}:{channel.port}")
+    dispatch_reports([build_report(snapshot_results, timezone, timings)], [channel], logger)
+
+
+class ContaboApiError(Exception):
+    """Raised when the Contabo API keeps failing for a call whose result cannot be skipped."""
+
+
+class RateLimiter:
+    """
+    RateLimiter is an adaptive token bucket shared by every call to the Contabo API.
+
+    Callers take one token per request; tokens refill at `rate` per second up to `burst`. When the
+    API answers 429 the bucket pauses everyone for the Retry-After delay and halves the rate, which
+    then recovers gradually with every successful call.
+    """
+
+    def __init__(self, rate=10, burst=20, min_rate=0.5):
+        """
+        Initializes the RateLimiter.
+
+        Parameters:
+            rate (float): Sustained requests per second. 0 disables rate limiting.
+            burst (int): Maximum number of requests sent back to back.
+            min_rate (float): The rate is never reduced below this after a 429.
+        """
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.min_rate = min(min_rate, rate) if rate > 0 else 0
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        """
+        Takes one token and returns how long the caller must wait before sending its request.
+
+        Returns:
+            float: The delay in seconds.
+        """
+        if self.max_rate <= 0:
+            return 0.0
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            delay = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            return max(delay, self.paused_until - now)
+
+    def acquire(self):
+        """Blocks until the caller may send a request."""
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+    async def aacquire(self):
+        """Waits, without blocking the event loop, until the caller may send a request."""
+        delay = self.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def throttle(self, delay):
+        """
+        Backs off after a 429: pauses all callers for `delay` seconds and halves the rate once per pause.
+
+        Parameters:
+            delay (float): Seconds to pause, usually taken from Retry-After.
+        """
+        if self.max_rate <= 0:
+            return
+        with self.lock:
+            now = time.monotonic()
+            # Calls already in flight when the first 429 arrived must not halve the rate again
+            if self.paused_until <= now:
+                self.rate = max(self.min_rate, self.rate / 2)
+            self.paused_until = max(self.paused_until, now + delay)
+
+    def recover(self):
+        """Increases the rate again after a successful call, up to the configured rate."""
+        if self.rate < self.max_rate:
+            with self.lock:
+                self.rate = min(self.max_rate, self.rate + self.max_rate * 0.05)
+
+
+class RetryPolicy:
+    """
+    RetryPolicy decides which failed Contabo API calls are retried and how long to wait.
+
+    Idempotent calls (GET, DELETE) are retried on 429, 5xx, connection errors and timeouts.
+    POST is retried only when the API did not process it (429 and 503), so a retry never
+    creates a second snapshot. Delays grow exponentially with full jitter, unless the
+    response carries a Retry-After header, which is honoured.
+    """
+
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+    UNSAFE_RETRY_STATUSES = (429, 503)
+    IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE')
+
+    def __init__(self, max_retries=4, backoff_base=0.5, backoff_max=60):
+        """
+        Initializes the RetryPolicy.
+
+        Parameters:
+            max_retries (int): Maximum number of retries per call. 0 disables retries.
+            backoff_base (float): Base delay in seconds of the exponential backoff.
+            backoff_max (float): Upper bound in seconds of any delay, including Retry-After.
+        """
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+    def should_retry(self, method, attempt, status_code=None):
+        """
+        Checks whether a failed call should be retried.
+
+        Parameters:
+            method (str): The HTTP method of the call.
+            attempt (int): The number of retries already made.
+            status_code (int): The response status, or None if the call raised a connection error.
+
+        Returns:
+            bool: True if the call should be retried.
+        """
+        if attempt >= self.max_retries:
+            return False
+        idempotent = method.upper() in self.IDEMPOTENT_METHODS
+        if status_code is None:
+            return idempotent
+        return status_code in (self.RETRY_STATUSES if idempotent else self.UNSAFE_RETRY_STATUSES)
+
+    def get_delay(self, attempt, response=None):
+        """
+        Computes how long to wait before the next retry.
+
+        Parameters:
+            attempt (int): The number of retries already made.
+            response (requests.Response): The failed response, if any.
+
+        Returns:
+            float: The delay in seconds.
+        """
+        retry_after = self.parse_retry_after(response.headers.get('Retry-After')) if response is not None else None
+        if retry_after is not None:
+            return min(self.backoff_max, retry_after)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def parse_retry_after(self, value):
+        """
+        Parses a Retry-After header given either in seconds or as an HTTP date.
+
+        Parameters:
+            value (str): The header value.
+
+        Returns:
+            float: The delay in seconds, or None if the header is missing or invalid.
+        """
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            return max(0.0, (parsedate_to_datetime(value) - datetime.now(pytz.utc)).total_seconds())
+        except (TypeError, ValueError):
+            return None
+
+
+class SnapshotMetrics:
+    """
+    SnapshotMetrics holds the Prometheus metrics of the API calls and snapshot runs.
+
+    Requests are observed per endpoint template and status, so the label sets stay small for
+    any fleet size. Use get_metrics() for the process-wide instance on the default registry.
+    """
+
+    REQUEST_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+    RUN_BUCKETS = (10, 30, 60, 120, 300, 600, 900, 1800, 3600, 7200)
+
+    def __init__(self, registry=None):
+        """
+        Creates the metrics.
+
+        Parameters:
+            registry (prometheus_client.CollectorRegistry): The registry to register with; the default registry if None.
+        """
+        registry = registry if registry is not None else prometheus_client.REGISTRY
+        self.registry = registry
+        self.request_duration = prometheus_client.Histogram(
+            'contabo_api_request_duration_seconds', 'Duration of Contabo API requests',
+            ['endpoint', 'status'], buckets=self.REQUEST_BUCKETS, registry=registry
+        )
+        self.retries = prometheus_client.Counter(
+            'contabo_api_retries_total', 'Contabo API requests that were retried',
+            ['endpoint', 'reason'], registry=registry
+        )
+        self.token_requests = prometheus_client.Counter(
+            'contabo_token_requests_total', 'Access token requests to the Contabo auth service',
+            ['grant', 'outcome'], registry=registry
+        )
+        self.instances = prometheus_client.Counter(
+            'snapshot_instances_processed_total', 'Instances processed by snapshot runs',
+            ['status'], registry=registry
+        )
+        self.run_duration = prometheus_client.Histogram(
+            'snapshot_run_duration_seconds', 'Duration of snapshot runs (or shards of a run)',
+            ['engine'], buckets=self.RUN_BUCKETS, registry=registry
+        )
+        self.last_run_duration = prometheus_client.Gauge(
+            'snapshot_run_last_duration_seconds', 'Duration of the last snapshot run',
+            ['engine'], registry=registry
+        )
+        self.last_run_finished = prometheus_client.Gauge(
+            'snapshot_run_last_finished_timestamp_seconds', 'Time the last snapshot run finished',
+            ['engine'], registry=registry
+        )
+
+    def observe_request(self, method, url, status_code, seconds):
+        """Observes one HTTP request; status_code is None for connection errors."""
+        endpoint = ContaboApiClient.get_endpoint(method, url)
+        self.request_duration.labels(endpoint, str(status_code or 'error')).observe(seconds)
+
+    def observe_retry(self, method, url, reason):
+        """Counts a retried request, with the status code or 'connection' as reason."""
+        self.retries.labels(ContaboApiClient.get_endpoint(method, url), str(reason)).inc()
+
+    def observe_token_request(self, grant_type, success):
+        """Counts an access token request."""
+        self.token_requests.labels(grant_type, 'success' if success else 'failure').inc()
+
+    def observe_run(self, engine, seconds, results):
+        """Observes a finished run (or shard) and counts its instances by result status."""
+        self.run_duration.labels(engine).observe(seconds)
+        self.last_run_duration.labels(engine).set(seconds)
+        self.last_run_finished.labels(engine).set_to_current_time()
+        for result in results:
+            self.instances.labels(result.get('status', 'unknown')).inc()
+
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+def get_metrics():
+    """
+    Returns the process-wide SnapshotMetrics, or None if prometheus_client is not installed
+    or SNAPSHOT_METRICS is disabled.
+    """
+    global _metrics
+    if prometheus_client is None or os.getenv('SNAPSHOT_METRICS', 'true').lower() not in ('true', '1', 't'):
+        return None
+    with _metrics_lock:
+        if _metrics is None:
+            _metrics = SnapshotMetrics()
+        return _metrics
+
+
+# Context of the current log records; contextvars follow asyncio tasks and asyncio.to_thread
+log_instance_id = contextvars.ContextVar('log_instance_id', default=None)
+log_request_id = contextvars.ContextVar('log_request_id', default=None)
+
+LOG_CONTEXT_FIELDS = ('account', 'run_id', 'instance_id', 'request_id')
+TEXT_LOG_FORMAT = '%(asctime)s - %(levelname)s - [%(filename)s:%(lineno)d - %(funcName)s()] - %(message)s'
+
+
+@contextmanager
+def log_instance(instance_id):
+    """
+    Tags the log records emitted inside the block with instance_id.
+    """
+    token = log_instance_id.set(instance_id)
+    try:
+        yield
+    finally:
+        log_instance_id.reset(token)
+
+
+@contextmanager
+def log_request(request_id):
+    """
+    Tags the log records emitted inside the block with request_id.
+    """
+    token = log_request_id.set(request_id)
+    try:
+        yield
+    finally:
+        log_request_id.reset(token)
+
+
+class JsonLogFormatter(logging.Formatter):
+    """
+    Formats log records as one JSON object per line, including the account, run_id,
+    instance_id and request_id of SnapshotLogAdapter records. Used with LOG_FORMAT=json.
+    """
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, pytz.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'module': record.module,
+            'function': record.funcName,
+            'line': record.lineno,
+            'thread': record.threadName,
+            'process': record.process,
+        }
+        for field in LOG_CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        if record.stack_info:
+            entry['stack_info'] = self.formatStack(record.stack_info)
+        return json.dumps(entry, default=str)
+
+
+class SnapshotLogAdapter(logging.LoggerAdapter):
+    """
+    Logger of a snapshot manager. Adds the account and run_id of the manager and the current instance_id
+    and request_id to every record, and keeps the DEBUG records of only a sample of the instances.
+    """
+
+    def __init__(self, logger, manager, debug_sample_rate=1.0):
+        """
+        Parameters:
+            logger (logging.Logger): The logger the records are passed to.
+            manager (ContaboSnapshotManager): The manager whose run_id is added to the records.
+            debug_sample_rate (float): The share of instances whose DEBUG records are kept. Records
+                outside log_instance are not sampled.
+        """
+        super().__init__(logger, {})
+        self.snapshot_manager = manager
+        self.debug_sample_rate = debug_sample_rate
+
+    def is_sampled(self, instance_id):
+        """
+        Returns True if the DEBUG records of the instance are kept. The choice is stable per instance,
+        so a sampled instance keeps all of its lines.
+        """
+        return zlib.crc32(str(instance_id).encode()) % 10000 < self.debug_sample_rate * 10000
+
+    def isEnabledFor(self, level):
+        if level == logging.DEBUG and self.debug_sample_rate < 1:
+            instance_id = log_instance_id.get()
+            if instance_id is not None and not self.is_sampled(instance_id):
+                return False
+        return self.logger.isEnabledFor(level)
+
+    def process(self, msg, kwargs):
+        kwargs['extra'] = {
+            'account': self.snapshot_manager.account,
+            'run_id': self.snapshot_manager.run_id,
+            'instance_id': log_instance_id.get(),
+            'request_id': log_request_id.get(),
+            **(kwargs.get('extra') or {}),
+        }
+        return msg, kwargs
+
+
+_log_listener = None
+_log_listener_lock = threading.Lock()
+
+
+def restart_log_listener():
+    """
+    Starts a listener for the queued records in a forked child, whose copy of the listener thread does not run.
+    """
+    global _log_listener
+    if _log_listener is not None:
+        _log_listener = QueueListener(_log_listener.queue, *_log_listener.handlers, respect_handler_level=True)
+        _log_listener.start()
+
+
+def enable_queue_logging():
+    """
+    Moves the handlers of the root logger behind a QueueHandler, so a logging call only enqueues the
+    record and a QueueListener thread formats and writes it. The handlers keep their configuration
+    (e.g. from Django's LOGGING). Queued records are flushed at exit.
+
+    Returns:
+        QueueListener: The listener, or None if the root logger has no handlers.
+    """
+    global _log_listener
+    with _log_listener_lock:
+        if _log_listener is not None:
+            return _log_listener
+        root = logging.getLogger()
+        handlers = root.handlers[:]
+        if not handlers:
+            return None
+        log_queue = queue.SimpleQueue()
+        for handler in handlers:
+            root.removeHandler(handler)
+        root.addHandler(QueueHandler(log_queue))
+        _log_listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+        _log_listener.start()
+        atexit.register(lambda: _log_listener.stop())
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=restart_log_listener)
+        return _log_listener
+
+
+# The span the current thread or asyncio task is in, the parent of the spans it starts
+current_span = contextvars.ContextVar('current_span', default=None)
+
+
+class TraceSpan:
+    """
+    A span of a SnapshotTracer: a named, timed piece of a run such as a phase, an instance or an API call.
+    """
+
+    __slots__ = ('name', 'phase', 'span_id', 'parent', 'attributes', 'started', 'start_ns', 'seconds', 'error', 'otel_span')
+
+    def __init__(self, name, phase, parent, attributes, started=None):
+        self.name = name
+        self.phase = phase
+        self.span_id = os.urandom(8).hex()
+        self.parent = parent
+        self.attributes = attributes
+        self.started = time.monotonic() if started is None else started
+        self.start_ns = time.time_ns() - int((time.monotonic() - self.started) * 1e9)
+        self.seconds = None
+        self.error = None
+        self.otel_span = None
+
+    def elapsed(self):
+        """Returns the duration of the span, or the time since its start while it is running."""
+        return time.monotonic() - self.started if self.seconds is None else self.seconds
+
+    def to_otlp(self, trace_id):
+        """
+        Returns the span as an OTLP/JSON span object.
+
+        Parameters:
+            trace_id (str): The trace the span belongs to.
+
+        Returns:
+            dict: The span, as found in the scopeSpans of an OTLP/JSON export.
+        """
+        def to_value(value):
+            if isinstance(value, bool):
+                return {'boolValue': value}
+            if isinstance(value, int):
+                return {'intValue': str(value)}
+            if isinstance(value, float):
+                return {'doubleValue': value}
+            return {'stringValue': str(value)}
+
+        return {
+            'traceId': trace_id,
+            'spanId': self.span_id,
+            'parentSpanId': self.parent.span_id if self.parent is not None else '',
+            'name': self.name,
+            # SPAN_KIND_CLIENT for API calls, SPAN_KIND_INTERNAL otherwise
+            'kind': 3 if self.phase == 'api' else 1,
+            'startTimeUnixNano': str(self.start_ns),
+            'endTimeUnixNano': str(self.start_ns + int(self.elapsed() * 1e9)),
+            'attributes': [
+                {'key': key, 'value': to_value(value)}
+                for key, value in {'snapshot.phase': self.phase, **self.attributes}.items()
+            ],
+            'status': {'code': 2, 'message': str(self.error)} if self.error is not None else {'code': 0},
+        }
+
+
+class SnapshotTracer:
+    """
+    SnapshotTracer records spans around the phases of a run (auth, list, fetch, delete, create, checkpoint,
+    verify, retention, email), around each instance and each API call, and sums them up per phase.
+
+    Finished spans are appended to trace_file as OTLP/JSON span objects, one per line. When the
+    opentelemetry API is installed they are also mirrored to it, so an SDK configured by the
+    application exports them to a collector.
+    """
+
+    def __init__(self, trace_file=None, slowest=10, otel=True):
+        """
+        Parameters:
+            trace_file (str): JSONL file the finished spans are appended to, or None.
+            slowest (int): The number of slowest instances kept in the summary.
+            otel (bool): Mirror the spans to OpenTelemetry, if installed.
+        """
+        self.trace_id = os.urandom(16).hex()
+        self.trace_file = trace_file
+        self.slowest = slowest
+        self.otel_tracer = otel_trace.get_tracer(__name__) if otel and otel_trace is not None else None
+        self.lock = threading.Lock()
+        # phase -> [count, total seconds, max seconds]
+        self.phases = {}
+        self.instance_seconds = {}
+        self.pending = []
+        self.root = None
+
+    @classmethod
+    def from_env(cls):
+        """
+        Builds the tracer from SNAPSHOT_TRACE_FILE, SNAPSHOT_TRACE_SLOWEST and SNAPSHOT_TRACE_OTEL.
+        """
+        return cls(
+            trace_file=os.getenv('SNAPSHOT_TRACE_FILE') or None,
+            slowest=int(os.getenv('SNAPSHOT_TRACE_SLOWEST', 10)),
+            otel=os.getenv('SNAPSHOT_TRACE_OTEL', 'true').lower() in ('true', '1', 't'),
+        )
+
+    def start(self, name, phase=None, started=None, **attributes):
+        """
+        Starts a span. Its parent is the current span of the thread or task, or else the run span,
+        as worker threads do not inherit the context of the thread that started the run.
+
+        Parameters:
+            name (str): The name of the span.
+            phase (str): The phase the span is summed up in, defaults to name.
+            started (float): The time.monotonic() the span started at, defaults to now.
+            **attributes: The attributes of the span; the current instance_id is added.
+
+        Returns:
+            TraceSpan: The running span.
+        """
+        instance_id = log_instance_id.get()
+        if instance_id is not None:
+            attributes.setdefault('instance_id', instance_id)
+        parent = current_span.get() or self.root
+        span = TraceSpan(name, phase or name, parent, {key: value for key, value in attributes.items() if value is not None}, started)
+        if self.otel_tracer is not None:
+            context = None
+            if parent is not None and parent.otel_span is not None:
+                context = otel_trace.set_span_in_context(parent.otel_span)
+            span.otel_span = self.otel_tracer.start_span(name, context=context, attributes=span.attributes, start_time=span.start_ns)
+        return span
+
+    def end(self, span, error=None, seconds=None):
+        """
+        Ends a span and adds it to the phase totals.
+
+        Parameters:
+            span (TraceSpan): The span.
+            error (object): The exception or message the span failed with, if any.
+            seconds (float): The duration of the span, defaults to the time since its start.
+        """
+        span.seconds = span.elapsed() if seconds is None else seconds
+        span.error = error
+        if span.otel_span is not None:
+            if error is not None:
+                span.otel_span.set_status(otel_trace.Status(otel_trace.StatusCode.ERROR, str(error)))
+            span.otel_span.end(end_time=span.start_ns + int(span.seconds * 1e9))
+        with self.lock:
+            if span.phase == 'instance':
+                instance_id = span.attributes.get('instance_id')
+                self.instance_seconds[instance_id] = self.instance_seconds.get(instance_id, 0) + span.seconds
+            elif span.phase != 'run':
+                totals = self.phases.setdefault(span.phase, [0, 0.0, 0.0])
+                totals[0] += 1
+                totals[1] += span.seconds
+                totals[2] = max(totals[2], span.seconds)
+            if self.trace_file:
+                self.pending.append(span.to_otlp(self.trace_id))
+                if len(self.pending) >= 1000:
+                    self.write_pending()
+
+    @contextmanager
+    def span(self, name, phase=None, **attributes):
+        """
+        Runs the block inside a span, see start.
+        """
+        span = self.start(name, phase, **attributes)
+        token = current_span.set(span)
+        error = None
+        try:
+            yield span
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            current_span.reset(token)
+            self.end(span, error)
+
+    def start_run(self, **attributes):
+        """
+        Starts the run span, the root of the spans of this tracer.
+        """
+        self.root = None
+        self.root = self.start('snapshot_run', 'run', **attributes)
+        return self.root
+
+    def finish_run(self):
+        """
+        Ends the run span and writes the finished spans to the trace file.
+        """
+        if self.root is not None and self.root.seconds is None:
+            self.end(self.root)
+        self.flush()
+
+    def observe_request(self, method, url, status_code, seconds):
+        """
+        Records an API call as a finished span. Used as a request hook of ContaboApiClient.
+
+        status_code is None for connection errors and timeouts.
+        """
+        span = self.start(
+            ContaboApiClient.get_endpoint(method, url), 'api', started=time.monotonic() - seconds,
+            **{'http.request.method': method, 'http.response.status_code': status_code}
+        )
+        if status_code is None:
+            error = "connection error"
+        else:
+            error = f"HTTP {status_code}" if status_code >= 400 else None
+        self.end(span, error, seconds)
+
+    def write_pending(self):
+        """Appends the pending spans to the trace file. Callers hold the lock."""
+        spans, self.pending = self.pending, []
+        try:
+            with open(self.trace_file, 'a') as trace_file:
+                trace_file.writelines(json.dumps(span) + '\n' for span in spans)
+        except OSError as e:
+            logging.getLogger(__name__).warning("Failed to write spans to %s: %s", self.trace_file, e)
+
+    def flush(self):
+        """Writes the finished spans to the trace file, if any."""
+        with self.lock:
+            if self.pending:
+                self.write_pending()
+
+    def summary(self):
+        """
+        Returns the timing summary of the run: its wall time, the count, summed and maximum
+        duration of each phase (summed over concurrent workers, so totals can exceed the wall time)
+        and the slowest instances.
+
+        Returns:
+            dict: The summary, JSON serializable.
+        """
+        with self.lock:
+            phases = sorted(self.phases.items(), key=lambda item: item[1][1], reverse=True)
+            slowest = heapq.nlargest(self.slowest, self.instance_seconds.items(), key=lambda item: item[1])
+        return {
+            'trace_id': self.trace_id,
+            'wall_seconds': round(self.root.elapsed(), 3) if self.root is not None else None,
+            'phases': {
+                phase: {'count': count, 'total_seconds': round(total, 3), 'max_seconds': round(longest, 3)}
+                for phase, (count, total, longest) in phases
+            },
+            'slowest_instances': [{'id': instance_id, 'seconds': round(seconds, 3)} for instance_id, seconds in slowest],
+        }
+
+
+def traced(phase):
+    """
+    Runs the decorated ContaboSnapshotManager method or coroutine inside a span of the manager's tracer.
+    """
+    def decorator(method):
+        if asyncio.iscoroutinefunction(method):
+            @functools.wraps(method)
+            async def wrapper(self, *args, **kwargs):
+                with self.tracer.span(phase):
+                    return await method(self, *args, **kwargs)
+        else:
+            @functools.wraps(method)
+            def wrapper(self, *args, **kwargs):
+                with self.tracer.span(phase):
+                    return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# Path segments of the Contabo API that carry an ID, with their template in ContaboApiClient.get_endpoint
+ENDPOINT_ID_PATTERNS = (
+    (re.compile(r'/instances/[^/]+'), '/instances/{instanceId}'),
+    (re.compile(r'/snapshots/[^/]+'), '/snapshots/{snapshotId}'),
+    (re.compile(r'/tags/[^/]+'), '/tags/{tagId}'),
+)
+
+
+class ContaboApiClient:
+    """
+    ContaboApiClient owns a pooled, keep-alive requests.Session shared by every Contabo API call.
+
+    Reusing the session keeps TCP/TLS connections to auth.contabo.com and api.contabo.com open
+    between calls, applies a default timeout and sends the shared default headers. Every call
+    passes through the shared RateLimiter and is retried according to the RetryPolicy.
+    """
+
+    def __init__(self, pool_size=10, timeout=30, headers=None, rate_limiter=None, retry_policy=None, logger=None):
+        """
+        Initializes the ContaboApiClient with its connection pool.
+
+        The token_provider attribute is assigned once the ContaboTokenProvider exists; until then
+        requests are sent without an Authorization header.
+
+        Parameters:
+            pool_size (int): Maximum number of pooled connections kept open per host.
+            timeout (float): Default timeout in seconds for every request.
+            headers (dict): Extra default headers sent with every request.
+            rate_limiter (RateLimiter): Limits the request rate. None disables rate limiting.
+            retry_policy (RetryPolicy): Decides which failed calls are retried. None disables retries.
+            logger (logging.Logger): The logger to report retries to.
+        """
+        self.timeout = timeout
+        self.token_provider = None
+        self.rate_limiter = rate_limiter
+        self.retry_policy = retry_policy or RetryPolicy(max_retries=0)
+        self.logger = logger or logging.getLogger(__name__)
+        # Number of HTTP requests sent (including retries) and the seconds spent waiting for their responses
+        self.request_count = 0
+        self.request_seconds = 0.0
+        self.stats_lock = threading.Lock()
+        # Callables hook(method, url, status_code, seconds) run after every request; status_code is None on connection errors
+        self.request_hooks = []
+        # SnapshotMetrics observing every request and retry, if any
+        self.metrics = None
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({'Content-Type': 'application/json'})
+        if headers:
+            self.session.headers.update(headers)
+
+    def request(self, method, url, authenticate=True, **kwargs):
+        """
+        Sends a request through the pooled session.
+
+        Authenticated requests carry the cached bearer token. If the API answers 401 the token
+        is refreshed and the request is retried once. Throttled (429), transient (5xx) and
+        connection failures are retried with backoff according to the retry policy.
+
+        Parameters:
+            method (str): The HTTP method.
+            url (str): The absolute URL to call.
+            authenticate (bool): Whether to send the bearer token of the token provider.
+            **kwargs: Passed through to requests.Session.request.
+
+        Returns:
+            requests.Response: The response of the API.
+
+        Raises:
+            requests.exceptions.RequestException: If the call still fails after all retries.
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        headers = dict(kwargs.pop('headers', None) or {})
+        token_refreshed = False
+        attempt = 0
+        while True:
+            access_token = None
+            if authenticate and self.token_provider is not None:
+                access_token = self.token_provider.get_token()
+                headers['Authorization'] = f'Bearer {access_token}'
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+
+            started = time.monotonic()
+            try:
+                response = self.session.request(method, url, headers=headers, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                self.record_request(method, url, None, started)
+                if not self.retry_policy.should_retry(method, attempt):
+                    raise
+                delay = self.retry_policy.get_delay(attempt)
+                attempt += 1
+                self.logger.warning("%s %s failed: %s. Retry %d/%d in %.2fs", method, url, e, attempt, self.retry_policy.max_retries, delay)
+                if self.metrics is not None:
+                    self.metrics.observe_retry(method, url, 'connection')
+                time.sleep(delay)
+                continue
+            self.record_request(method, url, response.status_code, started)
+
+            if response.status_code == 401 and access_token is not None and not token_refreshed:
+                token_refreshed = True
+                self.token_provider.invalidate(access_token)
+                continue
+
+            if self.retry_policy.should_retry(method, attempt, response.status_code):
+                delay = self.retry_policy.get_delay(attempt, response)
+                if response.status_code == 429 and self.rate_limiter is not None:
+                    self.rate_limiter.throttle(delay)
+                attempt += 1
+                self.logger.warning("%s %s returned %s. Retry %d/%d in %.2fs", method, url, response.status_code, attempt, self.retry_policy.max_retries, delay)
+                if self.metrics is not None:
+                    self.metrics.observe_retry(method, url, response.status_code)
+                time.sleep(delay)
+                continue
+
+            if self.rate_limiter is not None and response.status_code != 429:
+                self.rate_limiter.recover()
+            return response
+
+    @staticmethod
+    def get_endpoint(method, url):
+        """
+        Returns the endpoint of a request with the IDs replaced, e.g. "GET /v1/compute/instances/{instanceId}/snapshots".
+
+        Parameters:
+            method (str): The HTTP method.
+            url (str): The absolute URL of the request.
+
+        Returns:
+            str: The method and path template.
+        """
+        path = requests.utils.urlparse(url).path
+        if path.endswith('/protocol/openid-connect/token'):
+            return f"{method} /token"
+        for pattern, template in ENDPOINT_ID_PATTERNS:
+            path = pattern.sub(template, path)
+        return f"{method} {path}"
+
+    def record_request(self, method, url, status_code, started):
+        """Counts a sent request and the time since it was started, and runs the request hooks."""
+        seconds = time.monotonic() - started
+        with self.stats_lock:
+            self.request_count += 1
+            self.request_seconds += seconds
+        observers = self.request_hooks if self.metrics is None else [self.metrics.observe_request, *self.request_hooks]
+        for observer in observers:
+            try:
+                observer(method, url, status_code, seconds)
+            except Exception as e:
+                # An observer must never break the request it observes
+                self.logger.warning("Request hook %r failed: %s", observer, e)
+
+    def get(self, url, **kwargs):
+        """Sends a GET request through the pooled session."""
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        """Sends a POST request through the pooled session."""
+        return self.request('POST', url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        """Sends a DELETE request through the pooled session."""
+        return self.request('DELETE', url, **kwargs)
+
+    def close(self):
+        """Closes the session and every pooled connection."""
+        self.session.close()
+
+
+class ContaboTokenProvider:
+    """
+    ContaboTokenProvider caches the OAuth 2.0 access token of a Contabo API user.
+
+    The token is kept in memory and, when a cache is given (e.g. the Django cache), shared across
+    django-q task invocations. It is refreshed shortly before it expires, using the refresh token
+    when that is still valid and the password grant otherwise.
+    """
+
+    def __init__(self, api_client, auth_url, client_id, client_secret, api_user, api_password,
+                 cache=None, refresh_margin=60, logger=None):
+        """
+        Initializes the ContaboTokenProvider.
+
+        Parameters:
+            api_client (ContaboApiClient): The client used to call the auth endpoint.
+            auth_url (str): The OpenID Connect token endpoint.
+            client_id (str): The OAuth client ID.
+            client_secret (str): The OAuth client secret.
+            api_user (str): The API user name.
+            api_password (str): The API user password.
+            cache (object): Optional cache with get, set and delete, such as django.core.cache.cache.
+            refresh_margin (int): Seconds before expiry at which the token is refreshed.
+            logger (logging.Logger): The logger to report to.
+        """
+        self.api_client = api_client
+        self.auth_url = auth_url
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.api_user = api_user
+        self.api_password = api_password
+        self.cache = cache
+        self.refresh_margin = refresh_margin
+        self.logger = logger or logging.getLogger(__name__)
+        self.cache_key = 'contabo-token-' + hashlib.sha256(f"{client_id}:{api_user}".encode()).hexdigest()[:32]
+        # SnapshotMetrics counting the token requests and SnapshotTracer timing them, if any
+        self.metrics = None
+        self.tracer = None
+        self.token = None
+        self.lock = threading.Lock()
+
+    def is_valid(self, token, key='expires_at'):
+        """
+        Checks whether a cached token is still usable for at least refresh_margin seconds.
+
+        Parameters:
+            token (dict): The cached token data.
+            key (str): The expiry field to check ('expires_at' or 'refresh_expires_at').
+
+        Returns:
+            bool: True if the token can be used.
+        """
+        return bool(token) and token.get(key, 0) - self.refresh_margin > time.time()
+
+    def invalidate(self, access_token):
+        """
+        Marks an access token as rejected (e.g. after a 401) so the next get_token call refreshes it.
+
+        Tokens that were already replaced by another thread are ignored, so concurrent 401s
+        trigger a single refresh.
+
+        Parameters:
+            access_token (str): The access token the API rejected.
+        """
+        with self.lock:
+            if self.token and self.token['access_token'] == access_token:
+                self.logger.info("Access token rejected, refreshing...")
+                self.token['expires_at'] = 0
+                if self.cache is not None:
+                    self.cache.delete(self.cache_key)
+
+    def cached_token(self):
+        """
+        Returns the in-memory access token if it is still valid, without ever calling the auth endpoint.
+
+        Returns:
+            str: The access token, or None if it must be (re)acquired with get_token.
+        """
+        with self.lock:
+            if self.is_valid(self.token):
+                return self.token['access_token']
+            return None
+
+    def get_token(self):
+        """
+        Returns a valid access token, authenticating only when needed.
+
+        Returns:
+            str: The access token, or None if authentication failed.
+        """
+        with self.lock:
+            if self.is_valid(self.token):
+                return self.token['access_token']
+            if self.cache is not None:
+                cached_token = self.cache.get(self.cache_key)
+                if cached_token and (self.token is None or cached_token['expires_at'] > self.token['expires_at']):
+                    # Another task stored a newer token (or a refresh token we can still use)
+                    self.token = cached_token
+                    if self.is_valid(self.token):
+                        self.logger.info("Using cached access token.")
+                        return self.token['access_token']
+
+            token = None
+            if self.is_valid(self.token, 'refresh_expires_at'):
+                token = self.request_token({
+                    'grant_type': 'refresh_token',
+                    'refresh_token': self.token['refresh_token']
+                })
+            if token is None:
+                token = self.request_token({
+                    'grant_type': 'password',
+                    'username': self.api_user,
+                    'password': self.api_password
+                })
+            if token is None:
+                return None
+
+            self.token = token
+            if self.cache is not None:
+                expires_at = max(token['expires_at'], token['refresh_expires_at'])
+                self.cache.set(self.cache_key, token, max(1, int(expires_at - time.time())))
+            return token['access_token']
+
+    def request_token(self, grant):
+        """
+        Requests a new token from Contabo's OAuth 2.0 service.
+
+        Parameters:
+            grant (dict): The grant specific form fields.
+
+        Returns:
+            dict: The token data with absolute expiry times, or None if the request failed.
+        """
+        if self.tracer is None:
+            token = self.send_token_request(grant)
+        else:
+            with self.tracer.span('auth', grant=grant['grant_type']):
+                token = self.send_token_request(grant)
+        if self.metrics is not None:
+            self.metrics.observe_token_request(grant['grant_type'], token is not None)
+        return token
+
+    def send_token_request(self, grant):
+        """Sends the token request of request_token and parses the response."""
+        self.logger.info(f"Requesting access token using {grant['grant_type']} grant...")
+        data = {'client_id': self.client_id, 'client_secret': self.client_secret, **grant}
+        headers = {'Content-Type': 'application/x-www-form-urlencoded'}
+        try:
+            response = self.api_client.post(self.auth_url, data=data, headers=headers, authenticate=False)
+        except requests.exceptions.RequestException as e:
+            self.logger.error(f"Error: Failed to get access token. Error: {e}")
+            return None
+
+        if response.status_code != 200:
+            self.logger.error(f"Error: Failed to get access token. Response: {response.text}")
+            return None
+
+        response_json = response.json()
+        access_token = response_json.get('access_token')
+        if not access_token:
+            self.logger.error(f"Failed to get access token. Response: {response.text}")
+            return None
+
+        self.logger.info(f"Access token acquired successfully: {access_token[:10]}...")  # Log only part of the token
+        now = time.time()
+        return {
+            'access_token': access_token,
+            'expires_at': now + response_json.get('expires_in', 300),
+            'refresh_token': response_json.get('refresh_token'),
+            'refresh_expires_at': now + response_json.get('refresh_expires_in', 0) if response_json.get('refresh_token') else 0
+        }
+
+
+class SnapshotInventory:
+    """
+    SnapshotInventory is an in-memory index of the snapshots of many instances.
+
+    Snapshots are keyed by instanceId and kept sorted by their parsed createdDate (oldest first),
+    so the oldest, the newest and the count of an instance's snapshots are O(1) lookups. The index
+    is updated as snapshots are created and deleted, so rotation, reporting and retention decisions
+    can read from it instead of calling the API again.
+    """
+
+    def __init__(self):
+        self.snapshots = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def parse_created_date(snapshot):
+        """
+        Parses the createdDate of a snapshot, e.g. "2024-01-01T00:00:00.000Z".
+
+        Parameters:
+            snapshot (dict): The snapshot, as returned by the API.
+
+        Returns:
+            datetime: The timezone-aware creation date, or None if it is missing or invalid.
+        """
+        value = snapshot.get('createdDate')
+        if not value:
+            return None
+        try:
+            created_date = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except (TypeError, ValueError):
+            return None
+        return created_date if created_date.tzinfo else pytz.utc.localize(created_date)
+
+    @staticmethod
+    def sort(snapshots):
+        """Returns the snapshots sorted oldest first; snapshots without a valid date come first."""
+        minimum = datetime.min.replace(tzinfo=pytz.utc)
+        return sorted(snapshots, key=lambda snapshot: SnapshotInventory.parse_created_date(snapshot) or minimum)
+
+    def set(self, instance_id, snapshots):
+        """
+        Stores the complete snapshot list of an instance.
+
+        Parameters:
+            instance_id (str): The unique identifier of the instance.
+            snapshots (list): All snapshots of the instance.
+        """
+        snapshots = self.sort(snapshots)
+        with self.lock:
+            self.snapshots[str(instance_id)] = snapshots
+
+    def add(self, instance_id, snapshot):
+        """
+        Adds a newly created snapshot to an instance already in the index.
+
+        Parameters:
+            instance_id (str): The unique identifier of the instance.
+            snapshot (dict): The created snapshot.
+        """
+        with self.lock:
+            if str(instance_id) in self.snapshots:
+                self.snapshots[str(instance_id)] = self.sort(self.snapshots[str(instance_id)] + [snapshot])
+
+    def remove(self, instance_id, snapshot_id):
+        """
+        Removes a deleted snapshot from the index.
+
+        Parameters:
+            instance_id (str): The unique identifier of the instance.
+            snapshot_id (str): The unique identifier of the deleted snapshot.
+        """
+        with self.lock:
+            if str(instance_id) in self.snapshots:
+                self.snapshots[str(instance_id)] = [
+                    snapshot for snapshot in self.snapshots[str(instance_id)] if snapshot.get('snapshotId') != snapshot_id
+                ]
+
+    def discard(self, instance_id):
+        """Forgets an instance, so its snapshots are fetched again on the next lookup."""
+        with self.lock:
+            self.snapshots.pop(str(instance_id), None)
+
+    def has(self, instance_id):
+        """Returns True if the snapshots of the instance are in the index."""
+        return str(instance_id) in self.snapshots
+
+    def get(self, instance_id):
+        """Returns the snapshots of an instance, oldest first (empty if unknown)."""
+        return list(self.snapshots.get(str(instance_id), []))
+
+    def count(self, instance_id):
+        """Returns the number of snapshots of an instance."""
+        return len(self.snapshots.get(str(instance_id), []))
+
+    def oldest(self, instance_id):
+        """Returns the oldest snapshot of an instance, or None."""
+        snapshots = self.snapshots.get(str(instance_id))
+        return snapshots[0] if snapshots else None
+
+    def newest(self, instance_id):
+        """Returns the newest snapshot of an instance, or None."""
+        snapshots = self.snapshots.get(str(instance_id))
+        return snapshots[-1] if snapshots else None
+
+    def instance_ids(self):
+        """Returns the instanceIds in the index."""
+        return list(self.snapshots)
+
+    def __len__(self):
+        return len(self.snapshots)
+
+
+class InstanceFilter:
+    """
+    InstanceFilter decides which instances of the listing are managed, before any per-instance API call.
+
+    Rules are given per instance field: instanceId, displayName, region, status, productId and tags.
+    An instance is included if it matches every field of the include rules (any value of a field
+    matches) and none of the exclude rules. displayName values are globs, or regular expressions
+    when prefixed with "re:". The other fields are compared case-insensitively. The rules are
+    compiled once, so matching an instance does not depend on the number of rules.
+
+    Contabo does not return tags with the instances; the instanceIds of every tag used in the rules
+    are set once per run with set_tagged_instances.
+    """
+
+    FIELDS = ('instanceId', 'displayName', 'region', 'status', 'productId', 'tags')
+
+    def __init__(self, include=None, exclude=None):
+        """
+        Compiles the include and exclude rules.
+
+        Parameters:
+            include (dict): Values per field the instances must match, e.g. {"status": ["running"]}.
+            exclude (dict): Values per field the instances must not match, e.g. {"displayName": ["test-*"]}.
+
+        Raises:
+            ValueError: If a rule uses an unknown field or an invalid regular expression.
+        """
+        self.include = self.compile_rules(include or {})
+        self.exclude = self.compile_rules(exclude or {})
+        self.tagged_instances = None
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Creates an InstanceFilter from a dict or JSON string with 'include' and 'exclude' rules.
+
+        Parameters:
+            config (dict or str): The rules, e.g. '{"exclude": {"status": ["stopped"]}}'.
+
+        Returns:
+            InstanceFilter: The compiled filter.
+
+        Raises:
+            ValueError: If the configuration is not valid.
+        """
+        if isinstance(config, str):
+            config = json.loads(config) if config.strip() else {}
+        if not isinstance(config, dict):
+            raise ValueError("Instance filters must be a JSON object with 'include' and 'exclude' rules")
+        return cls(config.get('include'), config.get('exclude'))
+
+    def compile_rules(self, rules):
+        """
+        Compiles the values of each field into a set of exact values or a single regular expression.
+
+        Parameters:
+            rules (dict): Values per field; a single value may be given instead of a list.
+
+        Returns:
+            dict: Per field, a frozenset of lowercase values or a compiled pattern for displayName.
+        """
+        compiled = {}
+        for field, values in rules.items():
+            if field not in self.FIELDS:
+                raise ValueError(f"Unknown instance filter field: {field}")
+            if isinstance(values, (str, int)):
+                values = [values]
+            values = [str(value) for value in values]
+            if not values:
+                continue
+            if field == 'displayName':
+                patterns = [value[3:] if value.startswith('re:') else fnmatch.translate(value) for value in values]
+                compiled[field] = re.compile('|'.join(f"(?:{pattern})" for pattern in patterns))
+            else:
+                compiled[field] = frozenset(value.lower() for value in values)
+        return compiled
+
+    @property
+    def tags(self):
+        """The lowercase tag names used in the rules."""
+        return self.include.get('tags', frozenset()) | self.exclude.get('tags', frozenset())
+
+    @property
+    def is_empty(self):
+        """True if the filter has no rules and includes every instance."""
+        return not self.include and not self.exclude
+
+    def set_tagged_instances(self, tagged_instances):
+        """
+        Sets the instances of each tag used in the rules.
+
+        Parameters:
+            tagged_instances (dict): The instanceIds (as strings) of each tag, keyed by lowercase tag name.
+        """
+        self.tagged_instances = {tag.lower(): set(map(str, instance_ids)) for tag, instance_ids in tagged_instances.items()}
+
+    def matches_field(self, instance, field, rule):
+        if field == 'displayName':
+            return rule.match(instance.get('displayName') or '') is not None
+        if field == 'tags':
+            instance_id = str(instance.get('instanceId'))
+            return any(instance_id in (self.tagged_instances or {}).get(tag, ()) for tag in rule)
+        return str(instance.get(field, '')).lower() in rule
+
+    def matches(self, instance):
+        """
+        Checks an instance against the rules.
+
+        Parameters:
+            instance (dict): The instance, as returned by list_instances.
+
+        Returns:
+            bool: True if the instance is selected.
+        """
+        if not all(self.matches_field(instance, field, rule) for field, rule in self.include.items()):
+            return False
+        return not any(self.matches_field(instance, field, rule) for field, rule in self.exclude.items())
+
+
+class RetentionPolicy:
+    """
+    RetentionPolicy decides which snapshots of an instance to keep, grandfather-father-son style.
+
+    The newest snapshot of each of the last `hourly` hours, `daily` days and `weekly` ISO weeks
+    is kept. Without any tier every snapshot is kept by the tiers. Snapshots older than max_age
+    seconds are deleted even if a tier would keep them, except the newest one, so an instance
+    always keeps at least one snapshot. Snapshots whose name matches one of the pinned globs,
+    and snapshots without a valid createdDate, are never deleted.
+    """
+
+    TIERS = (
+        ('hourly', '%Y-%m-%d %H'),
+        ('daily', '%Y-%m-%d'),
+        ('weekly', '%G-W%V'),
+    )
+
+    def __init__(self, hourly=0, daily=0, weekly=0, max_age=0, pinned=None):
+        """
+        Initializes the policy.
+
+        Parameters:
+            hourly (int): The number of hours to keep a snapshot of.
+            daily (int): The number of days to keep a snapshot of.
+            weekly (int): The number of weeks to keep a snapshot of.
+            max_age (int): The maximum age of a snapshot in seconds (0 = no maximum).
+            pinned (list): Name globs of snapshots that are always kept.
+        """
+        self.counts = {'hourly': hourly, 'daily': daily, 'weekly': weekly}
+        self.max_age = max_age
+        self.pinned = list(pinned or [])
+        self.pinned_pattern = re.compile('|'.join(f"(?:{fnmatch.translate(glob)})" for glob in self.pinned)) if self.pinned else None
+
+    @classmethod
+    def from_env(cls):
+        """
+        Creates the policy from SNAPSHOT_KEEP_HOURLY, SNAPSHOT_KEEP_DAILY, SNAPSHOT_KEEP_WEEKLY,
+        SNAPSHOT_MAX_AGE and SNAPSHOT_PINNED (comma separated name globs).
+
+        Returns:
+            RetentionPolicy: The policy, or None if none of the variables is set.
+        """
+        policy = cls(
+            hourly=int(os.getenv('SNAPSHOT_KEEP_HOURLY', 0)),
+            daily=int(os.getenv('SNAPSHOT_KEEP_DAILY', 0)),
+            weekly=int(os.getenv('SNAPSHOT_KEEP_WEEKLY', 0)),
+            max_age=int(os.getenv('SNAPSHOT_MAX_AGE', 0)),
+            pinned=[glob.strip() for glob in os.getenv('SNAPSHOT_PINNED', '').split(',') if glob.strip()]
+        )
+        return policy if policy.is_enabled else None
+
+    @property
+    def is_enabled(self):
+        """True if the policy can delete anything, i.e. a tier or max_age is set."""
+        return any(self.counts.values()) or self.max_age > 0
+
+    def is_pinned(self, snapshot):
+        """Returns True if the snapshot must always be kept."""
+        return self.pinned_pattern is not None and self.pinned_pattern.match(snapshot.get('name') or '') is not None
+
+    def plan(self, snapshots, now, timezone=pytz.utc):
+        """
+        Splits the snapshots of an instance into the ones to keep and the ones to delete.
+
+        Parameters:
+            snapshots (list): The snapshots of the instance.
+            now (datetime): The timezone-aware current time.
+            timezone (tzinfo): The timezone of the hour, day and week boundaries.
+
+        Returns:
+            tuple: The snapshots to keep and the snapshots to delete, both oldest first.
+        """
+        dated = []
+        keep_ids = set()
+        for snapshot in snapshots:
+            created_date = SnapshotInventory.parse_created_date(snapshot)
+            if created_date is None or self.is_pinned(snapshot):
+                keep_ids.add(id(snapshot))
+            else:
+                dated.append((created_date.astimezone(timezone), snapshot))
+        dated.sort(key=lambda entry: entry[0], reverse=True)
+
+        if any(self.counts.values()):
+            for tier, bucket_format in self.TIERS:
+                buckets = set()
+                for created_date, snapshot in dated:
+                    if len(buckets) >= self.counts[tier]:
+                        break
+                    bucket = created_date.strftime(bucket_format)
+                    if bucket not in buckets:
+                        buckets.add(bucket)
+                        keep_ids.add(id(snapshot))
+        else:
+            keep_ids.update(id(snapshot) for _, snapshot in dated)
+
+        if self.max_age > 0:
+            expired = {id(snapshot) for created_date, snapshot in dated if (now - created_date).total_seconds() > self.max_age}
+            keep_ids -= expired
+            if dated:
+                # Never delete every backup of an instance, however old the newest one is
+                keep_ids.add(id(dated[0][1]))
+
+        ordered = SnapshotInventory.sort(snapshots)
+        return ([snapshot for snapshot in ordered if id(snapshot) in keep_ids],
+                [snapshot for snapshot in ordered if id(snapshot) not in keep_ids])
+
+
+class PipelineStage:
+    """
+    PipelineStage is one step of a SnapshotPipeline, run by its own pool of worker threads.
+
+    The stage function receives a work item and returns the item to pass on, or None to drop it.
+    The stage also counts the items it handled and the time its workers were busy.
+    """
+
+    def __init__(self, name, function, workers=1):
+        """
+        Initializes the PipelineStage.
+
+        Parameters:
+            name (str): The name used in logs and statistics.
+            function (callable): Called with each work item; returns the item to forward or None.
+            workers (int): Number of worker threads of this stage.
+        """
+        self.name = name
+        self.function = function
+        self.workers = max(1, workers)
+        self.processed = 0
+        self.dropped = 0
+        self.errors = 0
+        self.busy_seconds = 0.0
+        self.started_at = None
+        self.finished_at = None
+        self.lock = threading.Lock()
+
+    def get_stats(self):
+        """
+        Returns the statistics of the stage.
+
+        Returns:
+            dict: Items processed, dropped and failed, wall and busy seconds and throughput (items/s).
+        """
+        wall_seconds = (self.finished_at or time.monotonic()) - (self.started_at or time.monotonic())
+        return {
+            'stage': self.name,
+            'workers': self.workers,
+            'processed': self.processed,
+            'dropped': self.dropped,
+            'errors': self.errors,
+            'wall_seconds': round(wall_seconds, 3),
+            'busy_seconds': round(self.busy_seconds, 3),
+            'throughput': round(self.processed / wall_seconds, 2) if wall_seconds > 0 else 0.0
+        }
+
+
+class SnapshotPipeline:
+    """
+    SnapshotPipeline connects a source and a chain of PipelineStages with bounded queues.
+
+    Every stage runs concurrently with the others, so discovery, rotation, creation and recording
+    overlap. The bounded queues apply back-pressure: a slow stage makes the stages before it wait
+    instead of buffering the whole fleet, which keeps memory flat regardless of fleet size.
+    """
+
+    SENTINEL = object()
+
+    def __init__(self, source, stages, queue_size=100, logger=None, on_error=None):
+        """
+        Initializes the SnapshotPipeline.
+
+        Parameters:
+            source (iterable): Produces the work items, e.g. a generator over the instance listing.
+            stages (list): The PipelineStages, in order.
+            queue_size (int): Capacity of the queue in front of every stage.
+            logger (logging.Logger): The logger to report to.
+            on_error (callable): Called with the item, the stage name and the exception when a stage
+                fails; the item it returns is handed to the last stage, so failed items are not lost.
+                Without it failed items are dropped.
+        """
+        self.source = source
+        self.stages = stages
+        self.on_error = on_error
+        self.queues = [queue.Queue(maxsize=max(1, queue_size)) for _ in stages]
+        self.logger = logger or logging.getLogger(__name__)
+        self.source_error = None
+
+    def produce(self):
+        """Feeds the source into the first queue, then signals the first stage to stop."""
+        try:
+            for item in self.source:
+                self.queues[0].put(item)
+        except Exception as e:
+            self.logger.error(f"Pipeline source failed: {e}")
+            self.source_error = e
+        finally:
+            for _ in range(self.stages[0].workers):
+                self.queues[0].put(self.SENTINEL)
+
+    def consume(self, index, remaining_workers):
+        """
+        Worker loop of stage `index`. The last worker to finish signals the next stage to stop.
+
+        Parameters:
+            index (int): The position of the stage.
+            remaining_workers (list): Single-element countdown of running workers of the stage, shared by them.
+        """
+        stage = self.stages[index]
+        inbox = self.queues[index]
+        outbox = self.queues[index + 1] if index + 1 < len(self.stages) else None
+        while True:
+            item = inbox.get()
+            if item is self.SENTINEL:
+                break
+            begin = time.monotonic()
+            try:
+                item = stage.function(item)
+            except Exception as e:
+                self.logger.error(f"Pipeline stage {stage.name} failed: {e}")
+                with stage.lock:
+                    stage.errors += 1
+                # The last stage only stops after this worker has finished, so it still takes the item
+                if self.on_error is not None and outbox is not None:
+                    self.queues[-1].put(self.on_error(item, stage.name, e))
+                continue
+            with stage.lock:
+                stage.busy_seconds += time.monotonic() - begin
+                stage.processed += 1
+                if item is None:
+                    stage.dropped += 1
+            if item is not None and outbox is not None:
+                outbox.put(item)
+
+        with stage.lock:
+            remaining_workers[0] -= 1
+            last_worker = remaining_workers[0] == 0
+            if last_worker:
+                stage.finished_at = time.monotonic()
+        if last_worker and outbox is not None:
+            for _ in range(self.stages[index + 1].workers):
+                outbox.put(self.SENTINEL)
+
+    def run(self):
+        """
+        Runs the pipeline until the source is exhausted and every stage has drained its queue.
+
+        Returns:
+            list: The statistics of every stage, see PipelineStage.get_stats.
+
+        Raises:
+            Exception: The error raised by the source, after everything it produced was processed.
+        """
+        threads = [threading.Thread(target=self.produce, name='pipeline-source', daemon=True)]
+        for index, stage in enumerate(self.stages):
+            stage.started_at = time.monotonic()
+            remaining_workers = [stage.workers]
+            for number in range(stage.workers):
+                threads.append(threading.Thread(
+                    target=self.consume, args=(index, remaining_workers),
+                    name=f'pipeline-{stage.name}-{number}', daemon=True
+                ))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        stats = [stage.get_stats() for stage in self.stages]
+        for stage_stats in stats:
+            self.logger.info(
+                f"Pipeline stage {stage_stats['stage']}: {stage_stats['processed']} items "
+                f"({stage_stats['dropped']} dropped, {stage_stats['errors']} errors) with {stage_stats['workers']} workers "
+                f"in {stage_stats['wall_seconds']}s, {stage_stats['throughput']} items/s"
+            )
+        if self.source_error is not None:
+            raise self.source_error
+        return stats
+
 
 class ContaboSnapshotManager:
     """
-    ContaboSnapshotManager is a class to manage snapshots for Contabo compute instances. 
-    It handles the creation, deletion, and management of snapshots across multiple instances.
+    ContaboSnapshotManager is a class to manage snapshots for Contabo compute instances. 
+    It handles the creation, deletion, and management of snapshots across multiple instances.
+    """
+
+    def __init__(self, credentials=None, account=None):
+        """
+        Initializes the ContaboSnapshotManager instance and retrieves an access token.
+        
+        The credentials for accessing the Contabo API are loaded from environment variables, unless given.
+        Docker environment variables take precedence over .env file variables.
+
+        Each manager has its own token cache entry, rate limiter, connection pool and results, so
+        managers of several Contabo accounts can run side by side.
+
+        Parameters:
+            credentials (dict): client_id, client_secret, api_user and api_password of the account;
+                missing ones are read from CLIENT_ID, CLIENT_SECRET, API_USER and API_PASSWORD.
+            account (str): The name of the account, added to the log records and reports.
+        """
+        # Load environment variables from .env file (as fallback)
+        # load_dotenv(override=False)  # Don't override existing environment variables
+
+        # Setup logging; run_id tags the log records of this run (the django-q task sets the Run's id)
+        self.run_id = uuid.uuid4().hex[:12]
+        self.account = account
+        self.logger = self.setup_logger()
+
+        # Set timezone from environment variable with fallback to Asia/Manila
+        timezone_name = os.getenv('TZ', 'Asia/Manila')
+        self.timezone = pytz.timezone(timezone_name)
+        self.logger.info(f"Timezone set to: {self.timezone} ({timezone_name})")
+
+        # Get environment variables (Docker env vars will take precedence)
+        credentials = credentials or {}
+        self.client_id = credentials.get('client_id') or os.getenv("CLIENT_ID")
+        self.api_user = credentials.get('api_user') or os.getenv("API_USER")
+        self.api_password = credentials.get('api_password') or os.getenv("API_PASSWORD")
+        self.client_secret = credentials.get('client_secret') or os.getenv("CLIENT_SECRET")
+        # Page size when listing instances and whether pages after the first are fetched concurrently
+        self.instances_per_page = max(1, int(os.getenv('CONTABO_PAGE_SIZE', 20)))
+        self.parallel_pages = os.getenv('CONTABO_PARALLEL_PAGES', 'true').lower() in ('true', '1', 't')
+        # Attempts per instances page before the listing is aborted (instead of truncated)
+        self.page_attempts = max(1, int(os.getenv('CONTABO_PAGE_ATTEMPTS', 3)))
+        # Maximum number of instances snapshotted concurrently (1 = sequential)
+        self.max_workers = max(1, int(os.getenv('SNAPSHOT_MAX_WORKERS', 8)))
+        # 'pool' runs list then create on a thread pool, 'pipeline' runs the staged SnapshotPipeline
+        self.run_mode = os.getenv('SNAPSHOT_RUN_MODE', 'pool').lower()
+        self.pipeline_workers = self.parse_pipeline_workers(os.getenv('SNAPSHOT_PIPELINE_WORKERS', ''))
+        self.pipeline_queue_size = int(os.getenv('SNAPSHOT_PIPELINE_QUEUE_SIZE', 100))
+        self.pipeline_stats = []
+        # Maximum number of snapshots per instance (0 = unknown, rely on the 402 response),
+        # optionally per productId, e.g. SNAPSHOT_PRODUCT_LIMITS="V45=2,V91=3"
+        self.snapshot_limit = int(os.getenv('SNAPSHOT_LIMIT', 0))
+        self.product_snapshot_limits = self.parse_product_limits(os.getenv('SNAPSHOT_PRODUCT_LIMITS', ''))
+        # Instances whose snapshots were already rotated ahead of the create in this run
+        self.rotated_instances = set()
+        # Index of the snapshots of every instance fetched in this run (may be seeded with known snapshots)
+        self.inventory = SnapshotInventory()
+        # Optional progress store with is_done(instance_id), record(result) and update(results), used to resume interrupted runs
+        self.checkpoint = None
+        # Send the summary report at the end of manage_snapshots; the django-q tasks unset it and queue the report instead
+        self.notify_inline = True
+        # Include/exclude rules applied to the listing, see InstanceFilter (may be replaced with rules from the DB)
+        self.instance_filter = InstanceFilter.from_config(os.getenv('SNAPSHOT_INSTANCE_FILTERS', ''))
+        self.instance_filter_lock = threading.Lock()
+        # Snapshots beyond the retention policy are deleted after the creates (None = only rotate for the quota)
+        self.retention_policy = RetentionPolicy.from_env()
+        # Retention deletes per parallel batch
+        self.retention_batch_size = int(os.getenv('SNAPSHOT_RETENTION_BATCH', 50))
+        # Only log the retention plan instead of deleting
+        self.retention_dry_run = os.getenv('SNAPSHOT_RETENTION_DRY_RUN', 'false').lower() in ('true', '1', 't')
+        # Poll the snapshot listings after the creates until the new snapshots are completed (or the deadline passes)
+        self.verify_snapshots_enabled = os.getenv('SNAPSHOT_VERIFY', 'false').lower() in ('true', '1', 't')
+        self.verify_timeout = float(os.getenv('SNAPSHOT_VERIFY_TIMEOUT', 120))
+        self.verify_interval = float(os.getenv('SNAPSHOT_VERIFY_INTERVAL', 30))
+        # Skip instances whose newest snapshot is younger than this many seconds (0 = snapshot every instance)
+        self.min_snapshot_age = int(os.getenv('SNAPSHOT_MIN_AGE', '0'))
+        # Fetch the snapshots of all instances up front, even when no snapshot limit is configured
+        self.prefetch_snapshots = os.getenv('SNAPSHOT_PREFETCH_INVENTORY', 'false').lower() in ('true', '1', 't')
+        # Endpoints of the Contabo API; point them at snapshots.fake_api to run offline
+        self.auth_url = os.getenv('CONTABO_AUTH_URL', "https://auth.contabo.com/auth/realms/contabo/protocol/openid-connect/token")
+        self.api_base_url = os.getenv('CONTABO_API_URL', "https://api.contabo.com").rstrip('/')
+        self.list_instances_url = self.api_base_url + "/v1/compute/instances?size={}".format(self.instances_per_page)
+        self.instances_page_url = self.api_base_url + "/v1/compute/instances?page={page}&size={size}"
+        self.list_snapshots_url = self.api_base_url + "/v1/compute/instances/{instance_id}/snapshots"
+        self.create_snapshot_url = self.api_base_url + "/v1/compute/instances/{instance_id}/snapshots"
+        self.tags_url = self.api_base_url + "/v1/tags"
+        self.tag_assignments_url = self.api_base_url + "/v1/tags/{tag_id}/assignments"
+        # Shared rate limit and retry behaviour for every API call
+        self.rate_limiter = RateLimiter(
+            rate=float(os.getenv('CONTABO_RATE_LIMIT', 10)),
+            burst=int(os.getenv('CONTABO_RATE_BURST', 20))
+        )
+        self.retry_policy = RetryPolicy(
+            max_retries=int(os.getenv('CONTABO_MAX_RETRIES', 4)),
+            backoff_base=float(os.getenv('CONTABO_BACKOFF_BASE', 0.5)),
+            backoff_max=float(os.getenv('CONTABO_BACKOFF_MAX', 60))
+        )
+        # Pooled HTTP client shared by all API calls; the listing threads and the worker threads run at the same time
+        self.api_client = ContaboApiClient(
+            pool_size=int(os.getenv('CONTABO_POOL_SIZE', max(10, 2 * self.max_workers))),
+            timeout=float(os.getenv('CONTABO_API_TIMEOUT', 30)),
+            rate_limiter=self.rate_limiter,
+            retry_policy=self.retry_policy,
+            logger=self.logger
+        )
+        self.token_provider = ContaboTokenProvider(
+            self.api_client, self.auth_url,
+            self.client_id, self.client_secret, self.api_user, self.api_password,
+            cache=self.get_token_cache(),
+            refresh_margin=int(os.getenv('CONTABO_TOKEN_REFRESH_MARGIN', 60)),
+            logger=self.logger
+        )
+        self.api_client.token_provider = self.token_provider
+        # Prometheus metrics of the API calls and runs (None without prometheus_client)
+        self.metrics = get_metrics()
+        self.api_client.metrics = self.metrics
+        self.token_provider.metrics = self.metrics
+        # Spans of the phases, instances and API calls, summed up in the timing summary of the run
+        self.tracer = SnapshotTracer.from_env()
+        self.token_provider.tracer = self.tracer
+        self.api_client.request_hooks.append(self.tracer.observe_request)
+        self.get_access_token()
+        self.logger.info("Initialized ContaboSnapshotManager.")
+        
+        # Initialize snapshot results tracking
+        self.snapshot_results = []
+
+    def get_current_time(self):
+        """
+        Gets the current time in the configured timezone (from TZ environment variable).
+        
+        Returns:
+            datetime: Current time in the configured timezone.
+        """
+        return datetime.now(self.timezone)
+
+    def setup_logger(self):
+        """
+        Returns the logger of the manager, a SnapshotLogAdapter over the root logger.
+
+        The handlers configured by the application (e.g. Django's LOGGING) are kept. Only if the root
+        logger has none, as when lib.py runs standalone, a stdout handler for Docker logging is added,
+        formatting JSON lines with LOG_FORMAT=json and the LOG_LEVEL level. With SNAPSHOT_LOG_QUEUE
+        (default true) the handlers run on a background thread, see enable_queue_logging.
+        SNAPSHOT_LOG_DEBUG_SAMPLE sets the share of instances whose DEBUG lines are kept.
+        """
+        root = logging.getLogger()
+        if not root.handlers:
+            stdout_handler = logging.StreamHandler(sys.stdout)
+            if os.getenv('LOG_FORMAT', 'text').lower() == 'json':
+                stdout_handler.setFormatter(JsonLogFormatter())
+            else:
+                stdout_handler.setFormatter(logging.Formatter(TEXT_LOG_FORMAT))
+            root.addHandler(stdout_handler)
+            root.setLevel(os.getenv('LOG_LEVEL', 'INFO').upper())
+
+        if os.getenv('SNAPSHOT_LOG_QUEUE', 'true').lower() in ('true', '1', 't'):
+            enable_queue_logging()
+
+        debug_sample_rate = min(1.0, max(0.0, float(os.getenv('SNAPSHOT_LOG_DEBUG_SAMPLE', 1))))
+        return SnapshotLogAdapter(root, self, debug_sample_rate)
+
+    def generate_request_id(self):
+        """
+        Generates a unique UUID to be used as a request identifier for API calls.
+
+        Log records are only tagged with it inside a log_request block.
+
+        Returns:
+            str: A generated UUID to be used as the request identifier.
+        """
+        return str(uuid.uuid4())
+
+    def parse_pipeline_workers(self, value):
+        """
+        Parses the per-stage worker counts of the pipeline, e.g. "filter=1,rotate=4,create=16".
+
+        Parameters:
+            value (str): Comma separated stage=workers pairs. Missing stages use the defaults.
+
+        Returns:
+            dict: The number of workers of each stage.
+        """
+        workers = {'filter': 1, 'rotate': max(1, self.max_workers // 2), 'create': self.max_workers, 'record': 1}
+        for pair in filter(None, (part.strip() for part in value.split(','))):
+            stage, _, count = pair.partition('=')
+            if stage.strip() in workers and count.strip().isdigit():
+                workers[stage.strip()] = max(1, int(count))
+            else:
+                self.logger.warning(f"Ignoring invalid SNAPSHOT_PIPELINE_WORKERS entry: {pair}")
+        # Recording appends to snapshot_results, keep it single-threaded
+        workers['record'] = 1
+        return workers
+
+    def parse_product_limits(self, value):
+        """
+        Parses the per-product snapshot limits, e.g. "V45=2,V91=3".
+
+        Parameters:
+            value (str): Comma separated productId=limit pairs.
+
+        Returns:
+            dict: The snapshot limit of each productId.
+        """
+        limits = {}
+        for pair in filter(None, (part.strip() for part in value.split(','))):
+            product_id, _, limit = pair.partition('=')
+            if product_id.strip() and limit.strip().isdigit():
+                limits[product_id.strip()] = int(limit)
+            else:
+                self.logger.warning(f"Ignoring invalid SNAPSHOT_PRODUCT_LIMITS entry: {pair}")
+        return limits
+
+    @property
+    def access_token(self):
+        """The current access token, refreshed by the token provider when it is about to expire."""
+        return self.token_provider.get_token()
+
+    def get_token_cache(self):
+        """
+        Returns the cache used to share the access token across django-q task invocations.
+
+        The Django cache is used when CONTABO_TOKEN_CACHE is set to 'django' and Django is configured;
+        otherwise the token is only cached in memory.
+
+        Returns:
+            object: The cache, or None.
+        """
+        if os.getenv('CONTABO_TOKEN_CACHE', 'memory').lower() != 'django':
+            return None
+        try:
+            from django.conf import settings
+            from django.core.cache import cache
+            if settings.configured:
+                return cache
+        except ImportError:
+            pass
+        self.logger.warning("CONTABO_TOKEN_CACHE=django but Django is not configured. Caching the token in memory only.")
+        return None
+
+    def get_access_token(self):
+        """
+        Retrieves an access token from Contabo's OAuth 2.0 service, reusing the cached one while it is valid.
+        
+        Returns:
+            str: The access token used for API authentication, or None if authentication failed.
+        """
+        return self.token_provider.get_token()
+
+    @traced('list')
+    def fetch_instances_page(self, url):
+        """
+        Fetches one page of the instance listing, retrying the page if it fails.
+
+        Parameters:
+            url (str): The URL of the page.
+
+        Returns:
+            dict: The decoded page, with 'data', '_pagination' and '_links'.
+
+        Raises:
+            ContaboApiError: If the page still fails after page_attempts attempts.
+        """
+        for attempt in range(self.page_attempts):
+            request_id = self.generate_request_id()
+            with log_request(request_id):
+                try:
+                    response = self.api_client.get(url, headers={'X-Request-ID': request_id})
+                    response.raise_for_status()
+                    return response.json()
+                except (requests.exceptions.RequestException, ValueError) as e:
+                    self.logger.error(f"Failed to list instances ({url}), attempt {attempt + 1}/{self.page_attempts}. Error: {e}")
+                if attempt + 1 < self.page_attempts:
+                    time.sleep(self.retry_policy.get_delay(attempt))
+        raise ContaboApiError(f"Failed to list instances: page {url} failed {self.page_attempts} times")
+
+    def iter_instances(self):
+        """
+        Yields all instances page by page, as the pages arrive.
+
+        The first page reports the total number of pages; with parallel_pages the remaining pages
+        are then fetched concurrently and yielded in page order, so the consumer can start working
+        on the first instances before the listing is complete. Without a page count (or with
+        parallel_pages disabled) the '_links.next' chain is followed one page after another.
+
+        Yields:
+            dict: The instances, in listing order.
+
+        Raises:
+            ContaboApiError: If a page keeps failing; the listing is never silently truncated.
+        """
+        self.logger.info("Requesting list of instances...")
+        size = self.instances_per_page
+        data = self.fetch_instances_page(self.instances_page_url.format(page=1, size=size))
+        self.logger.info(f"Fetched {len(data.get('data', []))} instances from page 1.")
+        yield from data.get('data', [])
+
+        total_pages = (data.get('_pagination') or {}).get('totalPages')
+        if not self.parallel_pages or not isinstance(total_pages, int):
+            while data.get('_links', {}).get('next'):
+                next_page_url = self.api_base_url + data['_links']['next']
+                data = self.fetch_instances_page(next_page_url)
+                self.logger.info(f"Fetched {len(data.get('data', []))} instances. Next page URL: {data.get('_links', {}).get('next')}")
+                yield from data.get('data', [])
+            return
+
+        if total_pages <= 1:
+            return
+        workers = min(self.max_workers, total_pages - 1)
+        self.logger.info(f"Fetching {total_pages - 1} more pages with {workers} workers")
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='list-instances') as executor:
+            futures = [
+                executor.submit(self.fetch_instances_page, self.instances_page_url.format(page=page, size=size))
+                for page in range(2, total_pages + 1)
+            ]
+            try:
+                for page, future in enumerate(futures, start=2):
+                    page_data = future.result()
+                    self.logger.info(f"Fetched {len(page_data.get('data', []))} instances from page {page}/{total_pages}.")
+                    yield from page_data.get('data', [])
+            finally:
+                for future in futures:
+                    future.cancel()
+
+    def list_instances(self):
+        """List all instances, handling pagination to get all instances."""
+        all_instances = list(self.iter_instances())
+        self.logger.info(f"Successfully fetched {len(all_instances)} instances.")
+
+        if self.logger.isEnabledFor(logging.DEBUG):
+            for instance in all_instances:
+                self.logger.debug("Instance %s (%s)", instance["instanceId"], instance["displayName"])
+        return all_instances
+
+    @traced('fetch')
+    def fetch_snapshots(self, instance_id):
+        """
+        Fetches all snapshots for a specific instance.
+
+        Parameters:
+            instance_id (str): The unique identifier of the instance for which snapshots will be fetched.
+
+        Returns:
+            list: A list of snapshots for the given instance.
+        """
+        self.logger.debug("Fetching snapshots for instance %s...", instance_id)
+
+        request_id = self.generate_request_id()
+        with log_request(request_id):
+            headers = {
+                'X-Request-ID': request_id
+            }
+            url = self.list_snapshots_url.format(instance_id=instance_id)
+            response = self.api_client.get(url, headers=headers)
+
+            if response.status_code == 200:
+                snapshots = response.json().get('data', [])
+                self.logger.debug("Fetched %d snapshots for instance %s.", len(snapshots), instance_id)
+                self.inventory.set(instance_id, snapshots)
+                return snapshots
+            else:
+                self.logger.error("Error: Failed to fetch snapshots for instance %s. Response: %s", instance_id, response.text)
+                return []
+
+    def get_instance_snapshots(self, instance_id):
+        """
+        Returns the snapshots of an instance from the inventory, fetching them only if they are not indexed yet.
+
+        Parameters:
+            instance_id (str): The unique identifier of the instance.
+
+        Returns:
+            list: The snapshots of the instance, oldest first.
+        """
+        if self.inventory.has(instance_id):
+            return self.inventory.get(instance_id)
+        self.fetch_snapshots(instance_id)
+        return self.inventory.get(instance_id)
+
+    def safe_fetch_snapshots(self, instance_id):
+        """
+        Runs fetch_snapshots, logging instead of raising errors.
+
+        An instance whose snapshots cannot be fetched stays out of the inventory, so callers treat
+        it as unknown, like an instance that was never fetched.
+
+        Parameters:
+            instance_id (str): The unique identifier of the instance.
+
+        Returns:
+            bool: False if the snapshots could not be fetched, even after the retries of the API client.
+        """
+        try:
+            self.fetch_snapshots(instance_id)
+            return True
+        except Exception as e:
+            self.logger.warning("Failed to fetch snapshots of instance %s: %s", instance_id, e)
+            return False
+
+    def prefetch_inventory(self, instances):
+        """
+        Fetches the snapshots of all given instances concurrently into the inventory.
+
+        Instances already in the inventory are not fetched again. An instance that cannot be
+        fetched is logged and left out, so one unreachable instance does not fail the run.
+
+        Parameters:
+            instances (list): The instances, as returned by list_instances.
+
+        Returns:
+            SnapshotInventory: The inventory.
+        """
+        instance_ids = [instance.get('instanceId') for instance in instances
+                        if instance.get('instanceId') and not self.inventory.has(instance.get('instanceId'))]
+        if instance_ids:
+            self.logger.info(f"Fetching snapshot inventory of {len(instance_ids)} instances")
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(instance_ids)), thread_name_prefix='inventory') as executor:
+                list(executor.map(self.safe_fetch_snapshots, instance_ids))
+            self.logger.info(f"Snapshot inventory holds {len(self.inventory)} instances")
+        return self.inventory
+
+    def find_oldest_snapshot(self, snapshots):
+        """
+        Finds the oldest snapshot based on the createdDate field.
+
+        Parameters:
+            snapshots (list): The list of snapshots to search through.
+
+        Returns:
+            dict: The oldest snapshot based on the 'createdDate' field.
+        """
+        dated_snapshots = [snapshot for snapshot in snapshots if SnapshotInventory.parse_created_date(snapshot)]
+        oldest_snapshot = min(dated_snapshots, key=SnapshotInventory.parse_created_date, default=None)
+        self.logger.debug("Oldest snapshot is %s", oldest_snapshot)
+        return oldest_snapshot
+
+    @traced('delete')
+    def delete_snapshot(self, instance_id, snapshot_id):
+        """
+        Deletes a specific snapshot for an instance by its snapshot ID.
+
+        Parameters:
+            instance_id (str): The unique identifier of the instance.
+            snapshot_id (str): The unique identifier of the snapshot to be deleted.
+
+        Returns:
+            bool: True if the snapshot was deleted.
+        """
+        request_id = self.generate_request_id()
+        with log_request(request_id):
+            headers = {
+                'X-Request-ID': request_id
+            }
+            url = self.list_snapshots_url.format(instance_id=instance_id)
+            delete_body = {"request_id": request_id}
+            self.logger.debug("About to delete oldest snapshot %s for %s", snapshot_id, instance_id)
+            response = self.api_client.delete(f"{url}/{snapshot_id}", headers=headers, json=delete_body)
+
+            if response.status_code == 204:
+                self.logger.info("Snapshot %s deleted successfully.", snapshot_id)
+                self.inventory.remove(instance_id, snapshot_id)
+                return True
+            else:
+                self.logger.error("Error: Failed to delete snapshot %s. Response: %s", snapshot_id, response.text)
+                return False
+
+    def delete_snapshots(self, instance_id):
+        """
+        Deletes the oldest snapshot for a specific instance based on createdDate.
+        
+        This method retrieves all snapshots for the given instance and deletes the oldest one.
+
+        Parameters:
+            instance_id (str): The unique identifier of the instance for which snapshots will be deleted.
+
+        Returns:
+            None
+        """
+        snapshots = self.fetch_snapshots(instance_id)
+
+        if snapshots:
+            oldest_snapshot = self.find_oldest_snapshot(snapshots)
+            if oldest_snapshot:
+                snapshot_id = oldest_snapshot.get('snapshotId')
+                self.logger.debug("Oldest snapshot found with ID: %s, Created Date: %s", snapshot_id, oldest_snapshot['createdDate'])
+                self.delete_snapshot(instance_id, snapshot_id)
+            else:
+                self.logger.debug("No valid snapshot found to delete.")
+        else:
+            self.logger.debug("No snapshots found to delete.")
+
+    def send_summary_email(self):
+        """
+        Sends the summary report of the snapshot operations, including the timing summary of the run,
+        through the notification channels of SNAPSHOT_NOTIFY_CHANNELS. Does nothing unless notify_inline is set.
+        """
+        if not self.notify_inline:
+            return
+        with self.tracer.span('email'):
+            report = build_report(self.snapshot_results, self.timezone, self.tracer.summary())
+            dispatch_reports([report], get_notification_channels(self.logger), self.logger)
+        self.tracer.flush()
+
+    def build_result(self, instance_id, snapshot_name, success, status, name='Unknown', snapshot_id=None, error=None):
+        """
+        Builds a snapshot result entry as tracked in snapshot_results and rendered in the summary email.
+
+        Parameters:
+            instance_id (str): The unique identifier of the instance.
+            snapshot_name (str): The name of the snapshot that was requested.
+            success (bool): Whether the snapshot was created.
+            status (str): One of 'success', 'failed', 'error' or 'skipped', or 'unverified' after verify_snapshots.
+            name (str): The snapshot name reported back by the API.
+            snapshot_id (str): The unique identifier of the created snapshot, if any.
+            error (str): The error message for unsuccessful snapshots, or the reason of a skip.
+
+        Returns:
+            dict: The result entry.
+        """
+        result = {
+            'id': instance_id,
+            'name': name,
+            'success': success,
+            'snapshot_name': snapshot_name,
+            'timestamp': self.get_current_time().strftime('%Y-%m-%d %H:%M:%S'),
+            'status': status
+        }
+        if success:
+            result['snapshot_id'] = snapshot_id
+        else:
+            result['error'] = error
+        return result
+
+    def build_snapshot_request(self):
+        """
+        Builds the name and request body of a new snapshot.
+
+        Returns:
+            tuple: The snapshot name and the JSON body of the create request.
+        """
+        snapshot_name = f"snapshot-{self.get_current_time().strftime('%Y-%m-%d_%H-%M-%S')}"
+        # Ensure snapshot name contains only allowed characters
+        snapshot_name = re.sub(r'[^a-zA-Z0-9 -]', '', snapshot_name)  # Allow letters, numbers, spaces, and dashes
+        data = {
+            "name": snapshot_name,
+            "description": f"Automated snapshot taken on {self.get_current_time().strftime('%Y-%m-%d_%H-%M-%S')}"
+        }
+        return snapshot_name, data
+
+    def is_snapshot_limit_exceeded(self, response):
+        """
+        Checks whether a create response was rejected because the instance's snapshot quota is full.
+
+        Parameters:
+            response (requests.Response): The response of the create request.
+
+        Returns:
+            bool: True if the oldest snapshot must be deleted before retrying.
+        """
+        return response.status_code == 402 and "Total snapshots exceed the total max limit" in response.text
+
+    def parse_create_response(self, instance_id, snapshot_name, response):
+        """
+        Turns the response of a create request into a result entry.
+
+        Parameters:
+            instance_id (str): The unique identifier of the instance.
+            snapshot_name (str): The name of the requested snapshot.
+            response (requests.Response): The response of the create request.
+
+        Returns:
+            dict: The result entry for the instance.
+        """
+        if response.status_code == 201:
+            try:
+                response_json = response.json()
+                # The API returns data in a nested structure
+                snapshot_data = response_json.get('data', [{}])[0] if isinstance(response_json.get('data'), list) else response_json.get('data', {})
+                
+                self.logger.info("Snapshot %s created successfully for instance %s!", snapshot_name, instance_id)
+                self.logger.debug("Snapshot response data: %s", snapshot_data)
+                
+                self.inventory.add(instance_id, snapshot_data)
+
+                # Track successful snapshot with more details
+                return self.build_result(
+                    instance_id, snapshot_name, True, 'success',
+                    name=snapshot_data.get('name', 'Unknown'),
+                    snapshot_id=snapshot_data.get('snapshotId', 'Unknown')
+                )
+            except (KeyError, IndexError, TypeError) as e:
+                error_msg = f"Error parsing snapshot response: {str(e)}. Response: {response.text}"
+                self.logger.error(error_msg)
+                return self.build_result(instance_id, snapshot_name, False, 'error', error=error_msg)
+
+        error_msg = f"Failed to create snapshot. Status code: {response.status_code}, Response: {response.text}"
+        self.logger.error(error_msg)
+        
+        # Track failed snapshot with more details
+        return self.build_result(instance_id, snapshot_name, False, 'failed', error=error_msg)
+
+    @traced('create')
+    def snapshot_instance(self, instance_id):
+        """
+        Creates a new snapshot for a specific instance and returns the result without recording it.
+
+        If the snapshot limit is exceeded, it deletes the oldest snapshot before retrying the creation
+        of a new snapshot. This method does not touch snapshot_results, so it is safe to call from
+        worker threads.
+
+        Parameters:
+            instance_id (str): The unique identifier of the instance for which the snapshot will be created.
+
+        Returns:
+            dict: The result entry for the instance.
+        """
+        snapshot_name, data = self.build_snapshot_request()
+        self.logger.debug("Creating new snapshot for instance %s with name: %s", instance_id, snapshot_name)
+
+        request_id = self.generate_request_id()
+        with log_request(request_id):
+            headers = {
+                'X-Request-ID': request_id
+            }
+            url = self.create_snapshot_url.format(instance_id=instance_id)
+        
+            try:
+                response = self.api_client.post(url, headers=headers, json=data)
+
+                if self.is_snapshot_limit_exceeded(response):
+                    self.logger.info("Snapshot limit exceeded for instance %s. Deleting oldest snapshot...", instance_id)
+                    self.delete_snapshots(instance_id)
+                    self.logger.debug("Retrying snapshot creation for instance %s", instance_id)
+                    response = self.api_client.post(url, headers=headers, json=data)  # Retry creating snapshot
+
+                return self.parse_create_response(instance_id, snapshot_name, response)
+                
+            except Exception as e:
+                error_msg = f"Exception while creating snapshot for instance {instance_id}: {str(e)}"
+                self.logger.error(error_msg)
+            
+                # Track failed snapshot with exception details
+                return self.build_result(instance_id, snapshot_name, False, 'error', error=error_msg)
+
+    def create_snapshot(self, instance_id):
+        """
+        Creates a new snapshot for a specific instance and records the outcome in snapshot_results.
+
+        Parameters:
+            instance_id (str): The unique identifier of the instance for which the snapshot will be created.
+
+        Returns:
+            dict: The result entry for the instance.
+        """
+        result = self.snapshot_instance(instance_id)
+        self.snapshot_results.append(result)
+        return result
+
+    def process_instances(self, instances):
+        """
+        Creates (and, when the quota is full, rotates) snapshots for the given instances.
+
+        Up to max_workers instances are processed at once. Work on an instance starts as soon as
+        it is yielded, so a generator such as iter_instances() overlaps listing and snapshotting.
+        Results are appended to snapshot_results in the same order as the instances were given,
+        regardless of the order in which the workers finish.
+
+        Parameters:
+            instances (iterable): The instances, as returned by list_instances or iter_instances.
+
+        Returns:
+            list: The result entries for the processed instances.
+        """
+        selected_instances = (instance for instance in instances if self.should_process(instance))
+
+        results = []
+        try:
+            if self.max_workers <= 1:
+                for instance in selected_instances:
+                    results.append(self.handle_instance(instance))
+            else:
+                self.logger.info(f"Processing instances with {self.max_workers} workers")
+                futures = []
+                with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='snapshot') as executor:
+                    try:
+                        for instance in selected_instances:
+                            futures.append(executor.submit(self.handle_instance, instance))
+                    finally:
+                        # Collect in submission order, also when the listing failed halfway
+                        results = [future.result() for future in futures]
+        finally:
+            # Instances already snapshotted are always recorded
+            self.snapshot_results.extend(results)
+        return results
+
+    def should_process(self, instance):
+        """
+        Decides whether an instance gets a snapshot in this run.
+
+        Parameters:
+            instance (dict): The instance, as returned by list_instances.
+
+        Returns:
+            bool: True if the instance should be snapshotted.
+        """
+        if not instance.get('instanceId'):
+            return False
+        if not self.instance_filter.is_empty:
+            self.resolve_instance_tags()
+            if not self.instance_filter.matches(instance):
+                self.logger.debug("Instance %s (%s) is excluded by the instance filters.", instance.get('instanceId'), instance.get('displayName'))
+                return False
+        if self.checkpoint is not None and self.checkpoint.is_done(instance.get('instanceId')):
+            self.logger.debug("Instance %s was already snapshotted in this run. Skipping.", instance.get('instanceId'))
+            return False
+        return True
+
+    def fetch_tagged_instances(self, tag_name):
+        """
+        Fetches the instanceIds that carry a tag, through the tag assignments of the Contabo API.
+
+        Parameters:
+            tag_name (str): The name of the tag.
+
+        Returns:
+            set: The instanceIds (as strings) of the tag; empty if the tag does not exist.
+
+        Raises:
+            ContaboApiError: If the tag or its assignments cannot be fetched.
+        """
+        try:
+            response = self.api_client.get(self.tags_url, params={'name': tag_name}, headers={'X-Request-ID': self.generate_request_id()})
+            response.raise_for_status()
+            tag_ids = [tag.get('tagId') for tag in response.json().get('data', []) if str(tag.get('name', '')).lower() == tag_name]
+
+            instance_ids = set()
+            for tag_id in tag_ids:
+                page = 1
+                while True:
+                    response = self.api_client.get(
+                        self.tag_assignments_url.format(tag_id=tag_id),
+                        params={'resourceType': 'instance', 'page': page, 'size': self.instances_per_page},
+                        headers={'X-Request-ID': self.generate_request_id()}
+                    )
+                    response.raise_for_status()
+                    body = response.json()
+                    instance_ids.update(str(assignment.get('resourceId')) for assignment in body.get('data', []))
+                    if page >= body.get('_pagination', {}).get('totalPages', 1):
+                        break
+                    page += 1
+        except (requests.exceptions.RequestException, ValueError) as e:
+            raise ContaboApiError(f"Failed to fetch the instances of tag '{tag_name}': {e}")
+        self.logger.info(f"Tag '{tag_name}' is assigned to {len(instance_ids)} instances")
+        return instance_ids
+
+    def resolve_instance_tags(self):
+        """
+        Fetches the instances of the tags used in the instance filters, once per run.
+        """
+        if self.instance_filter.tagged_instances is not None or not self.instance_filter.tags:
+            return
+        with self.instance_filter_lock:
+            if self.instance_filter.tagged_instances is None:
+                self.instance_filter.set_tagged_instances({tag: self.fetch_tagged_instances(tag) for tag in self.instance_filter.tags})
+
+    def record_checkpoint(self, result):
+        """
+        Records the result of an instance in the checkpoint, if any, as soon as it is known.
+
+        A failing checkpoint store is logged but does not fail the instance.
+
+        Parameters:
+            result (dict): The result entry for the instance.
+
+        Returns:
+            dict: The result entry, unchanged.
+        """
+        if self.checkpoint is not None:
+            try:
+                with self.tracer.span('checkpoint'):
+                    self.checkpoint.record(result)
+            except Exception as e:
+                self.logger.error("Failed to checkpoint result of instance %s: %s", result.get('id'), e)
+        return result
+
+    def get_snapshot_limit(self, instance):
+        """
+        Returns the maximum number of snapshots of an instance.
+
+        Parameters:
+            instance (dict): The instance, as returned by list_instances.
+
+        Returns:
+            int: The limit of the instance's product (SNAPSHOT_PRODUCT_LIMITS), else SNAPSHOT_LIMIT. 0 means unknown.
+        """
+        return self.product_snapshot_limits.get(str(instance.get('productId')), self.snapshot_limit)
+
+    def has_known_snapshot_limits(self):
+        """Returns True if any snapshot limit is configured, i.e. rotations can be planned up front."""
+        return self.snapshot_limit > 0 or bool(self.product_snapshot_limits)
+
+    def plan_instance_rotation(self, instance, snapshots):
+        """
+        Decides which snapshots of an instance must be deleted so that one more snapshot fits its limit.
+
+        Parameters:
+            instance (dict): The instance, as returned by list_instances.
+            snapshots (list): The current snapshots of the instance.
+
+        Returns:
+            list: The snapshots to delete, oldest first. Empty if the limit is unknown or not reached.
+        """
+        limit = self.get_snapshot_limit(instance)
+        if limit <= 0:
+            return []
+        excess = len(snapshots) - limit + 1
+        if excess <= 0:
+            return []
+        dated_snapshots = [snapshot for snapshot in SnapshotInventory.sort(snapshots) if SnapshotInventory.parse_created_date(snapshot)]
+        return dated_snapshots[:excess]
+
+    def plan_rotations(self, instances):
+        """
+        Plans the quota rotations of many instances up front.
+
+        The snapshots of every instance with a known limit are read from the inventory, which is
+        fetched concurrently where needed; instances without a known limit, or whose snapshots
+        could not be fetched, are left to rotate_if_needed and the 402 fallback of create_snapshot.
+
+        Parameters:
+            instances (list): The instances, as returned by list_instances.
+
+        Returns:
+            dict: The snapshots to delete, keyed by instanceId. Only instances that need a rotation are included.
+        """
+        candidates = [instance for instance in instances if self.get_snapshot_limit(instance) > 0]
+        if not candidates:
+            return {}
+
+        self.logger.info(f"Planning snapshot rotations for {len(candidates)} instances")
+        self.prefetch_inventory(candidates)
+
+        plan = {}
+        for instance in candidates:
+            if not self.inventory.has(instance.get('instanceId')):
+                continue
+            to_delete = self.plan_instance_rotation(instance, self.inventory.get(instance.get('instanceId')))
+            if to_delete:
+                plan[instance.get('instanceId')] = to_delete
+            # Rotation is decided for this instance, whether or not anything must be deleted
+            self.rotated_instances.add(instance.get('instanceId'))
+        self.logger.info(f"{len(plan)} of {len(candidates)} instances are at their snapshot limit")
+        return plan
+
+    def execute_rotations(self, plan):
+        """
+        Deletes the planned snapshots, in parallel across instances.
+
+        A deletion that fails is logged; the create of that instance then falls back to the 402 path.
+
+        Parameters:
+            plan (dict): The snapshots to delete keyed by instanceId, as returned by plan_rotations.
+
+        Returns:
+            int: The number of snapshots deleted.
+        """
+        deletions = [(instance_id, snapshot.get('snapshotId')) for instance_id, snapshots in plan.items() for snapshot in snapshots]
+        if not deletions:
+            return 0
+
+        self.logger.info(f"Deleting {len(deletions)} snapshots ahead of the creates")
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(deletions)), thread_name_prefix='rotate') as executor:
+            deleted = list(executor.map(lambda deletion: self.safe_delete_snapshot(*deletion), deletions))
+        return sum(deleted)
+
+    def safe_delete_snapshot(self, instance_id, snapshot_id):
+        """
+        Runs delete_snapshot, logging instead of raising errors.
+
+        Returns:
+            bool: True if the snapshot was deleted.
+        """
+        try:
+            return self.delete_snapshot(instance_id, snapshot_id)
+        except Exception as e:
+            self.logger.error("Failed to delete snapshot %s of instance %s: %s", snapshot_id, instance_id, e)
+            return False
+
+    def plan_retention(self, instance_ids):
+        """
+        Plans the deletions of the retention policy for the given instances, from the inventory.
+
+        Instances that are not in the inventory yet are fetched concurrently first.
+
+        Parameters:
+            instance_ids (list): The unique identifiers of the instances.
+
+        Returns:
+            dict: The snapshots to delete, keyed by instanceId. Only instances with deletions are included.
+        """
+        if self.retention_policy is None:
+            return {}
+        self.prefetch_inventory([{'instanceId': instance_id} for instance_id in instance_ids])
+        return self.build_retention_plan(instance_ids)
+
+    def build_retention_plan(self, instance_ids):
+        """
+        Applies the retention policy to the snapshots of the given instances in the inventory.
+
+        Parameters:
+            instance_ids (list): The unique identifiers of the instances.
+
+        Returns:
+            dict: The snapshots to delete, keyed by instanceId.
+        """
+        now = self.get_current_time()
+        plan = {}
+        for instance_id in instance_ids:
+            _, to_delete = self.retention_policy.plan(self.inventory.get(instance_id), now, self.timezone)
+            if to_delete:
+                plan[instance_id] = to_delete
+        self.logger.info(f"Retention policy deletes {sum(map(len, plan.values()))} snapshots of {len(plan)} of {len(instance_ids)} instances")
+        return plan
+
+    def format_retention_plan(self, plan):
+        """
+        Describes a retention plan, one line per snapshot to delete.
+
+        Parameters:
+            plan (dict): The snapshots to delete keyed by instanceId, as returned by plan_retention.
+
+        Returns:
+            list: The lines of the plan.
+        """
+        return [
+            f"DELETE instance {instance_id} snapshot {snapshot.get('snapshotId')} "
+            f"'{snapshot.get('name')}' created {snapshot.get('createdDate')}"
+            for instance_id, snapshots in plan.items() for snapshot in snapshots
+        ]
+
+    def get_retention_batches(self, plan):
+        """Splits the deletions of a retention plan into batches of retention_batch_size (instanceId, snapshotId) pairs."""
+        deletions = [(instance_id, snapshot.get('snapshotId')) for instance_id, snapshots in plan.items() for snapshot in snapshots]
+        batch_size = max(1, self.retention_batch_size)
+        return [deletions[start:start + batch_size] for start in range(0, len(deletions), batch_size)]
+
+    def execute_retention(self, plan):
+        """
+        Deletes the snapshots of a retention plan, each batch in parallel, or only logs the plan in dry-run mode.
+
+        Parameters:
+            plan (dict): The snapshots to delete keyed by instanceId, as returned by plan_retention.
+
+        Returns:
+            int: The number of snapshots deleted.
+        """
+        if self.retention_dry_run:
+            for line in self.format_retention_plan(plan):
+                self.logger.info(f"[dry-run] {line}")
+            return 0
+        deleted = 0
+        batches = self.get_retention_batches(plan)
+        for number, batch in enumerate(batches, start=1):
+            self.logger.info(f"Deleting retention batch {number}/{len(batches)} ({len(batch)} snapshots)")
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(batch)), thread_name_prefix='retention') as executor:
+                deleted += sum(executor.map(lambda deletion: self.delete_snapshot(*deletion), batch))
+        return deleted
+
+    def get_retention_instance_ids(self, results):
+        """
+        Returns the instances of a run that retention applies to: the ones that got a new snapshot.
+
+        Instances whose create failed or errored, or that were skipped, keep all their snapshots.
+
+        Parameters:
+            results (list): The result entries of the run.
+
+        Returns:
+            list: The instance ids whose result is 'success' or 'unverified'.
+        """
+        return [result['id'] for result in results if result.get('status') in ('success', 'unverified')]
+
+    @traced('retention')
+    def apply_retention(self, results):
+        """
+        Enforces the retention policy on the instances of a run, after their snapshots were created.
+
+        Parameters:
+            results (list): The result entries of the run.
+
+        Returns:
+            int: The number of snapshots deleted.
+        """
+        if self.retention_policy is None:
+            return 0
+        try:
+            return self.execute_retention(self.plan_retention(self.get_retention_instance_ids(results)))
+        except Exception as e:
+            self.logger.error(f"Failed to apply the retention policy: {e}")
+            return 0
+
+    def rotate_if_needed(self, instance):
+        """
+        Deletes the oldest snapshots of an instance that is at its snapshot limit, before creating a new one.
+
+        Instances already handled by plan_rotations are skipped. Without a known limit nothing is done
+        here and create_snapshot falls back to deleting the oldest snapshot when the API rejects the
+        create with 402.
+
+        Parameters:
+            instance (dict): The instance, as returned by list_instances.
+
+        Returns:
+            None
+        """
+        instance_id = instance.get('instanceId')
+        if instance_id in self.rotated_instances or self.get_snapshot_limit(instance) <= 0:
+            return
+        for snapshot in self.plan_instance_rotation(instance, self.get_instance_snapshots(instance_id)):
+            self.logger.info("Instance %s is at its snapshot limit. Deleting oldest snapshot...", instance_id)
+            self.delete_snapshot(instance_id, snapshot.get('snapshotId'))
+        self.rotated_instances.add(instance_id)
+
+    def safe_rotate_if_needed(self, instance):
+        """
+        Runs rotate_if_needed, logging instead of raising errors.
+
+        A failed rotation does not stop the create: the 402 fallback still rotates if needed.
+
+        Parameters:
+            instance (dict): The instance, as returned by list_instances.
+        """
+        try:
+            self.rotate_if_needed(instance)
+        except Exception as e:
+            self.logger.error("Failed to rotate snapshots for instance %s: %s", instance.get('instanceId'), e)
+
+    # Snapshot states reported by the API while a snapshot is still being built, or when it failed
+    SNAPSHOT_PENDING_STATES = ('pending', 'creating', 'in_progress', 'provisioning', 'processing')
+    SNAPSHOT_FAILED_STATES = ('error', 'failed')
+
+    def get_snapshot_state(self, snapshot):
+        """
+        Returns the state of a listed snapshot: 'pending', 'failed' or 'completed'.
+
+        Snapshots without a status field are completed as soon as they are listed.
+
+        Parameters:
+            snapshot (dict): The snapshot, as returned by the API.
+
+        Returns:
+            str: The state of the snapshot.
+        """
+        state = str(snapshot.get('status') or snapshot.get('state') or '').lower()
+        if state in self.SNAPSHOT_PENDING_STATES:
+            return 'pending'
+        if state in self.SNAPSHOT_FAILED_STATES:
+            return 'failed'
+        return 'completed'
+
+    def apply_verification(self, pending, final=False, unpolled=()):
+        """
+        Updates the results of the instances polled in one verification sweep.
+
+        Parameters:
+            pending (list): The results still being verified, whose snapshots are in the inventory.
+            final (bool): Whether the deadline passed; snapshots that are not completed are then settled.
+            unpolled (set): The instances whose snapshots could not be fetched in this sweep; they
+                stay pending, and become 'unverified' at the deadline.
+
+        Returns:
+            list: The results that are still pending.
+        """
+        still_pending = []
+        for result in pending:
+            if result['id'] in unpolled:
+                if not final:
+                    still_pending.append(result)
+                    continue
+                self.logger.warning("Snapshot %s of instance %s could not be polled before the deadline.", result['snapshot_name'], result['id'])
+                result['status'] = 'unverified'
+                continue
+            snapshot = next((snapshot for snapshot in self.inventory.get(result['id'])
+                             if str(snapshot.get('snapshotId')) == str(result.get('snapshot_id'))), None)
+            state = self.get_snapshot_state(snapshot) if snapshot else 'pending'
+            if state == 'completed':
+                self.logger.debug("Snapshot %s of instance %s is completed.", result['snapshot_name'], result['id'])
+            elif state == 'failed':
+                self.logger.error("Snapshot %s of instance %s failed on Contabo.", result['snapshot_name'], result['id'])
+                result.update(success=False, status='failed', error=f"Snapshot failed with status '{snapshot.get('status') or snapshot.get('state')}'")
+            elif not final:
+                still_pending.append(result)
+            elif snapshot:
+                self.logger.warning("Snapshot %s of instance %s is not completed after %ss.", result['snapshot_name'], result['id'], self.verify_timeout)
+                result['status'] = 'unverified'
+            else:
+                self.logger.error("Snapshot %s of instance %s is not listed after %ss.", result['snapshot_name'], result['id'], self.verify_timeout)
+                result.update(success=False, status='failed', error=f"Snapshot not found in the listing after {self.verify_timeout}s")
+        return still_pending
+
+    @traced('verify')
+    def verify_snapshots(self, results):
+        """
+        Waits until the snapshots created in this run are completed on Contabo's side.
+
+        All pending instances are polled together in one sweep every verify_interval seconds,
+        concurrently and through the rate limiter, until every snapshot reached a final state or
+        verify_timeout passes. The results are updated in place: failed snapshots become 'failed',
+        and snapshots still being built at the deadline 'unverified'. An instance whose poll fails
+        stays pending, so one failing listing does not fail the run.
+
+        Parameters:
+            results (list): The result entries of the run.
+
+        Returns:
+            list: The results whose status changed.
+        """
+        pending = [result for result in results if result.get('success') and result.get('status') == 'success']
+        if not pending:
+            return []
+        self.logger.info(f"Verifying completion of {len(pending)} snapshots (deadline {self.verify_timeout}s)")
+        statuses = [result['status'] for result in pending]
+        deadline = time.monotonic() + self.verify_timeout
+        remaining = pending
+        while remaining:
+            time.sleep(max(0, min(self.verify_interval, deadline - time.monotonic())))
+            instance_ids = [result['id'] for result in remaining]
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(remaining)), thread_name_prefix='verify') as executor:
+                polled = list(executor.map(self.safe_fetch_snapshots, instance_ids))
+            unpolled = {instance_id for instance_id, ok in zip(instance_ids, polled) if not ok}
+            remaining = self.apply_verification(remaining, final=time.monotonic() >= deadline, unpolled=unpolled)
+            self.logger.info(f"{len(remaining)} snapshots are still being built")
+        return self.record_verification(pending, statuses)
+
+    def record_verification(self, verified, statuses):
+        """
+        Updates the checkpoint, if any, with the results whose status changed during verification.
+
+        Parameters:
+            verified (list): The verified result entries.
+            statuses (list): The status of each result before the verification.
+
+        Returns:
+            list: The results whose status changed.
+        """
+        changed = [result for result, status in zip(verified, statuses) if result['status'] != status]
+        if changed and self.checkpoint is not None:
+            try:
+                self.checkpoint.update(changed)
+            except Exception as e:
+                self.logger.error(f"Failed to checkpoint verified results: {e}")
+        return changed
+
+    def get_newest_snapshot_age(self, snapshots):
+        """
+        Returns the age in seconds of the newest of the given snapshots, or None if none has a valid createdDate.
+        """
+        created_dates = [created_date for created_date in map(SnapshotInventory.parse_created_date, snapshots) if created_date]
+        if not created_dates:
+            return None
+        return (self.get_current_time() - max(created_dates)).total_seconds()
+
+    def build_skip_result(self, instance_id, snapshots):
+        """
+        Builds a 'skipped' result if the newest of the given snapshots is younger than min_snapshot_age.
+
+        Parameters:
+            instance_id (str): The unique identifier of the instance.
+            snapshots (list): The snapshots of the instance.
+
+        Returns:
+            dict: The skipped result entry, or None if the instance needs a new snapshot.
+        """
+        age = self.get_newest_snapshot_age(snapshots)
+        if age is None or age >= self.min_snapshot_age:
+            return None
+        self.logger.debug("Instance %s has a snapshot from %ds ago. Skipping.", instance_id, age)
+        result = self.build_result(instance_id, '', False, 'skipped',
+                                   error=f"Latest snapshot is younger than {self.min_snapshot_age}s")
+        return self.record_checkpoint(result)
+
+    def check_snapshot_age(self, instance):
+        """
+        Checks whether an instance can be skipped because it has a fresh snapshot (see SNAPSHOT_MIN_AGE).
+
+        The snapshots are read from the inventory and fetched if the instance is not indexed yet.
+        If they cannot be fetched, the instance is not skipped.
+
+        Parameters:
+            instance (dict): The instance, as returned by list_instances.
+
+        Returns:
+            dict: The skipped result entry, or None if the instance needs a new snapshot.
+        """
+        if self.min_snapshot_age <= 0:
+            return None
+        instance_id = instance.get('instanceId')
+        try:
+            snapshots = self.get_instance_snapshots(instance_id)
+        except Exception as e:
+            self.logger.error("Failed to check snapshot age of instance %s: %s", instance_id, e)
+            return None
+        return self.build_skip_result(instance_id, snapshots)
+
+    def skip_fresh_instances(self, instances):
+        """
+        Splits off the instances whose newest snapshot in the inventory is younger than min_snapshot_age.
+
+        The skipped results are appended to snapshot_results. Expects the inventory to be prefetched.
+
+        Parameters:
+            instances (list): The instances, as returned by list_instances.
+
+        Returns:
+            tuple: The instances that still need a snapshot, and the skipped result entries.
+        """
+        if self.min_snapshot_age <= 0:
+            return instances, []
+        pending, skipped = [], []
+        for instance in instances:
+            result = self.build_skip_result(instance.get('instanceId'), self.inventory.get(instance.get('instanceId')))
+            if result is None:
+                pending.append(instance)
+            else:
+                skipped.append(result)
+        if skipped:
+            self.logger.info(f"Skipping {len(skipped)} instances with a snapshot younger than {self.min_snapshot_age}s")
+        self.snapshot_results.extend(skipped)
+        return pending, skipped
+
+    def handle_instance(self, instance):
+        """
+        Rotates (if needed) and snapshots one instance. Used by the worker threads of process_instances.
+
+        Parameters:
+            instance (dict): The instance, as returned by list_instances.
+
+        Returns:
+            dict: The result entry for the instance.
+        """
+        with log_instance(instance.get('instanceId')):
+            with self.tracer.span('instance') as span:
+                self.safe_rotate_if_needed(instance)
+                result = self.snapshot_instance(instance.get('instanceId'))
+                result['duration'] = round(span.elapsed(), 3)
+            return self.record_checkpoint(result)
+
+    def run_pipeline(self, instances):
+        """
+        Processes instances through the staged pipeline: discovery, filter, rotate-if-needed, create, record.
+
+        Each stage has its own worker threads (see SNAPSHOT_PIPELINE_WORKERS) and the stages are
+        connected by bounded queues, so all stages overlap and memory use does not grow with the
+        fleet. The per-stage statistics are kept in pipeline_stats. Results are appended to
+        snapshot_results in listing order.
+
+        Parameters:
+            instances (iterable): The instances, typically iter_instances().
+
+        Returns:
+            list: The result entries for the processed instances.
+        """
+        recorded = []
+
+        def filter_stage(item):
+            return item if self.should_process(item['instance']) else None
+
+        def rotate_stage(item):
+            with log_instance(item['instance'].get('instanceId')), self.tracer.span('instance') as span:
+                item['result'] = self.check_snapshot_age(item['instance'])
+                if item['result'] is None:
+                    self.safe_rotate_if_needed(item['instance'])
+            item['seconds'] = span.elapsed()
+            return item
+
+        def create_stage(item):
+            if item['result'] is None:
+                with log_instance(item['instance'].get('instanceId')):
+                    with self.tracer.span('instance') as span:
+                        result = self.snapshot_instance(item['instance'].get('instanceId'))
+                        result['duration'] = round(item['seconds'] + span.elapsed(), 3)
+                    item['result'] = self.record_checkpoint(result)
+            return item
+
+        def record_stage(item):
+            recorded.append((item['position'], item['result']))
+            return item
+
+        def stage_failed(item, stage_name, error):
+            instance_id = item['instance'].get('instanceId')
+            error_msg = f"Exception in pipeline stage {stage_name} for instance {instance_id}: {error}"
+            item['result'] = self.record_checkpoint(self.build_result(instance_id, None, False, 'error', error=error_msg))
+            return item
+
+        pipeline = SnapshotPipeline(
+            ({'position': position, 'instance': instance} for position, instance in enumerate(instances)),
+            [
+                PipelineStage('filter', filter_stage, self.pipeline_workers['filter']),
+                PipelineStage('rotate', rotate_stage, self.pipeline_workers['rotate']),
+                PipelineStage('create', create_stage, self.pipeline_workers['create']),
+                PipelineStage('record', record_stage, self.pipeline_workers['record'])
+            ],
+            queue_size=self.pipeline_queue_size,
+            logger=self.logger,
+            on_error=stage_failed
+        )
+        try:
+            self.pipeline_stats = pipeline.run()
+        finally:
+            # Workers finish in any order, restore the listing order
+            results = [result for _, result in sorted(recorded, key=lambda entry: entry[0])]
+            self.snapshot_results.extend(results)
+        return results
+
+    def manage_instances(self, instances):
+        """
+        Manages the snapshots (rotation and creation) of the given instances, without sending the summary email.
+
+        Used by manage_snapshots for the whole fleet and by the django-q shard tasks for one shard.
+
+        Parameters:
+            instances (iterable): The instances, as a list or a generator such as iter_instances().
+
+        Returns:
+            list: The result entries for the processed instances.
+        """
+        started, first_result = time.monotonic(), len(self.snapshot_results)
+        self.tracer.start_run(engine=type(self).__name__, run_id=str(self.run_id))
+        try:
+            return self.run_instances(instances)
+        finally:
+            self.tracer.finish_run()
+            self.observe_run(started, first_result)
+
+    def observe_run(self, started, first_result=0):
+        """
+        Records the duration and the results of a run (or shard) in the metrics, if enabled.
+
+        Parameters:
+            started (float): The time.monotonic() the run started at.
+            first_result (int): The index of the run's first entry in snapshot_results.
+        """
+        if self.metrics is not None:
+            self.metrics.observe_run(type(self).__name__, time.monotonic() - started, self.snapshot_results[first_result:])
+
+    def run_instances(self, instances):
+        """
+        Rotates, snapshots, verifies and applies retention to the given instances, see manage_instances.
+
+        Parameters:
+            instances (iterable): The instances, as a list or a generator such as iter_instances().
+
+        Returns:
+            list: The result entries for the processed instances.
+        """
+        self.rotated_instances.clear()
+        if self.run_mode == 'pipeline':
+            # The rotate stage rotates each instance as it streams through
+            results = self.run_pipeline(instances)
+        else:
+            skipped = []
+            if self.has_known_snapshot_limits() or self.prefetch_snapshots or self.min_snapshot_age > 0:
+                instances = [instance for instance in instances if self.should_process(instance)]
+                self.prefetch_inventory(instances)
+                instances, skipped = self.skip_fresh_instances(instances)
+                # Delete everything that must go before any create, instead of POST -> 402 -> GET -> DELETE -> POST
+                self.execute_rotations(self.plan_rotations(instances))
+            results = skipped + self.process_instances(instances)
+        if self.verify_snapshots_enabled:
+            self.verify_snapshots(results)
+        self.apply_retention(results)
+        return results
+
+    def get_concurrency(self):
+        """Returns the number of instances handled at once by process_instances."""
+        return self.max_workers
+
+    def plan_run(self):
+        """
+        Simulates a full run with read calls only and returns the actions it would take.
+
+        The instances and their snapshots are listed (instances already in the inventory are not
+        fetched again), then the skip, quota rotation, create and retention decisions of a real run
+        are made without any mutating call. Instances without a known snapshot limit may still need
+        a 402 rotation, which cannot be predicted; they are counted in the summary.
+
+        The summary projects the API calls of the real run and estimates its wall time from the
+        latency measured during the plan, the concurrency and the rate limit.
+
+        Returns:
+            dict: The 'actions' (dicts with action, instance_id, snapshot and reason) and the 'summary'.
+        """
+        started = time.monotonic()
+        calls_before = self.api_client.request_count
+        instances = [instance for instance in self.iter_instances() if self.should_process(instance)]
+        listing_calls = self.api_client.request_count - calls_before
+        listing_seconds = time.monotonic() - started
+        uncached = sum(1 for instance in instances if not self.inventory.has(instance.get('instanceId')))
+        self.prefetch_inventory(instances)
+
+        now = self.get_current_time()
+        snapshot_name, _ = self.build_snapshot_request()
+        actions = []
+        unknown_limits = 0
+        for instance in instances:
+            instance_id = instance.get('instanceId')
+            snapshots = self.inventory.get(instance_id)
+            age = self.get_newest_snapshot_age(snapshots)
+            if self.min_snapshot_age > 0 and age is not None and age < self.min_snapshot_age:
+                actions.append({'action': 'skip', 'instance_id': instance_id, 'snapshot': None,
+                                'reason': f"latest snapshot is {int(age)}s old"})
+                continue
+
+            rotated = self.plan_instance_rotation(instance, snapshots)
+            if self.get_snapshot_limit(instance) <= 0:
+                unknown_limits += 1
+            for snapshot in rotated:
+                actions.append({'action': 'delete', 'instance_id': instance_id, 'snapshot': snapshot, 'reason': 'snapshot limit'})
+            new_snapshot = {'snapshotId': None, 'name': snapshot_name, 'createdDate': now.isoformat()}
+            actions.append({'action': 'create', 'instance_id': instance_id, 'snapshot': new_snapshot, 'reason': ''})
+
+            if self.retention_policy is not None:
+                remaining = [snapshot for snapshot in snapshots if snapshot not in rotated] + [new_snapshot]
+                _, expired = self.retention_policy.plan(remaining, now, self.timezone)
+                for snapshot in expired:
+                    if snapshot is not new_snapshot:
+                        actions.append({'action': 'delete', 'instance_id': instance_id, 'snapshot': snapshot, 'reason': 'retention policy'})
+
+        creates = sum(1 for action in actions if action['action'] == 'create')
+        deletes = sum(1 for action in actions if action['action'] == 'delete')
+        # A real run only reads the snapshots of each instance when a limit, min-age or retention needs them
+        needs_inventory = (self.has_known_snapshot_limits() or self.prefetch_snapshots or self.min_snapshot_age > 0
+                           or self.retention_policy is not None)
+        instance_calls = creates + deletes + (uncached if needs_inventory else 0) + (creates if self.verify_snapshots_enabled else 0)
+
+        latency = self.api_client.request_seconds / self.api_client.request_count if self.api_client.request_count else 0.0
+        concurrency = self.get_concurrency()
+        instance_seconds = instance_calls * latency / concurrency
+        if self.rate_limiter is not None and self.rate_limiter.max_rate > 0:
+            instance_seconds = max(instance_seconds, instance_calls / self.rate_limiter.max_rate)
+        estimated_seconds = listing_seconds + instance_seconds + (self.verify_interval if self.verify_snapshots_enabled and creates else 0)
+
+        summary = {
+            'instances': len(instances),
+            'creates': creates,
+            'deletes': deletes,
+            'skips': sum(1 for action in actions if action['action'] == 'skip'),
+            'instances_without_known_limit': unknown_limits,
+            'read_calls_made': self.api_client.request_count - calls_before,
+            'projected_api_calls': listing_calls + instance_calls,
+            'average_latency_seconds': round(latency, 4),
+            'concurrency': concurrency,
+            'estimated_wall_seconds': round(estimated_seconds, 1),
+        }
+        self.logger.info(f"Plan: {summary}")
+        return {'actions': actions, 'summary': summary}
+
+    def format_plan(self, plan):
+        """
+        Describes a plan returned by plan_run, one line per action followed by the summary.
+
+        Parameters:
+            plan (dict): The plan, as returned by plan_run.
+
+        Returns:
+            list: The lines of the plan.
+        """
+        lines = []
+        for action in plan['actions']:
+            snapshot = action['snapshot'] or {}
+            line = f"{action['action'].upper():<6} instance {action['instance_id']}"
+            if action['action'] == 'delete':
+                line += f" snapshot {snapshot.get('snapshotId')} '{snapshot.get('name')}' created {snapshot.get('createdDate')}"
+            elif action['action'] == 'create':
+                line += f" snapshot '{snapshot.get('name')}'"
+            if action['reason']:
+                line += f" ({action['reason']})"
+            lines.append(line)
+        summary = plan['summary']
+        lines.append(
+            f"{summary['instances']} instances: {summary['creates']} creates, {summary['deletes']} deletes, "
+            f"{summary['skips']} skipped, {summary['instances_without_known_limit']} without a known snapshot limit"
+        )
+        lines.append(
+            f"Projected API calls: {summary['projected_api_calls']} ({summary['read_calls_made']} read calls made for this plan)"
+        )
+        lines.append(
+            f"Estimated wall time: {summary['estimated_wall_seconds']}s at concurrency {summary['concurrency']} "
+            f"and {summary['average_latency_seconds'] * 1000:.0f} ms average latency"
+        )
+        return lines
+
+    def manage_snapshots(self):
+        """
+        Loops through all instances and manages snapshots (creates and deletes) for each one.
+        
+        This method iterates over all the available instances and performs snapshot management (creation and deletion) 
+        for each instance, running up to max_workers instances concurrently (or through the staged
+        pipeline with SNAPSHOT_RUN_MODE=pipeline). Snapshot creation starts while the remaining pages
+        of the listing are still being fetched.
+
+        Returns:
+            None
+
+        Raises:
+            ContaboApiError: If the instance listing fails; the instances processed so far are still reported.
+        """
+        try:
+            results = self.manage_instances(self.iter_instances())
+        except ContaboApiError as e:
+            self.logger.error(f"Listing instances failed, {len(self.snapshot_results)} instances were processed: {e}")
+            if self.snapshot_results:
+                self.send_summary_email()
+            raise
+
+        if results:
+            # Send summary email after all operations are complete
+            self.send_summary_email()
+        else:
+            self.logger.info("No instances to manage.")
+
+
+class ContaboApiResponse:
+    """
+    ContaboApiResponse is the fully read response returned by AsyncContaboApiClient.
+
+    It mirrors the parts of requests.Response used by the snapshot manager, so response handling
+    is shared between the sync and the async engine.
     """
 
-    def __init__(self):
+    def __init__(self, status_code, text, headers=None):
+        self.status_code = status_code
+        self.text = text
+        self.headers = headers or {}
+
+    def json(self):
+        """Decodes the response body as JSON."""
+        return json.loads(self.text)
+
+    def raise_for_status(self):
+        """Raises requests.exceptions.HTTPError for 4xx and 5xx responses."""
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(f"{self.status_code} Error. Response: {self.text}", response=self)
+
+
+class AsyncContaboApiClient:
+    """
+    AsyncContaboApiClient is the asyncio counterpart of ContaboApiClient, built on aiohttp.
+
+    A single ClientSession is shared by all calls. Its connector caps the total number of connections
+    and the number of connections per host (api.contabo.com / auth.contabo.com). Rate limiting and
+    retries follow the same RateLimiter and RetryPolicy as the sync client.
+    """
+
+    def __init__(self, token_provider=None, limit=100, limit_per_host=20, timeout=30, headers=None,
+                 rate_limiter=None, retry_policy=None, logger=None):
         """
-        Initializes the ContaboSnapshotManager instance and retrieves an access token.
-        
-        The credentials for accessing the Contabo API are loaded from environment variables.
-        Docker environment variables take precedence over .env file variables.
+        Initializes the AsyncContaboApiClient. The session is opened by open() or "async with".
+
+        Parameters:
+            token_provider (ContaboTokenProvider): Provides the bearer token for authenticated calls.
+            limit (int): Maximum number of open connections.
+            limit_per_host (int): Maximum number of open connections per host.
+            timeout (float): Default total timeout in seconds for every request.
+            headers (dict): Extra default headers sent with every request.
+            rate_limiter (RateLimiter): Limits the request rate. None disables rate limiting.
+            retry_policy (RetryPolicy): Decides which failed calls are retried. None disables retries.
+            logger (logging.Logger): The logger to report retries to.
         """
-        # Load environment variables from .env file (as fallback)
-        # load_dotenv(override=False)  # Don't override existing environment variables
+        self.token_provider = token_provider
+        self.rate_limiter = rate_limiter
+        self.retry_policy = retry_policy or RetryPolicy(max_retries=0)
+        self.logger = logger or logging.getLogger(__name__)
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.timeout = timeout
+        self.headers = {'Content-Type': 'application/json', **(headers or {})}
+        self.session = None
+        # Request statistics, hooks and metrics, as in ContaboApiClient
+        self.request_count = 0
+        self.request_seconds = 0.0
+        self.request_hooks = []
+        self.metrics = None
 
-        # Setup logging
-        self.logger = self.setup_logger()
+    async def open(self):
+        """Opens the aiohttp session and its connection pool."""
+        connector = aiohttp.TCPConnector(limit=self.limit, limit_per_host=self.limit_per_host)
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+            headers=self.headers
+        )
+        return self
 
-        # Set timezone from environment variable with fallback to Asia/Manila
-        timezone_name = os.getenv('TZ', 'Asia/Manila')
-        self.timezone = pytz.timezone(timezone_name)
-        self.logger.info(f"Timezone set to: {self.timezone} ({timezone_name})")
+    async def close(self):
+        """Closes the aiohttp session and every pooled connection."""
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def __aenter__(self):
+        return await self.open()
+
+    async def __aexit__(self, exc_type, exc, traceback):
+        await self.close()
+
+    async def get_token(self):
+        """
+        Returns a valid access token. Authentication itself is blocking, so it runs in a thread.
+
+        Returns:
+            str: The access token, or None if authentication failed.
+        """
+        access_token = self.token_provider.cached_token()
+        if access_token is None:
+            access_token = await asyncio.to_thread(self.token_provider.get_token)
+        return access_token
+
+    async def send(self, method, url, headers, **kwargs):
+        """Sends one request and reads the whole response body."""
+        async with self.session.request(method, url, headers=headers, **kwargs) as response:
+            text = await response.text()
+            return ContaboApiResponse(response.status, text, dict(response.headers))
+
+    async def request(self, method, url, authenticate=True, headers=None, **kwargs):
+        """
+        Sends a request through the shared session.
+
+        Authenticated requests carry the cached bearer token. If the API answers 401 the token
+        is refreshed and the request is retried once. Throttled (429), transient (5xx) and
+        connection failures are retried with backoff according to the retry policy.
+
+        Parameters:
+            method (str): The HTTP method.
+            url (str): The absolute URL to call.
+            authenticate (bool): Whether to send the bearer token of the token provider.
+            headers (dict): Extra headers for this request.
+            **kwargs: Passed through to aiohttp.ClientSession.request.
+
+        Returns:
+            ContaboApiResponse: The response of the API.
+
+        Raises:
+            aiohttp.ClientError: If the call still fails after all retries.
+        """
+        headers = dict(headers or {})
+        token_refreshed = False
+        attempt = 0
+        while True:
+            access_token = None
+            if authenticate and self.token_provider is not None:
+                access_token = await self.get_token()
+                headers['Authorization'] = f'Bearer {access_token}'
+            if self.rate_limiter is not None:
+                await self.rate_limiter.aacquire()
+
+            started = time.monotonic()
+            try:
+                response = await self.send(method, url, headers, **kwargs)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                self.record_request(method, url, None, started)
+                if not self.retry_policy.should_retry(method, attempt):
+                    raise
+                delay = self.retry_policy.get_delay(attempt)
+                attempt += 1
+                self.logger.warning("%s %s failed: %r. Retry %d/%d in %.2fs", method, url, e, attempt, self.retry_policy.max_retries, delay)
+                if self.metrics is not None:
+                    self.metrics.observe_retry(method, url, 'connection')
+                await asyncio.sleep(delay)
+                continue
+            self.record_request(method, url, response.status_code, started)
+
+            if response.status_code == 401 and access_token is not None and not token_refreshed:
+                token_refreshed = True
+                self.token_provider.invalidate(access_token)
+                continue
+
+            if self.retry_policy.should_retry(method, attempt, response.status_code):
+                delay = self.retry_policy.get_delay(attempt, response)
+                if response.status_code == 429 and self.rate_limiter is not None:
+                    self.rate_limiter.throttle(delay)
+                attempt += 1
+                self.logger.warning("%s %s returned %s. Retry %d/%d in %.2fs", method, url, response.status_code, attempt, self.retry_policy.max_retries, delay)
+                if self.metrics is not None:
+                    self.metrics.observe_retry(method, url, response.status_code)
+                await asyncio.sleep(delay)
+                continue
+
+            if self.rate_limiter is not None and response.status_code != 429:
+                self.rate_limiter.recover()
+            return response
+
+    def record_request(self, method, url, status_code, started):
+        """Counts a sent request and the time since it was started, and runs the request hooks."""
+        seconds = time.monotonic() - started
+        self.request_count += 1
+        self.request_seconds += seconds
+        observers = self.request_hooks if self.metrics is None else [self.metrics.observe_request, *self.request_hooks]
+        for observer in observers:
+            try:
+                observer(method, url, status_code, seconds)
+            except Exception as e:
+                # An observer must never break the request it observes
+                self.logger.warning("Request hook %r failed: %s", observer, e)
+
+    async def get(self, url, **kwargs):
+        """Sends a GET request through the shared session."""
+        return await self.request('GET', url, **kwargs)
 
-        # Get environment variables (Docker env vars will take precedence)
-        self.client_id = os.getenv("CLIENT_ID")
-        self.api_user = os.getenv("API_USER")
-        self.api_password = os.getenv("API_PASSWORD")
-        self.client_secret = os.getenv("CLIENT_SECRET")
-        self.instances_per_page = 20
-        self.auth_url = "https://auth.contabo.com/auth/realms/contabo/protocol/openid-connect/token"
-        self.list_instances_url = "https://api.contabo.com/v1/compute/instances?size={}".format(self.instances_per_page)
-        self.list_snapshots_url = "https://api.contabo.com/v1/compute/instances/{instance_id}/snapshots"
-        self.create_snapshot_url = "https://api.contabo.com/v1/compute/instances/{instance_id}/snapshots"
-        self.snapshots = []
-        self.access_token = self.get_access_token()
-        self.logger.info("Initialized ContaboSnapshotManager.")
-        
-        # Initialize snapshot results tracking
-        self.snapshot_results = []
+    async def post(self, url, **kwargs):
+        """Sends a POST request through the shared session."""
+        return await self.request('POST', url, **kwargs)
 
-    def get_current_time(self):
-        """
-        Gets the current time in the configured timezone (from TZ environment variable).
-        
-        Returns:
-            datetime: Current time in the configured timezone.
-        """
-        return datetime.now(self.timezone)
+    async def delete(self, url, **kwargs):
+        """Sends a DELETE request through the shared session."""
+        return await self.request('DELETE', url, **kwargs)
 
-    def setup_logger(self):
-        """Sets up the logger to output to stdout for Docker logging.""" 
-        import sys
 
-        # Create formatter
-        formatter = logging.Formatter(
-            '%(asctime)s - %(levelname)s - [%(filename)s:%(lineno)d - %(funcName)s()] - %(message)s'
-        )
+class AsyncContaboSnapshotManager(ContaboSnapshotManager):
+    """
+    AsyncContaboSnapshotManager runs the snapshot flow on asyncio instead of worker threads.
 
-        # Get the root logger
-        logger = logging.getLogger()
-        logger.setLevel(logging.INFO)
-        
-        # Remove any existing handlers to avoid duplicate logs
-        for existing_handler in logger.handlers[:]:
-            logger.removeHandler(existing_handler)
+    Listing, fetching, rotating and creating snapshots are coroutines (prefixed with "a", like
+    Django's async API) sharing one aiohttp session. A semaphore bounds the number of instances in
+    flight and the connector bounds the connections per host, so a single worker can drive
+    thousands of instances. The blocking methods of ContaboSnapshotManager remain available.
+    """
 
-        # Create stdout handler (for Docker logs)
-        stdout_handler = logging.StreamHandler(sys.stdout)
-        stdout_handler.setLevel(logging.INFO)
-        stdout_handler.setFormatter(formatter)
-        logger.addHandler(stdout_handler)
+    def __init__(self, credentials=None, account=None):
+        """
+        Initializes the AsyncContaboSnapshotManager and retrieves an access token.
 
-        # Log the current log configuration
-        logger.info("Logging configured: stdout only (Docker handles rotation)")
+        Parameters:
+            credentials (dict): The credentials of the account, see ContaboSnapshotManager.
+            account (str): The name of the account.
 
-        return logger
+        Raises:
+            ImportError: If aiohttp is not installed.
+        """
+        if aiohttp is None:
+            raise ImportError("AsyncContaboSnapshotManager requires aiohttp. Install it with: pip install aiohttp")
+        super().__init__(credentials, account)
+        # Maximum number of instances in flight at once
+        self.max_concurrency = max(1, int(os.getenv('SNAPSHOT_ASYNC_CONCURRENCY', 50)))
+        # Maximum number of open connections per host
+        self.limit_per_host = max(1, int(os.getenv('CONTABO_ASYNC_LIMIT_PER_HOST', 20)))
+        self.async_client = None
 
-    def generate_request_id(self):
+    def run_async(self, coroutine_function, *args):
         """
-        Generates a unique UUID to be used as a request identifier for API calls.
+        Runs a coroutine method in a new event loop with an open AsyncContaboApiClient.
+
+        Parameters:
+            coroutine_function (callable): The coroutine function to run.
+            *args: Passed to the coroutine function.
 
         Returns:
-            str: A generated UUID to be used as the request identifier.
+            object: The return value of the coroutine.
         """
-        return str(uuid.uuid4())
+        async def runner():
+            async with AsyncContaboApiClient(
+                token_provider=self.token_provider,
+                limit=max(self.max_concurrency, self.limit_per_host),
+                limit_per_host=self.limit_per_host,
+                timeout=self.api_client.timeout,
+                rate_limiter=self.rate_limiter,
+                retry_policy=self.retry_policy,
+                logger=self.logger
+            ) as client:
+                # Hooks registered on the sync client also observe the async requests
+                client.request_hooks = self.api_client.request_hooks
+                client.metrics = self.metrics
+                self.async_client = client
+                try:
+                    return await coroutine_function(*args)
+                finally:
+                    self.async_client = None
 
-    def get_access_token(self):
+        return asyncio.run(runner())
+
+    @traced('list')
+    async def afetch_instances_page(self, url):
         """
-        Authenticates with Contabo's OAuth 2.0 service to retrieve an access token.
-        
+        Fetches one page of the instance listing, retrying the page if it fails.
+
+        Parameters:
+            url (str): The URL of the page.
+
         Returns:
-            str: The access token used for API authentication.
+            dict: The decoded page, with 'data', '_pagination' and '_links'.
 
         Raises:
-            Exception: If the authentication request fails, raises an error with the message.
+            ContaboApiError: If the page still fails after page_attempts attempts.
         """
-        self.logger.info("Requesting access token using client credentials...")
-        data = {
-            'client_id': self.client_id,
-            'client_secret': self.client_secret,
-            'username': self.api_user,
-            'password': self.api_password,
-            'grant_type': 'password'
-        }
-        headers = {'Content-Type': 'application/x-www-form-urlencoded'}
-        response = requests.post(self.auth_url, data=data, headers=headers)
-
-        if response.status_code == 200:
-            response_json = response.json()
-            access_token = response_json.get('access_token')
-            if access_token:
-                self.logger.info(f"Access token acquired successfully: {access_token[:10]}...")  # Log only part of the token
-                return access_token
-            else:
-                self.logger.error(f"Failed to get access token. Error: {e}")
-                return None
-        else:
-            self.logger.error(f"Error: Failed to get access token. Response: {response.text}")
-            return None
+        for attempt in range(self.page_attempts):
+            request_id = self.generate_request_id()
+            with log_request(request_id):
+                try:
+                    response = await self.async_client.get(url, headers={'X-Request-ID': request_id})
+                    response.raise_for_status()
+                    return response.json()
+                except (requests.exceptions.RequestException, aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                    self.logger.error(f"Failed to list instances ({url}), attempt {attempt + 1}/{self.page_attempts}. Error: {e!r}")
+                if attempt + 1 < self.page_attempts:
+                    await asyncio.sleep(self.retry_policy.get_delay(attempt))
+        raise ContaboApiError(f"Failed to list instances: page {url} failed {self.page_attempts} times")
 
-    def list_instances(self):
-        """List all instances, handling pagination to get all instances."""
+    async def aiter_instances(self):
+        """
+        Yields all instances page by page, as the pages arrive.
+
+        Like iter_instances, the remaining pages are fetched concurrently once the first page
+        reports the total number of pages, and are yielded in page order.
+
+        Yields:
+            dict: The instances, in listing order.
+
+        Raises:
+            ContaboApiError: If a page keeps failing; the listing is never silently truncated.
+        """
         self.logger.info("Requesting list of instances...")
+        size = self.instances_per_page
+        data = await self.afetch_instances_page(self.instances_page_url.format(page=1, size=size))
+        self.logger.info(f"Fetched {len(data.get('data', []))} instances from page 1.")
+        for instance in data.get('data', []):
+            yield instance
 
-        # Initialize list to hold all instances
-        all_instances = []
+        total_pages = (data.get('_pagination') or {}).get('totalPages')
+        if not self.parallel_pages or not isinstance(total_pages, int):
+            while data.get('_links', {}).get('next'):
+                next_page_url = self.api_base_url + data['_links']['next']
+                data = await self.afetch_instances_page(next_page_url)
+                self.logger.info(f"Fetched {len(data.get('data', []))} instances. Next page URL: {data.get('_links', {}).get('next')}")
+                for instance in data.get('data', []):
+                    yield instance
+            return
 
-        # Get the first page of instances
-        access_token = self.get_access_token()
-        next_page_url = self.list_instances_url
-        while next_page_url:
-            headers = {
-                'Authorization': f'Bearer {access_token}',
-                'Content-Type': 'application/json',
-                'X-Request-ID': str(uuid.uuid4())
-            }
-            
-            try:
-                response = requests.get(next_page_url, headers=headers)
-                response.raise_for_status()
-                data = response.json()
-                
-                # Append the instances from the current page
-                all_instances.extend(data.get('data', []))
-                
-                # Check if there is a next page
-                if data['_links'].get('next'):
-                    next_page_url = 'https://api.contabo.com'+data['_links'].get('next')
-                else:
-                    next_page_url = None
-                    
-                self.logger.info(f"Fetched {len(data.get('data', []))} instances. Next page URL: {next_page_url}")
-            
-            except requests.exceptions.RequestException as e:
-                self.logger.error(f"Failed to list instances. Error: {e}")
-                break
-        
-        self.logger.info(f"Successfully fetched {len(all_instances)} instances.")
+        tasks = [
+            asyncio.create_task(self.afetch_instances_page(self.instances_page_url.format(page=page, size=size)))
+            for page in range(2, total_pages + 1)
+        ]
+        try:
+            for page, task in enumerate(tasks, start=2):
+                page_data = await task
+                self.logger.info(f"Fetched {len(page_data.get('data', []))} instances from page {page}/{total_pages}.")
+                for instance in page_data.get('data', []):
+                    yield instance
+        finally:
+            for task in tasks:
+                task.cancel()
 
-        for instance in all_instances:
-                    self.logger.info([instance["instanceId"], instance["displayName"]])
+    async def alist_instances(self):
+        """List all instances, handling pagination to get all instances."""
+        all_instances = [instance async for instance in self.aiter_instances()]
+        self.logger.info(f"Successfully fetched {len(all_instances)} instances.")
         return all_instances
 
-    def fetch_snapshots(self, instance_id):
+    @traced('fetch')
+    async def afetch_snapshots(self, instance_id):
         """
         Fetches all snapshots for a specific instance.
 
@@ -206,45 +3847,27 @@ class ContaboSnapshotManager:
         Returns:
             list: A list of snapshots for the given instance.
         """
-        self.logger.info("Fetching snapshots for instance {}...".format(instance_id))
+        self.logger.debug("Fetching snapshots for instance %s...", instance_id)
 
         request_id = self.generate_request_id()
-        headers = {
-            'Authorization': f'Bearer {self.access_token}',
-            'Content-Type': 'application/json',
-            'X-Request-ID': request_id
-        }
-        url = self.list_snapshots_url.format(instance_id=instance_id)
-        response = requests.get(url, headers=headers)
-
-        if response.status_code == 200:
-            snapshots = response.json().get('data', [])
-            self.logger.info(f"Fetched {len(snapshots)} snapshots for instance {instance_id}.")
-            return snapshots
-        else:
-            self.logger.error(f"Error: Failed to fetch snapshots for instance {instance_id}. Response: {response.text}")
-            return []
-
-    def find_oldest_snapshot(self, snapshots):
-        """
-        Finds the oldest snapshot based on the createdDate field.
-
-        Parameters:
-            snapshots (list): The list of snapshots to search through.
+        with log_request(request_id):
+            headers = {
+                'X-Request-ID': request_id
+            }
+            url = self.list_snapshots_url.format(instance_id=instance_id)
+            response = await self.async_client.get(url, headers=headers)
 
-        Returns:
-            dict: The oldest snapshot based on the 'createdDate' field.
-        """
-        oldest_snapshot = None
-        self.logger.info("Getting oldest of snapshots for instance")
-        for snapshot in snapshots:
-            if 'createdDate' in snapshot:
-                if oldest_snapshot is None or snapshot['createdDate'] < oldest_snapshot['createdDate']:
-                    oldest_snapshot = snapshot
-                    self.logger.info("Oldest snapshot is {}".format(oldest_snapshot))
-        return oldest_snapshot
+            if response.status_code == 200:
+                snapshots = response.json().get('data', [])
+                self.logger.debug("Fetched %d snapshots for instance %s.", len(snapshots), instance_id)
+                self.inventory.set(instance_id, snapshots)
+                return snapshots
+            else:
+                self.logger.error("Error: Failed to fetch snapshots for instance %s. Response: %s", instance_id, response.text)
+                return []
 
-    def delete_snapshot(self, instance_id, snapshot_id):
+    @traced('delete')
+    async def adelete_snapshot(self, instance_id, snapshot_id):
         """
         Deletes a specific snapshot for an instance by its snapshot ID.
 
@@ -253,29 +3876,29 @@ class ContaboSnapshotManager:
             snapshot_id (str): The unique identifier of the snapshot to be deleted.
 
         Returns:
-            None
+            bool: True if the snapshot was deleted.
         """
         request_id = self.generate_request_id()
-        headers = {
-            'Authorization': f'Bearer {self.access_token}',
-            'Content-Type': 'application/json',
-            'X-Request-ID': request_id
-        }
-        url = self.list_snapshots_url.format(instance_id=instance_id)
-        delete_body = {"request_id": request_id}
-        self.logger.info("About to delete oldest snapshot {} for {}".format(snapshot_id, instance_id))
-        response = requests.delete(f"{url}/{snapshot_id}", headers=headers, json=delete_body)
+        with log_request(request_id):
+            headers = {
+                'X-Request-ID': request_id
+            }
+            url = self.list_snapshots_url.format(instance_id=instance_id)
+            delete_body = {"request_id": request_id}
+            self.logger.debug("About to delete oldest snapshot %s for %s", snapshot_id, instance_id)
+            response = await self.async_client.delete(f"{url}/{snapshot_id}", headers=headers, json=delete_body)
 
-        if response.status_code == 204:
-            self.logger.info(f"Snapshot {snapshot_id} deleted successfully.")
-        else:
-            self.logger.error(f"Error: Failed to delete snapshot {snapshot_id}. Response: {response.text}")
+            if response.status_code == 204:
+                self.logger.info("Snapshot %s deleted successfully.", snapshot_id)
+                self.inventory.remove(instance_id, snapshot_id)
+                return True
+            else:
+                self.logger.error("Error: Failed to delete snapshot %s. Response: %s", snapshot_id, response.text)
+                return False
 
-    def delete_snapshots(self, instance_id):
+    async def adelete_snapshots(self, instance_id):
         """
         Deletes the oldest snapshot for a specific instance based on createdDate.
-        
-        This method retrieves all snapshots for the given instance and deletes the oldest one.
 
         Parameters:
             instance_id (str): The unique identifier of the instance for which snapshots will be deleted.
@@ -283,210 +3906,387 @@ class ContaboSnapshotManager:
         Returns:
             None
         """
-        snapshots = self.fetch_snapshots(instance_id)
+        snapshots = await self.afetch_snapshots(instance_id)
 
         if snapshots:
             oldest_snapshot = self.find_oldest_snapshot(snapshots)
             if oldest_snapshot:
                 snapshot_id = oldest_snapshot.get('snapshotId')
-                self.logger.info(f"Oldest snapshot found with ID: {snapshot_id}, Created Date: {oldest_snapshot['createdDate']}")
-                self.delete_snapshot(instance_id, snapshot_id)
+                self.logger.debug("Oldest snapshot found with ID: %s, Created Date: %s", snapshot_id, oldest_snapshot['createdDate'])
+                await self.adelete_snapshot(instance_id, snapshot_id)
             else:
-                self.logger.info("No valid snapshot found to delete.")
+                self.logger.debug("No valid snapshot found to delete.")
         else:
-            self.logger.info("No snapshots found to delete.")
+            self.logger.debug("No snapshots found to delete.")
 
-    def send_summary_email(self):
+    @traced('create')
+    async def asnapshot_instance(self, instance_id):
         """
-        Generates and sends a summary email of the snapshot operations.
+        Creates a new snapshot for a specific instance and returns the result without recording it.
+
+        If the snapshot limit is exceeded, it deletes the oldest snapshot before retrying the creation
+        of a new snapshot.
+
+        Parameters:
+            instance_id (str): The unique identifier of the instance for which the snapshot will be created.
+
+        Returns:
+            dict: The result entry for the instance.
         """
-        try:
-            # Get SMTP settings from environment
-            smtp_server = os.getenv('SMTP_SERVER')
-            smtp_port = int(os.getenv('SMTP_PORT', 587))
-            smtp_username = os.getenv('SMTP_USERNAME')
-            smtp_password = os.getenv('SMTP_PASSWORD')
-            admin_email = os.getenv('ADMIN_EMAIL')
-            email_from = os.getenv('EMAIL_FROM')
-            
-            # Check if all required email configuration is present
-            if not all([smtp_server, smtp_username, smtp_password, admin_email, email_from]):
-                self.logger.warning("Email configuration incomplete. Skipping email summary.")
-                self.logger.warning(f"Missing: SMTP_SERVER={smtp_server}, SMTP_USERNAME={smtp_username}, SMTP_PASSWORD={'***' if smtp_password else 'None'}, ADMIN_EMAIL={admin_email}, EMAIL_FROM={email_from}")
-                return
-            
-            # Load email template
-            env = Environment(loader=FileSystemLoader('templates/email'))
-            template = env.get_template('snapshot_summary.html')
-            
-            # Prepare email data
-            successful_snapshots = sum(1 for result in self.snapshot_results if result.get('success', False))
-            failed_snapshots = len(self.snapshot_results) - successful_snapshots
-            
-            email_data = {
-                'timestamp': self.get_current_time().strftime('%Y-%m-%d %H:%M:%S'),
-                'total_instances': len(self.snapshot_results),
-                'successful_snapshots': successful_snapshots,
-                'failed_snapshots': failed_snapshots,
-                'instances': self.snapshot_results
+        snapshot_name, data = self.build_snapshot_request()
+        self.logger.debug("Creating new snapshot for instance %s with name: %s", instance_id, snapshot_name)
+
+        request_id = self.generate_request_id()
+        with log_request(request_id):
+            headers = {
+                'X-Request-ID': request_id
             }
-            
-            # Render template
-            html_content = template.render(**email_data)
-            
-            # Create message
-            msg = MIMEMultipart('alternative')
-            msg['Subject'] = f'Contabo Snapshot Summary - {self.get_current_time().strftime("%Y-%m-%d %H:%M")}'
-            msg['From'] = email_from
-            msg['To'] = admin_email
-            
-            # Attach HTML content
-            msg.attach(MIMEText(html_content, 'html'))
-            
-            # Send email with timeout and proper connection handling
-            self.logger.info(f"Connecting to SMTP server {smtp_server}:{smtp_port}")
-            
-            import socket
-            socket.setdefaulttimeout(30)  # Set 30 second timeout
-            
-            with smtplib.SMTP(smtp_server, smtp_port, timeout=30) as server:
-                server.set_debuglevel(0)  # Disable debug output to reduce noise
-                self.logger.info("Starting TLS connection")
-                server.starttls()
-                self.logger.info(f"Logging in as {smtp_username}")
-                server.login(smtp_username, smtp_password)
-                self.logger.info("Sending email message")
-                server.send_message(msg)
-                self.logger.info("Email sent successfully")
-                
-        except smtplib.SMTPException as e:
-            self.logger.error(f"SMTP error while sending summary email: {str(e)}")
-        except socket.timeout:
-            self.logger.error("SMTP connection timed out")
-        except ValueError as e:
-            self.logger.error(f"Configuration error: {str(e)}")
+            url = self.create_snapshot_url.format(instance_id=instance_id)
+
+            try:
+                response = await self.async_client.post(url, headers=headers, json=data)
+
+                if self.is_snapshot_limit_exceeded(response):
+                    self.logger.info("Snapshot limit exceeded for instance %s. Deleting oldest snapshot...", instance_id)
+                    await self.adelete_snapshots(instance_id)
+                    self.logger.debug("Retrying snapshot creation for instance %s", instance_id)
+                    response = await self.async_client.post(url, headers=headers, json=data)  # Retry creating snapshot
+
+                return self.parse_create_response(instance_id, snapshot_name, response)
+
+            except Exception as e:
+                error_msg = f"Exception while creating snapshot for instance {instance_id}: {str(e)}"
+                self.logger.error(error_msg)
+                return self.build_result(instance_id, snapshot_name, False, 'error', error=error_msg)
+
+    async def asafe_fetch_snapshots(self, instance_id):
+        """
+        Runs afetch_snapshots, logging instead of raising errors, see safe_fetch_snapshots.
+
+        Returns:
+            bool: False if the snapshots could not be fetched, even after the retries of the API client.
+        """
+        try:
+            await self.afetch_snapshots(instance_id)
+            return True
         except Exception as e:
-            self.logger.error(f"Unexpected error while sending summary email: {str(e)}")
-            # Don't re-raise the exception to allow the script to continue
+            self.logger.warning("Failed to fetch snapshots of instance %s: %s", instance_id, e)
+            return False
 
-    def create_snapshot(self, instance_id):
+    async def aprefetch_inventory(self, instances):
         """
-        Creates a new snapshot for a specific instance. If the snapshot limit is exceeded, 
-        it deletes the oldest snapshot before retrying the creation of a new snapshot.
+        Fetches the snapshots of all given instances concurrently into the inventory.
+
+        Instances already in the inventory are not fetched again. An instance that cannot be
+        fetched is logged and left out, see prefetch_inventory.
 
         Parameters:
-            instance_id (str): The unique identifier of the instance for which the snapshot will be created.
+            instances (list): The instances, as returned by list_instances.
 
         Returns:
-            None
+            SnapshotInventory: The inventory.
         """
-        snapshot_name = f"snapshot-{self.get_current_time().strftime('%Y-%m-%d_%H-%M-%S')}"
-        # Ensure snapshot name contains only allowed characters
-        snapshot_name = re.sub(r'[^a-zA-Z0-9 -]', '', snapshot_name)  # Allow letters, numbers, spaces, and dashes
-        self.logger.info(f"Creating new snapshot for instance {instance_id} with name: {snapshot_name}")
+        instance_ids = [instance.get('instanceId') for instance in instances
+                        if instance.get('instanceId') and not self.inventory.has(instance.get('instanceId'))]
+        if instance_ids:
+            self.logger.info(f"Fetching snapshot inventory of {len(instance_ids)} instances")
+            semaphore = asyncio.Semaphore(self.max_concurrency)
 
-        request_id = self.generate_request_id()
-        headers = {
-            'Authorization': f'Bearer {self.access_token}',
-            'Content-Type': 'application/json',
-            'X-Request-ID': request_id
-        }
+            async def bounded(instance_id):
+                async with semaphore:
+                    return await self.asafe_fetch_snapshots(instance_id)
 
-        data = {
-            "name": snapshot_name,
-            "description": f"Automated snapshot taken on {self.get_current_time().strftime('%Y-%m-%d_%H-%M-%S')}"
-        }
+            await asyncio.gather(*(bounded(instance_id) for instance_id in instance_ids))
+            self.logger.info(f"Snapshot inventory holds {len(self.inventory)} instances")
+        return self.inventory
 
-        url = self.create_snapshot_url.format(instance_id=instance_id)
-        
-        try:
-            response = requests.post(url, headers=headers, json=data)
+    async def aplan_rotations(self, instances):
+        """
+        Plans the quota rotations of many instances up front, reading their snapshots from the inventory.
+
+        Parameters:
+            instances (list): The instances, as returned by list_instances.
+
+        Returns:
+            dict: The snapshots to delete, keyed by instanceId. Only instances that need a rotation are included.
+        """
+        candidates = [instance for instance in instances if self.get_snapshot_limit(instance) > 0]
+        if not candidates:
+            return {}
+
+        self.logger.info(f"Planning snapshot rotations for {len(candidates)} instances")
+        await self.aprefetch_inventory(candidates)
+
+        plan = {}
+        for instance in candidates:
+            if not self.inventory.has(instance.get('instanceId')):
+                continue
+            to_delete = self.plan_instance_rotation(instance, self.inventory.get(instance.get('instanceId')))
+            if to_delete:
+                plan[instance.get('instanceId')] = to_delete
+            self.rotated_instances.add(instance.get('instanceId'))
+        self.logger.info(f"{len(plan)} of {len(candidates)} instances are at their snapshot limit")
+        return plan
+
+    async def aexecute_rotations(self, plan):
+        """
+        Deletes the planned snapshots concurrently across instances, see execute_rotations.
+
+        Parameters:
+            plan (dict): The snapshots to delete keyed by instanceId, as returned by aplan_rotations.
+
+        Returns:
+            int: The number of snapshots deleted.
+        """
+        deletions = [(instance_id, snapshot.get('snapshotId')) for instance_id, snapshots in plan.items() for snapshot in snapshots]
+        if not deletions:
+            return 0
 
-            if response.status_code == 402 and "Total snapshots exceed the total max limit" in response.text:
-                self.logger.info(f"Snapshot limit exceeded for instance {instance_id}. Deleting oldest snapshot...")
-                self.delete_snapshots(instance_id)
-                self.logger.info(f"Retrying snapshot creation for instance {instance_id}")
-                response = requests.post(url, headers=headers, json=data)  # Retry creating snapshot
+        self.logger.info(f"Deleting {len(deletions)} snapshots ahead of the creates")
+        semaphore = asyncio.Semaphore(self.max_concurrency)
 
-            if response.status_code == 201:
+        async def bounded(instance_id, snapshot_id):
+            async with semaphore:
                 try:
-                    response_json = response.json()
-                    # The API returns data in a nested structure
-                    snapshot_data = response_json.get('data', [{}])[0] if isinstance(response_json.get('data'), list) else response_json.get('data', {})
-                    
-                    self.logger.info(f"Snapshot {snapshot_name} created successfully for instance {instance_id}!")
-                    self.logger.debug(f"Snapshot response data: {snapshot_data}")
-                    
-                    # Track successful snapshot with more details
-                    self.snapshot_results.append({
-                        'id': instance_id,
-                        'name': snapshot_data.get('name', 'Unknown'),
-                        'success': True,
-                        'snapshot_name': snapshot_name,
-                        'snapshot_id': snapshot_data.get('snapshotId', 'Unknown'),
-                        'timestamp': self.get_current_time().strftime('%Y-%m-%d %H:%M:%S'),
-                        'status': 'success'
-                    })
-                except (KeyError, IndexError, TypeError) as e:
-                    error_msg = f"Error parsing snapshot response: {str(e)}. Response: {response.text}"
-                    self.logger.error(error_msg)
-                    self.snapshot_results.append({
-                        'id': instance_id,
-                        'name': 'Unknown',
-                        'success': False,
-                        'snapshot_name': snapshot_name,
-                        'timestamp': self.get_current_time().strftime('%Y-%m-%d %H:%M:%S'),
-                        'error': error_msg,
-                        'status': 'error'
-                    })
-            else:
-                error_msg = f"Failed to create snapshot. Status code: {response.status_code}, Response: {response.text}"
-                self.logger.error(error_msg)
-                
-                # Track failed snapshot with more details
-                self.snapshot_results.append({
-                    'id': instance_id,
-                    'name': 'Unknown',
-                    'success': False,
-                    'snapshot_name': snapshot_name,
-                    'timestamp': self.get_current_time().strftime('%Y-%m-%d %H:%M:%S'),
-                    'error': error_msg,
-                    'status': 'failed'
-                })
-                
+                    return await self.adelete_snapshot(instance_id, snapshot_id)
+                except Exception as e:
+                    self.logger.error("Failed to delete snapshot %s of instance %s: %s", snapshot_id, instance_id, e)
+                    return False
+
+        return sum(await asyncio.gather(*(bounded(*deletion) for deletion in deletions)))
+
+    async def aexecute_retention(self, plan):
+        """
+        Deletes the snapshots of a retention plan batch by batch, see execute_retention.
+
+        Parameters:
+            plan (dict): The snapshots to delete keyed by instanceId, as returned by plan_retention.
+
+        Returns:
+            int: The number of snapshots deleted.
+        """
+        if self.retention_dry_run:
+            for line in self.format_retention_plan(plan):
+                self.logger.info(f"[dry-run] {line}")
+            return 0
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def bounded(instance_id, snapshot_id):
+            async with semaphore:
+                return await self.adelete_snapshot(instance_id, snapshot_id)
+
+        deleted = 0
+        batches = self.get_retention_batches(plan)
+        for number, batch in enumerate(batches, start=1):
+            self.logger.info(f"Deleting retention batch {number}/{len(batches)} ({len(batch)} snapshots)")
+            deleted += sum(await asyncio.gather(*(bounded(*deletion) for deletion in batch)))
+        return deleted
+
+    @traced('retention')
+    async def aapply_retention(self, results):
+        """
+        Enforces the retention policy on the instances of a run, see apply_retention.
+
+        Parameters:
+            results (list): The result entries of the run.
+
+        Returns:
+            int: The number of snapshots deleted.
+        """
+        if self.retention_policy is None:
+            return 0
+        try:
+            instance_ids = self.get_retention_instance_ids(results)
+            await self.aprefetch_inventory([{'instanceId': instance_id} for instance_id in instance_ids])
+            return await self.aexecute_retention(self.build_retention_plan(instance_ids))
         except Exception as e:
-            error_msg = f"Exception while creating snapshot for instance {instance_id}: {str(e)}"
-            self.logger.error(error_msg)
-            
-            # Track failed snapshot with exception details
-            self.snapshot_results.append({
-                'id': instance_id,
-                'name': 'Unknown',
-                'success': False,
-                'snapshot_name': snapshot_name,
-                'timestamp': self.get_current_time().strftime('%Y-%m-%d %H:%M:%S'),
-                'error': error_msg,
-                'status': 'error'
-            })
+            self.logger.error(f"Failed to apply the retention policy: {e}")
+            return 0
 
-    def manage_snapshots(self):
+    async def aprocess_instances(self, instances):
         """
-        Loops through all instances and manages snapshots (creates and deletes) for each one.
-        
-        This method iterates over all the available instances and performs snapshot management (creation and deletion) 
-        for each instance.
+        Creates (and, when the quota is full, rotates) snapshots for the given instances.
+
+        Up to max_concurrency instances are in flight at once. Instances from an async iterable
+        such as aiter_instances() are started as soon as they arrive. Results are appended to
+        snapshot_results in the same order as the instances were given.
+
+        Parameters:
+            instances (iterable): The instances, as a list or an async iterable.
+
+        Returns:
+            list: The result entries for the processed instances.
+        """
+        self.logger.info(f"Processing instances with up to {self.max_concurrency} in flight")
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def bounded(instance_id):
+            # Each task runs in its own context, so the tag does not leak into other instances
+            log_instance_id.set(instance_id)
+            async with semaphore:
+                with self.tracer.span('instance') as span:
+                    result = await self.asnapshot_instance(instance_id)
+                    result['duration'] = round(span.elapsed(), 3)
+            if self.checkpoint is not None:
+                # Checkpoint stores (e.g. the Django ORM) are blocking
+                await asyncio.to_thread(self.record_checkpoint, result)
+            return result
+
+        tasks = []
+        try:
+            if hasattr(instances, '__aiter__'):
+                async for instance in instances:
+                    if self.should_process(instance):
+                        tasks.append(asyncio.create_task(bounded(instance.get('instanceId'))))
+            else:
+                for instance in instances:
+                    if self.should_process(instance):
+                        tasks.append(asyncio.create_task(bounded(instance.get('instanceId'))))
+        finally:
+            # Collect in submission order, also when the listing failed halfway
+            results = list(await asyncio.gather(*tasks))
+            self.snapshot_results.extend(results)
+        return results
+
+    async def amanage_instances(self, instances):
+        """
+        Manages the snapshots (rotation and creation) of the given instances, without sending the summary email.
+
+        Parameters:
+            instances (iterable): The instances, as a list or an async iterable such as aiter_instances().
+
+        Returns:
+            list: The result entries for the processed instances.
+        """
+        started, first_result = time.monotonic(), len(self.snapshot_results)
+        self.tracer.start_run(engine=type(self).__name__, run_id=str(self.run_id))
+        try:
+            return await self.arun_instances(instances)
+        finally:
+            self.tracer.finish_run()
+            self.observe_run(started, first_result)
+
+    async def arun_instances(self, instances):
+        """
+        Rotates, snapshots, verifies and applies retention to the given instances, see amanage_instances.
+
+        Parameters:
+            instances (iterable): The instances, as a list or an async iterable such as aiter_instances().
+
+        Returns:
+            list: The result entries for the processed instances.
+        """
+        self.rotated_instances.clear()
+        # Tag lookups are blocking, resolve them before should_process runs on the event loop
+        await asyncio.to_thread(self.resolve_instance_tags)
+        skipped = []
+        if self.has_known_snapshot_limits() or self.prefetch_snapshots or self.min_snapshot_age > 0:
+            if hasattr(instances, '__aiter__'):
+                instances = [instance async for instance in instances if self.should_process(instance)]
+            else:
+                instances = [instance for instance in instances if self.should_process(instance)]
+            await self.aprefetch_inventory(instances)
+            # Skipped results may be checkpointed, which blocks
+            instances, skipped = await asyncio.to_thread(self.skip_fresh_instances, instances)
+            # Delete everything that must go before any create, instead of POST -> 402 -> GET -> DELETE -> POST
+            await self.aexecute_rotations(await self.aplan_rotations(instances))
+        results = skipped + await self.aprocess_instances(instances)
+        if self.verify_snapshots_enabled:
+            await self.averify_snapshots(results)
+        await self.aapply_retention(results)
+        return results
+
+    @traced('verify')
+    async def averify_snapshots(self, results):
+        """
+        Waits until the snapshots created in this run are completed on Contabo's side, see verify_snapshots.
+
+        Parameters:
+            results (list): The result entries of the run.
+
+        Returns:
+            list: The results whose status changed.
+        """
+        pending = [result for result in results if result.get('success') and result.get('status') == 'success']
+        if not pending:
+            return []
+        self.logger.info(f"Verifying completion of {len(pending)} snapshots (deadline {self.verify_timeout}s)")
+        statuses = [result['status'] for result in pending]
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def bounded(instance_id):
+            async with semaphore:
+                return await self.asafe_fetch_snapshots(instance_id)
+
+        deadline = time.monotonic() + self.verify_timeout
+        remaining = pending
+        while remaining:
+            await asyncio.sleep(max(0, min(self.verify_interval, deadline - time.monotonic())))
+            instance_ids = [result['id'] for result in remaining]
+            polled = await asyncio.gather(*(bounded(instance_id) for instance_id in instance_ids))
+            unpolled = {instance_id for instance_id, ok in zip(instance_ids, polled) if not ok}
+            remaining = self.apply_verification(remaining, final=time.monotonic() >= deadline, unpolled=unpolled)
+            self.logger.info(f"{len(remaining)} snapshots are still being built")
+        # The checkpoint may block
+        return await asyncio.to_thread(self.record_verification, pending, statuses)
+
+    async def amanage_snapshots(self):
+        """
+        Lists all instances, manages their snapshots concurrently and sends the summary email.
 
         Returns:
             None
+
+        Raises:
+            ContaboApiError: If the instance listing fails; the instances processed so far are still reported.
         """
-        instances = self.list_instances()
-        if instances:
-            for instance in instances:
-                instance_id = instance.get('instanceId')
-                if instance_id:
-                    self.create_snapshot(instance_id)
-            
-            # Send summary email after all operations are complete
-            self.send_summary_email()
+        try:
+            results = await self.amanage_instances(self.aiter_instances())
+        except ContaboApiError as e:
+            self.logger.error(f"Listing instances failed, {len(self.snapshot_results)} instances were processed: {e}")
+            if self.snapshot_results:
+                await asyncio.to_thread(self.send_summary_email)
+            raise
+
+        if results:
+            # SMTP is blocking, keep it off the event loop
+            await asyncio.to_thread(self.send_summary_email)
         else:
             self.logger.info("No instances to manage.")
+
+    def get_concurrency(self):
+        """Returns the number of instances handled at once by aprocess_instances."""
+        return self.max_concurrency
+
+    def process_instances(self, instances):
+        """
+        Blocking entry point for aprocess_instances.
+
+        Parameters:
+            instances (list): The instances, as returned by list_instances.
+
+        Returns:
+            list: The result entries for the processed instances.
+        """
+        return self.run_async(self.aprocess_instances, instances)
+
+    def manage_instances(self, instances):
+        """
+        Blocking entry point for amanage_instances.
+
+        Parameters:
+            instances (list): The instances, as returned by list_instances.
+
+        Returns:
+            list: The result entries for the processed instances.
+        """
+        return self.run_async(self.amanage_instances, instances)
+
+    def manage_snapshots(self):
+        """
+        Blocking entry point for amanage_snapshots, used by the django-q task.
+
+        Returns:
+            None
+        """
+        self.run_async(self.amanage_snapshots)
@@ -1,4 +1,5 @@
 import os
+import json
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -90,6 +91,14 @@ else:
         }
     }
 
+# Cache (shared by all django-q workers, e.g. for the Contabo access token)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'snapshot_manager_cache',
+    }
+}
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -134,10 +143,17 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # Logging configuration
+# LOG_FORMAT=json writes one JSON object per line, with the run_id/instance_id/request_id of the snapshot manager
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'text').lower()
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
     'formatters': {
+        'json': {
+            '()': 'lib.JsonLogFormatter',
+        },
         'verbose': {
             'format': '{levelname} {asctime} {module} {process:d} {thread:d} {message}',
             'style': '{',
@@ -151,14 +167,14 @@ LOGGING = {
     },
     'handlers': {
         'console': {
-            'level': 'INFO',
+            'level': LOG_LEVEL,
             'class': 'logging.StreamHandler',
-            'formatter': 'verbose',
+            'formatter': 'json' if LOG_FORMAT == 'json' else 'verbose',
         },
     },
     'root': {
         'handlers': ['console'],
-        'level': 'INFO',
+        'level': LOG_LEVEL,
     },
     'loggers': {
         'django': {
@@ -193,4 +209,42 @@ Q_CLUSTER = {
     'label': 'Django Q',
     'redis': None,  # Use Django ORM instead of Redis
     'orm': 'default',  # Use default database
-} 
\ No newline at end of file
+} 
+
+# Snapshot engine used by snapshots.tasks.run_snapshot_job: 'sync' (thread pool) or 'async' (asyncio/aiohttp)
+SNAPSHOT_ENGINE = os.environ.get('SNAPSHOT_ENGINE', 'sync').lower()
+
+# Trust snapshots stored by previous runs for this many seconds instead of fetching them again (0 = always fetch)
+SNAPSHOT_INVENTORY_MAX_AGE = int(os.environ.get('SNAPSHOT_INVENTORY_MAX_AGE', '0'))
+
+# Split scheduled runs into django-q shard tasks of this many instances (0 = run the whole fleet in one task)
+SNAPSHOT_SHARD_SIZE = int(os.environ.get('SNAPSHOT_SHARD_SIZE', '0'))
+
+# Schedule window in seconds, aligned to local midnight: a retried job resumes the run of its window.
+# The default matches the 6-hourly schedule; manually queued runs pass force and ignore it (0 = always start a new run)
+SNAPSHOT_RUN_WINDOW = int(os.environ.get('SNAPSHOT_RUN_WINDOW', '21600'))
+
+# Store the results of a resumable run in batches of this many instances
+SNAPSHOT_CHECKPOINT_BATCH = int(os.environ.get('SNAPSHOT_CHECKPOINT_BATCH', '1'))
+
+# Instance filters as JSON, e.g. {"include": {"status": ["running"]}, "exclude": {"displayName": ["test-*"], "tags": ["ephemeral"]}}
+# Enabled InstanceFilterRules from the admin are added to these rules
+SNAPSHOT_INSTANCE_FILTERS = json.loads(os.environ.get('SNAPSHOT_INSTANCE_FILTERS') or '{}')
+
+# Enabled ContaboAccounts (admin) are processed by this many threads of the scheduled job; without
+# accounts the credentials in the environment are used. Reports: 'per-account' or one 'consolidated' report
+SNAPSHOT_ACCOUNT_WORKERS = int(os.environ.get('SNAPSHOT_ACCOUNT_WORKERS', '4'))
+SNAPSHOT_ACCOUNT_REPORT = os.environ.get('SNAPSHOT_ACCOUNT_REPORT', 'per-account').lower()
+
+# Comma separated Fernet keys encrypting the account secrets (the first one encrypts); required to store accounts
+ACCOUNT_ENCRYPTION_KEY = os.environ.get('ACCOUNT_ENCRYPTION_KEY', '')
+
+# Summary reports are sent by the send_run_reports task; failed channels are retried this many times in total,
+# after NOTIFY_RETRY_DELAY seconds doubling per attempt
+NOTIFY_MAX_ATTEMPTS = int(os.environ.get('NOTIFY_MAX_ATTEMPTS', '5'))
+NOTIFY_RETRY_DELAY = int(os.environ.get('NOTIFY_RETRY_DELAY', '60'))
+
+# Prometheus Pushgateway the django-q workers push their metrics to after each run (empty = no push);
+# the web process serves its own metrics at /metrics. Both need prometheus_client.
+PROMETHEUS_PUSHGATEWAY_URL = os.environ.get('PROMETHEUS_PUSHGATEWAY_URL', '')
+PROMETHEUS_PUSH_JOB = os.environ.get('PROMETHEUS_PUSH_JOB', 'contabo_snapshots')
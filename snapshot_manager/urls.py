@@ -1,6 +1,8 @@
 from django.contrib import admin
 from django.urls import path
+from snapshots import views
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', views.metrics, name='metrics'),
 ] 
\ No newline at end of file
@@ -1,3 +1,83 @@
 # Django-Q models are automatically registered by django-q2
 # No need to register them manually here
 # They will be available in the admin interface by default
+from django import forms
+from django.contrib import admin
+from django.core.exceptions import ImproperlyConfigured
+from .fields import get_fernet
+from .models import Run, InstanceResult, Snapshot, InstanceFilterRule, ContaboAccount
+
+
+class InstanceResultInline(admin.TabularInline):
+    model = InstanceResult
+    extra = 0
+    can_delete = False
+    fields = ('instance_id', 'status', 'snapshot_name', 'snapshot_id', 'error', 'created_at')
+    readonly_fields = fields
+
+
+@admin.register(Run)
+class RunAdmin(admin.ModelAdmin):
+    list_display = ('id', 'account', 'started_at', 'finished_at', 'status', 'engine', 'total_instances', 'successful_snapshots', 'failed_snapshots', 'skipped_instances')
+    list_filter = ('status', 'engine', 'account')
+    readonly_fields = ('timings',)
+    inlines = [InstanceResultInline]
+
+
+@admin.register(InstanceResult)
+class InstanceResultAdmin(admin.ModelAdmin):
+    list_display = ('instance_id', 'run', 'status', 'snapshot_name', 'snapshot_id', 'created_at')
+    list_filter = ('status',)
+    search_fields = ('instance_id', 'snapshot_id', 'snapshot_name')
+
+
+@admin.register(Snapshot)
+class SnapshotAdmin(admin.ModelAdmin):
+    list_display = ('snapshot_id', 'account', 'instance_id', 'name', 'created_at', 'last_seen_at')
+    list_filter = ('account',)
+    search_fields = ('instance_id', 'snapshot_id', 'name')
+
+
+@admin.register(InstanceFilterRule)
+class InstanceFilterRuleAdmin(admin.ModelAdmin):
+    list_display = ('action', 'field', 'value', 'enabled', 'description')
+    list_filter = ('action', 'field', 'enabled')
+    list_editable = ('enabled',)
+    search_fields = ('value', 'description')
+
+
+class ContaboAccountForm(forms.ModelForm):
+    """Never renders the stored secrets; leaving a secret empty keeps the stored one."""
+
+    SECRET_FIELDS = ('client_secret', 'api_password')
+
+    client_secret = forms.CharField(widget=forms.PasswordInput, required=False, help_text='Leave empty to keep the stored secret.')
+    api_password = forms.CharField(widget=forms.PasswordInput, required=False, help_text='Leave empty to keep the stored password.')
+
+    class Meta:
+        model = ContaboAccount
+        fields = ('name', 'enabled', 'client_id', 'client_secret', 'api_user', 'api_password')
+
+    def clean(self):
+        cleaned_data = super().clean()
+        for field in self.SECRET_FIELDS:
+            if cleaned_data.get(field):
+                continue
+            if self.instance.pk:
+                cleaned_data[field] = getattr(self.instance, field)
+            else:
+                self.add_error(field, 'This field is required.')
+        try:
+            get_fernet()
+        except ImproperlyConfigured as e:
+            raise forms.ValidationError(str(e))
+        return cleaned_data
+
+
+@admin.register(ContaboAccount)
+class ContaboAccountAdmin(admin.ModelAdmin):
+    form = ContaboAccountForm
+    list_display = ('name', 'client_id', 'api_user', 'enabled', 'created_at')
+    list_filter = ('enabled',)
+    list_editable = ('enabled',)
+    search_fields = ('name', 'client_id', 'api_user')
@@ -0,0 +1,191 @@
+"""
+End-to-end benchmarks of the snapshot managers against the local fake Contabo API.
+
+Each scenario serves a fresh FakeContaboApi from this process and runs the manager in a forked
+child process (where fork is available), so the peak RSS of a scenario is the one of the manager
+and not of the fake server or of earlier scenarios.
+"""
+import logging
+import math
+import multiprocessing
+import os
+import resource
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+
+from lib import ContaboApiClient, ContaboSnapshotManager, AsyncContaboSnapshotManager
+from .fake_api import FakeContaboApi
+
+# Server latency (seconds) and jitter of each latency profile
+LATENCY_PROFILES = {
+    'local': (0.0, 0.0),
+    'lan': (0.005, 0.002),
+    'wan': (0.05, 0.02),
+    'slow': (0.25, 0.1),
+}
+
+ENGINES = {
+    'sync': ContaboSnapshotManager,
+    'async': AsyncContaboSnapshotManager,
+}
+
+# Placeholders for the credentials, which the fake API does not check
+BENCH_ENVIRON = {
+    'CLIENT_ID': 'bench',
+    'CLIENT_SECRET': 'bench',
+    'API_USER': 'bench',
+    'API_PASSWORD': 'bench',
+    'CONTABO_TOKEN_CACHE': 'memory',
+}
+
+
+def percentile(samples, fraction):
+    """
+    Return the nearest-rank percentile of sorted samples, or None if there are none.
+    """
+    if not samples:
+        return None
+    return samples[min(len(samples) - 1, max(0, math.ceil(fraction * len(samples)) - 1))]
+
+
+def summarize_latencies(latencies):
+    """
+    Return count, p50, p95, p99 and max in milliseconds of each endpoint's latencies.
+    """
+    summary = {}
+    for endpoint, samples in sorted(latencies.items()):
+        samples = sorted(samples)
+        summary[endpoint] = {
+            'count': len(samples),
+            'p50_ms': round(percentile(samples, 0.50) * 1000, 2),
+            'p95_ms': round(percentile(samples, 0.95) * 1000, 2),
+            'p99_ms': round(percentile(samples, 0.99) * 1000, 2),
+            'max_ms': round(samples[-1] * 1000, 2),
+        }
+    return summary
+
+
+def get_peak_rss_mb():
+    """
+    Return the peak resident set size of this process in MiB (ru_maxrss is in KiB on Linux, bytes on macOS).
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def run_manager(engine, environ):
+    """
+    Run one manager against the fake API described by environ and measure it.
+    """
+    os.environ.update(environ)
+    manager = ENGINES[engine]()
+    latencies = defaultdict(list)
+    statuses = Counter()
+    lock = threading.Lock()
+
+    def observe(method, url, status_code, seconds):
+        endpoint = ContaboApiClient.get_endpoint(method, url)
+        with lock:
+            latencies[endpoint].append(seconds)
+            statuses[f"{endpoint} {status_code}"] += 1
+
+    manager.api_client.request_hooks.append(observe)
+    started = time.monotonic()
+    if isinstance(manager, AsyncContaboSnapshotManager):
+        # Stream the listing into the run inside the manager's event loop, like amanage_snapshots
+        manager.run_async(manager.amanage_instances, manager.aiter_instances())
+    else:
+        manager.manage_instances(manager.iter_instances())
+    wall_seconds = time.monotonic() - started
+
+    requests_sent = sum(statuses.values())
+    return {
+        'wall_seconds': round(wall_seconds, 3),
+        'requests': requests_sent,
+        'requests_per_second': round(requests_sent / wall_seconds, 1) if wall_seconds else None,
+        'results': dict(Counter(result['status'] for result in manager.snapshot_results)),
+        'endpoints': summarize_latencies(latencies),
+        'statuses': dict(sorted(statuses.items())),
+        'peak_rss_mb': get_peak_rss_mb(),
+    }
+
+
+def run_in_child(connection, engine, environ):
+    try:
+        connection.send(run_manager(engine, environ))
+    except Exception as e:
+        connection.send({'error': repr(e)})
+    finally:
+        connection.close()
+
+
+def run_scenario(engine, fleet_size, profile, quota_full_ratio, environ=None, error_rate=0.0,
+                 throttle_rate=0.0, seed=1, isolate=True):
+    """
+    Benchmark one engine on one fleet against a fresh fake API.
+
+    Parameters:
+        engine (str): 'sync' or 'async'.
+        fleet_size (int): The number of instances of the fake API.
+        profile (str): A key of LATENCY_PROFILES.
+        quota_full_ratio (float): The share of instances whose snapshot quota is full.
+        environ (dict): Extra environment variables for the manager, e.g. SNAPSHOT_MAX_WORKERS.
+        error_rate (float): The share of requests the fake API answers with 500.
+        throttle_rate (float): The share of requests the fake API answers with 429.
+        seed (int): Seed of the fake API.
+        isolate (bool): Run the manager in a forked child process.
+
+    Returns:
+        dict: The scenario and its measurements.
+    """
+    latency, jitter = LATENCY_PROFILES[profile]
+    scenario = {
+        'engine': engine,
+        'fleet_size': fleet_size,
+        'latency_profile': profile,
+        'quota_full_ratio': quota_full_ratio,
+        'error_rate': error_rate,
+        'throttle_rate': throttle_rate,
+    }
+    with FakeContaboApi(fleet_size=fleet_size, quota_full_ratio=quota_full_ratio, latency=latency, jitter=jitter,
+                        error_rate=error_rate, throttle_rate=throttle_rate, retry_after=0.1, seed=seed) as api:
+        manager_environ = {**BENCH_ENVIRON, **(environ or {}), **api.environ()}
+        if isolate and 'fork' in multiprocessing.get_all_start_methods():
+            receiver, sender = multiprocessing.Pipe(duplex=False)
+            child = multiprocessing.get_context('fork').Process(target=run_in_child, args=(sender, engine, manager_environ))
+            child.start()
+            sender.close()
+            measurements = receiver.recv()
+            child.join()
+        else:
+            saved_environ = dict(os.environ)
+            try:
+                measurements = run_manager(engine, manager_environ)
+            finally:
+                os.environ.clear()
+                os.environ.update(saved_environ)
+        measurements['server_requests'] = sum(api.state.requests.values())
+    return {**scenario, **measurements}
+
+
+def run_benchmarks(engines, fleet_sizes, profiles, quota_full_ratios, quiet=True, **options):
+    """
+    Run every combination of engine, fleet size, latency profile and quota-full ratio.
+
+    Manager logging is silenced below WARNING while quiet is set, so logging does not dominate the timings.
+    """
+    previous_level = logging.root.manager.disable
+    if quiet:
+        logging.disable(logging.INFO)
+    try:
+        return [
+            run_scenario(engine, fleet_size, profile, ratio, **options)
+            for engine in engines
+            for fleet_size in fleet_sizes
+            for profile in profiles
+            for ratio in quota_full_ratios
+        ]
+    finally:
+        logging.disable(previous_level)
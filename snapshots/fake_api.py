@@ -0,0 +1,326 @@
+"""
+Local stand-in for the Contabo API, for load and integration testing without api.contabo.com.
+
+The server implements the endpoints used by lib.ContaboSnapshotManager:
+
+    POST   /auth/realms/contabo/protocol/openid-connect/token    password and refresh_token grants
+    GET    /v1/compute/instances?page=&size=                      paginated instance listing
+    GET    /v1/compute/instances/{instanceId}/snapshots           snapshot listing
+    POST   /v1/compute/instances/{instanceId}/snapshots           create, 402 when the quota is full
+    DELETE /v1/compute/instances/{instanceId}/snapshots/{id}      delete
+    GET    /v1/tags?name=, GET /v1/tags/{tagId}/assignments       tag lookups
+
+Latency, server errors, 429 throttling, dropped connections and the fleet size are configurable. Point the manager at
+it with CONTABO_API_URL=<url> and CONTABO_AUTH_URL=<url>/auth/realms/contabo/protocol/openid-connect/token,
+or run it with python manage.py fake_contabo_api.
+"""
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+TOKEN_PATH = '/auth/realms/contabo/protocol/openid-connect/token'
+SNAPSHOTS_PATH = re.compile(r'^/v1/compute/instances/(?P<instance_id>\d+)/snapshots(?:/(?P<snapshot_id>[^/]+))?$')
+TAG_ASSIGNMENTS_PATH = re.compile(r'^/v1/tags/(?P<tag_id>\d+)/assignments$')
+QUOTA_MESSAGE = 'Total snapshots exceed the total max limit'
+
+
+class FakeContaboState:
+    """
+    The fleet, snapshots and issued tokens of a FakeContaboApi, plus per-endpoint request counts.
+    """
+
+    def __init__(self, fleet_size=100, snapshot_limit=2, quota_full_ratio=0.0, tags=None, token_ttl=300, seed=None):
+        """
+        Creates the fleet.
+
+        Parameters:
+            fleet_size (int): The number of instances, with instanceIds 1..fleet_size.
+            snapshot_limit (int): The snapshots per instance before creates are rejected with 402.
+            quota_full_ratio (float): The share of instances that start with a full snapshot quota.
+            tags (dict): instanceIds per tag name, e.g. {"ephemeral": [1, 2]}.
+            token_ttl (int): The lifetime of access tokens in seconds.
+            seed (int): Seed of the random generator, for reproducible fleets and failures.
+        """
+        self.random = random.Random(seed)
+        self.snapshot_limit = snapshot_limit
+        self.token_ttl = token_ttl
+        self.lock = threading.Lock()
+        self.tokens = {}
+        self.requests = Counter()
+        regions = ('EU', 'US-central', 'SIN')
+        self.instances = [
+            {
+                'instanceId': instance_id,
+                'displayName': f"vm-{instance_id}",
+                'name': f"vmi{instance_id}",
+                'region': regions[instance_id % len(regions)],
+                'productId': 'V45',
+                'status': 'running',
+            }
+            for instance_id in range(1, fleet_size + 1)
+        ]
+        now = datetime.now(timezone.utc)
+        self.snapshots = {}
+        for instance in self.instances:
+            count = snapshot_limit if self.random.random() < quota_full_ratio else 0
+            self.snapshots[instance['instanceId']] = [
+                self.build_snapshot(instance['instanceId'], f"seed-{number}", now - timedelta(days=count - number))
+                for number in range(count)
+            ]
+        self.tags = {name.lower(): (tag_id, [int(instance_id) for instance_id in instance_ids])
+                     for tag_id, (name, instance_ids) in enumerate((tags or {}).items(), start=1)}
+
+    def build_snapshot(self, instance_id, name, created_date):
+        return {
+            'snapshotId': f"snap{uuid.uuid4().hex[:20]}",
+            'instanceId': instance_id,
+            'name': name,
+            'description': '',
+            'createdDate': created_date.strftime('%Y-%m-%dT%H:%M:%S.000Z'),
+        }
+
+    def issue_token(self):
+        """Returns a token response with a new access and refresh token."""
+        access_token = uuid.uuid4().hex
+        with self.lock:
+            self.tokens[access_token] = time.time() + self.token_ttl
+        return {
+            'access_token': access_token,
+            'expires_in': self.token_ttl,
+            'refresh_token': uuid.uuid4().hex,
+            'refresh_expires_in': self.token_ttl * 6,
+            'token_type': 'Bearer',
+        }
+
+    def is_authorized(self, header):
+        """Returns True if the Authorization header carries an unexpired access token."""
+        token = (header or '').removeprefix('Bearer ')
+        return self.tokens.get(token, 0) > time.time()
+
+
+class FakeContaboHandler(BaseHTTPRequestHandler):
+    """Request handler of FakeContaboApi; the server holds the state and the fault settings."""
+
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately; without TCP_NODELAY delayed ACKs add ~40 ms per response
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def state(self):
+        return self.server.state
+
+    def send_json(self, status, body=None, headers=None):
+        payload = json.dumps(body).encode() if body is not None else b''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+        with self.state.lock:
+            self.state.requests[(self.command, self.endpoint, status)] += 1
+
+    def read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def route(self, path):
+        if path == TOKEN_PATH:
+            return 'token'
+        if path == '/v1/compute/instances':
+            return 'instances'
+        match = SNAPSHOTS_PATH.match(path)
+        if match:
+            return 'snapshot' if match.group('snapshot_id') else 'snapshots'
+        if path == '/v1/tags':
+            return 'tags'
+        if TAG_ASSIGNMENTS_PATH.match(path):
+            return 'tag_assignments'
+        return 'unknown'
+
+    def handle_request(self):
+        url = urlparse(self.path)
+        self.endpoint = self.route(url.path)
+        body = self.read_body()
+        server = self.server
+
+        if server.latency:
+            time.sleep(max(0.0, server.latency + self.state.random.uniform(-server.jitter, server.jitter)))
+        if self.endpoint != 'token' and self.state.random.random() < server.disconnect_rate:
+            return self.drop_connection()
+        if self.command == 'GET' and self.endpoint == 'snapshots' and \
+                int(SNAPSHOTS_PATH.match(url.path).group('instance_id')) in server.broken_listings:
+            return self.drop_connection()
+        if self.command == 'DELETE' and self.endpoint == 'snapshot' and \
+                int(SNAPSHOTS_PATH.match(url.path).group('instance_id')) in server.broken_deletes:
+            return self.drop_connection()
+        if self.endpoint != 'token' and self.state.random.random() < server.throttle_rate:
+            return self.send_json(429, {'message': 'Too Many Requests'}, {'Retry-After': str(server.retry_after)})
+        if self.state.random.random() < server.error_rate:
+            return self.send_json(500, {'message': 'Internal Server Error'})
+        if self.endpoint == 'unknown':
+            return self.send_json(404, {'message': 'Not Found'})
+        if self.endpoint == 'token':
+            return self.send_json(200, self.state.issue_token())
+        if not self.state.is_authorized(self.headers.get('Authorization')):
+            return self.send_json(401, {'message': 'Unauthorized'})
+        return getattr(self, f"{self.command.lower()}_{self.endpoint}", self.not_allowed)(url, body)
+
+    do_GET = do_POST = do_DELETE = handle_request
+
+    def drop_connection(self):
+        # Close the connection without an answer, as a reset connection or a crashed proxy would
+        self.close_connection = True
+        with self.state.lock:
+            self.state.requests[(self.command, self.endpoint, 'disconnect')] += 1
+
+    def not_allowed(self, url, body):
+        self.send_json(405, {'message': 'Method Not Allowed'})
+
+    def get_instances(self, url, body):
+        query = parse_qs(url.query)
+        size = max(1, int(query.get('size', ['100'])[0]))
+        page = max(1, int(query.get('page', ['1'])[0]))
+        total = len(self.state.instances)
+        total_pages = max(1, (total + size - 1) // size)
+        next_link = f"/v1/compute/instances?page={page + 1}&size={size}" if page < total_pages else None
+        self.send_json(200, {
+            'data': self.state.instances[(page - 1) * size:page * size],
+            '_pagination': {'size': size, 'totalElements': total, 'totalPages': total_pages, 'page': page},
+            '_links': {'first': f"/v1/compute/instances?page=1&size={size}", 'next': next_link},
+        })
+
+    def get_snapshots(self, url, body):
+        instance_id = int(SNAPSHOTS_PATH.match(url.path).group('instance_id'))
+        if instance_id not in self.state.snapshots:
+            return self.send_json(404, {'message': 'Instance not found'})
+        with self.state.lock:
+            snapshots = list(self.state.snapshots[instance_id])
+        self.send_json(200, {'data': snapshots, '_pagination': {'size': len(snapshots), 'totalElements': len(snapshots), 'totalPages': 1, 'page': 1}})
+
+    def post_snapshots(self, url, body):
+        instance_id = int(SNAPSHOTS_PATH.match(url.path).group('instance_id'))
+        if instance_id not in self.state.snapshots:
+            return self.send_json(404, {'message': 'Instance not found'})
+        try:
+            request = json.loads(body or b'{}')
+        except ValueError:
+            return self.send_json(400, {'message': 'Invalid JSON'})
+        with self.state.lock:
+            snapshots = self.state.snapshots[instance_id]
+            if len(snapshots) >= self.state.snapshot_limit:
+                full = True
+            else:
+                full = False
+                snapshot = self.state.build_snapshot(instance_id, request.get('name', ''), datetime.now(timezone.utc))
+                snapshot['description'] = request.get('description', '')
+                snapshots.append(snapshot)
+        if full:
+            return self.send_json(402, {'statusCode': 402, 'message': QUOTA_MESSAGE})
+        self.send_json(201, {'data': [snapshot]})
+
+    def delete_snapshot(self, url, body):
+        match = SNAPSHOTS_PATH.match(url.path)
+        instance_id, snapshot_id = int(match.group('instance_id')), match.group('snapshot_id')
+        with self.state.lock:
+            snapshots = self.state.snapshots.get(instance_id, [])
+            remaining = [snapshot for snapshot in snapshots if snapshot['snapshotId'] != snapshot_id]
+            self.state.snapshots[instance_id] = remaining
+        if len(remaining) == len(snapshots):
+            return self.send_json(404, {'message': 'Snapshot not found'})
+        self.send_json(204)
+
+    def get_tags(self, url, body):
+        name = parse_qs(url.query).get('name', [''])[0].lower()
+        tags = [{'tagId': tag_id, 'name': tag_name} for tag_name, (tag_id, _) in self.state.tags.items() if not name or tag_name == name]
+        self.send_json(200, {'data': tags, '_pagination': {'totalPages': 1, 'page': 1}})
+
+    def get_tag_assignments(self, url, body):
+        tag_id = int(TAG_ASSIGNMENTS_PATH.match(url.path).group('tag_id'))
+        instance_ids = next((ids for known_id, ids in self.state.tags.values() if known_id == tag_id), [])
+        assignments = [{'tagId': tag_id, 'resourceType': 'instance', 'resourceId': str(instance_id)} for instance_id in instance_ids]
+        self.send_json(200, {'data': assignments, '_pagination': {'totalPages': 1, 'page': 1}})
+
+
+class FakeContaboApi(ThreadingHTTPServer):
+    """
+    FakeContaboApi serves the fake Contabo API from a background thread or the foreground.
+
+    Example:
+        with FakeContaboApi(fleet_size=1000, latency=0.05, throttle_rate=0.01) as api:
+            os.environ.update(api.environ())
+            ContaboSnapshotManager().manage_snapshots()
+    """
+
+    daemon_threads = True
+    # Thousands of concurrent keep-alive clients
+    request_queue_size = 1024
+
+    def __init__(self, host='127.0.0.1', port=0, fleet_size=100, snapshot_limit=2, quota_full_ratio=0.0,
+                 latency=0.0, jitter=0.0, error_rate=0.0, throttle_rate=0.0, retry_after=1,
+                 tags=None, token_ttl=300, seed=None, disconnect_rate=0.0, broken_listings=None,
+                 broken_deletes=None):
+        """
+        Creates the server; port 0 picks a free port.
+
+        Parameters:
+            latency (float): Seconds every request waits before it is answered.
+            jitter (float): Maximum deviation in seconds from latency, drawn uniformly.
+            error_rate (float): The share of requests answered with 500.
+            throttle_rate (float): The share of API requests answered with 429 and Retry-After.
+            retry_after (float): The Retry-After of throttled requests in seconds.
+            disconnect_rate (float): The share of API requests whose connection is closed without an answer.
+            broken_listings (list): instanceIds whose snapshot listing always closes the connection.
+            broken_deletes (list): instanceIds whose snapshot deletes always close the connection.
+
+        See FakeContaboState for the remaining parameters.
+        """
+        super().__init__((host, port), FakeContaboHandler)
+        self.state = FakeContaboState(fleet_size, snapshot_limit, quota_full_ratio, tags, token_ttl, seed)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.disconnect_rate = disconnect_rate
+        self.broken_listings = set(broken_listings or ())
+        self.broken_deletes = set(broken_deletes or ())
+        self.thread = None
+
+    @property
+    def url(self):
+        """The base URL of the server, for CONTABO_API_URL."""
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def environ(self):
+        """Returns the environment variables that point ContaboSnapshotManager at this server."""
+        return {'CONTABO_API_URL': self.url, 'CONTABO_AUTH_URL': self.url + TOKEN_PATH}
+
+    def start(self):
+        """Serves requests from a daemon thread and returns the server."""
+        self.thread = threading.Thread(target=self.serve_forever, name='fake-contabo-api', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """Stops serving and closes the socket."""
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
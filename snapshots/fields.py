@@ -0,0 +1,47 @@
+"""
+Model fields of the snapshots app.
+"""
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import models
+
+try:
+    from cryptography.fernet import Fernet, MultiFernet
+except ImportError:  # Only required to store account secrets
+    Fernet = MultiFernet = None
+
+
+def get_fernet():
+    """
+    Return the Fernet that encrypts stored secrets.
+
+    settings.ACCOUNT_ENCRYPTION_KEY holds comma separated Fernet keys: the first one encrypts, all
+    of them decrypt, so keys can be rotated. There is no fallback key: one derived from SECRET_KEY
+    would be public wherever SECRET_KEY keeps its committed default.
+    """
+    if Fernet is None:
+        raise ImproperlyConfigured("Storing account secrets requires cryptography. Install it with: pip install cryptography")
+    keys = [key.strip() for key in getattr(settings, 'ACCOUNT_ENCRYPTION_KEY', '').split(',') if key.strip()]
+    if not keys:
+        raise ImproperlyConfigured(
+            "Storing account secrets requires ACCOUNT_ENCRYPTION_KEY. Generate one with: "
+            "python -c 'from cryptography.fernet import Fernet; print(Fernet.generate_key().decode())'"
+        )
+    return MultiFernet([Fernet(key) for key in keys])
+
+
+class EncryptedTextField(models.TextField):
+    """
+    A TextField stored encrypted with Fernet, see get_fernet. Reads return the plain text.
+    """
+
+    def from_db_value(self, value, expression, connection):
+        if not value:
+            return value
+        return get_fernet().decrypt(value.encode()).decode()
+
+    def get_prep_value(self, value):
+        value = super().get_prep_value(value)
+        if not value:
+            return value
+        return get_fernet().encrypt(value.encode()).decode()
@@ -0,0 +1,285 @@
+"""
+Persistence of snapshot runs, per-instance results and the known snapshot inventory.
+"""
+import logging
+import threading
+from datetime import datetime, timedelta
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from lib import SnapshotInventory
+from .models import Run, InstanceResult, Snapshot
+
+logger = logging.getLogger(__name__)
+
+
+def get_window_start(now=None):
+    """
+    Return the start of the schedule window that now falls in, or None if windows are disabled.
+
+    Windows are settings.SNAPSHOT_RUN_WINDOW seconds long and aligned to local midnight, so
+    a window of 21600 seconds (6 hours) matches the '0 */6 * * *' schedule.
+    """
+    window = getattr(settings, 'SNAPSHOT_RUN_WINDOW', 0)
+    if not window:
+        return None
+    now = timezone.localtime(now or timezone.now())
+    midnight = timezone.make_aware(datetime.combine(now.date(), datetime.min.time()), now.tzinfo)
+    elapsed = int((now - midnight).total_seconds())
+    return midnight + timedelta(seconds=elapsed - elapsed % window)
+
+
+def start_or_resume_run(engine, account=None, force=False):
+    """
+    Return the Run of the current schedule window of the account, creating it if there is none yet.
+
+    An unfinished or failed run of the window, or one with failed instances, is reopened: its
+    failed instance results are dropped so those instances are tried again, while its successful
+    ones are kept. A run that completed without failures is returned as is, and the caller
+    should not run the window again. With force, or without windows, a new run outside of any
+    window is started.
+    """
+    window_start = None if force else get_window_start()
+    if window_start is None:
+        return Run.objects.create(engine=engine, account=account)
+
+    with transaction.atomic():
+        run = Run.objects.select_for_update().filter(window_start=window_start, account=account).order_by('-started_at').first()
+        if run is None:
+            return Run.objects.create(engine=engine, window_start=window_start, account=account)
+        if run.status == Run.STATUS_COMPLETED and not run.failed_snapshots:
+            return run
+        dropped, _ = run.results.filter(success=False).delete()
+        run.status = Run.STATUS_RUNNING
+        run.error = ''
+        run.finished_at = None
+        run.save(update_fields=['status', 'error', 'finished_at'])
+    logger.info(f"Resuming run {run.pk} of window {window_start:%Y-%m-%d %H:%M} ({dropped} failed results dropped)")
+    return run
+
+
+class RunCheckpoint:
+    """
+    Persists the results of a run while it progresses, so a retried job only handles pending instances.
+
+    Used as ContaboSnapshotManager.checkpoint. Results are written in batches of batch_size
+    (settings.SNAPSHOT_CHECKPOINT_BATCH); results not yet flushed are lost if the worker dies.
+    """
+
+    def __init__(self, run, batch_size=None):
+        self.run = run
+        self.batch_size = batch_size or getattr(settings, 'SNAPSHOT_CHECKPOINT_BATCH', 1)
+        self.done = set(run.results.filter(success=True).values_list('instance_id', flat=True))
+        self.pending = []
+        self.lock = threading.Lock()
+
+    def is_done(self, instance_id):
+        """
+        Return True if the instance already has a successful snapshot in this run.
+        """
+        return str(instance_id) in self.done
+
+    def record(self, result):
+        """
+        Queue the result of an instance and flush once batch_size results are pending.
+        """
+        with self.lock:
+            self.pending.append(result)
+            if result.get('success'):
+                self.done.add(str(result.get('id')))
+            if len(self.pending) >= self.batch_size:
+                self.flush_locked()
+
+    def flush(self):
+        """
+        Store all pending results.
+        """
+        with self.lock:
+            self.flush_locked()
+
+    def flush_locked(self):
+        if not self.pending:
+            return
+        InstanceResult.objects.bulk_create(build_instance_results(self.run, self.pending), batch_size=500)
+        self.pending = []
+
+    def update(self, results):
+        """
+        Store the new status of results that were already recorded, e.g. after snapshot verification.
+        """
+        with self.lock:
+            self.flush_locked()
+            for result in results:
+                if not result.get('success'):
+                    self.done.discard(str(result.get('id')))
+                self.run.results.filter(
+                    instance_id=str(result.get('id')),
+                    snapshot_id=str(result.get('snapshot_id') or ''),
+                ).update(
+                    status=result.get('status', ''),
+                    success=result.get('success', False),
+                    error=result.get('error') or '',
+                )
+
+    def get_done_results(self):
+        """
+        Return the stored successful results of the run as snapshot_results entries.
+        """
+        return [result.to_result() for result in self.run.results.filter(success=True).order_by('id')]
+
+
+def build_instance_results(run, results):
+    """
+    Build (unsaved) InstanceResult objects from snapshot_results entries.
+    """
+    return [
+        InstanceResult(
+            run=run,
+            instance_id=str(result.get('id')),
+            status=result.get('status', ''),
+            success=result.get('success', False),
+            snapshot_name=result.get('snapshot_name') or '',
+            snapshot_id=str(result.get('snapshot_id') or ''),
+            error=result.get('error') or '',
+        )
+        for result in results
+    ]
+
+
+def save_inventory(inventory, account=None):
+    """
+    Replace the stored snapshots of every instance in the inventory of the account, in bulk.
+
+    Instance ids are only unique within an account, so the snapshots of the other accounts
+    are left alone. Without an account, the account configured in the environment is meant.
+    """
+    instance_ids = [str(instance_id) for instance_id in inventory.instance_ids()]
+    if not instance_ids:
+        return 0
+
+    now = timezone.now()
+    snapshots = [
+        Snapshot(
+            snapshot_id=str(snapshot.get('snapshotId')),
+            instance_id=str(instance_id),
+            name=snapshot.get('name') or '',
+            description=snapshot.get('description') or '',
+            created_at=SnapshotInventory.parse_created_date(snapshot),
+            last_seen_at=now,
+            account=account,
+        )
+        for instance_id in instance_ids
+        for snapshot in inventory.get(instance_id)
+        if snapshot.get('snapshotId')
+    ]
+    Snapshot.objects.filter(account=account, instance_id__in=instance_ids).delete()
+    Snapshot.objects.bulk_create(snapshots, batch_size=500, ignore_conflicts=True)
+    return len(snapshots)
+
+
+def merge_timings(timings, summary, slowest=10):
+    """
+    Merge a timing summary (see lib.SnapshotTracer.summary) into the stored timings of a run.
+
+    Phase counts and totals add up, the slowest instances are merged and the wall time is
+    the longest one, as the shards of a run run side by side.
+    """
+    if not timings:
+        return summary
+    phases = {phase: dict(timing) for phase, timing in timings.get('phases', {}).items()}
+    for phase, timing in summary.get('phases', {}).items():
+        merged = phases.setdefault(phase, {'count': 0, 'total_seconds': 0, 'max_seconds': 0})
+        merged['count'] += timing['count']
+        merged['total_seconds'] = round(merged['total_seconds'] + timing['total_seconds'], 3)
+        merged['max_seconds'] = max(merged['max_seconds'], timing['max_seconds'])
+    instances = timings.get('slowest_instances', []) + summary.get('slowest_instances', [])
+    return {
+        'trace_id': timings.get('trace_id'),
+        'wall_seconds': max(timings.get('wall_seconds') or 0, summary.get('wall_seconds') or 0),
+        'phases': dict(sorted(phases.items(), key=lambda item: item[1]['total_seconds'], reverse=True)),
+        'slowest_instances': sorted(instances, key=lambda instance: instance['seconds'], reverse=True)[:slowest],
+    }
+
+
+def record_timings(run, manager):
+    """
+    Add the timing summary of a manager to its Run. The Run row is locked, so shards finishing
+    at the same time do not overwrite each other.
+    """
+    with transaction.atomic():
+        locked = Run.objects.select_for_update().get(pk=run.pk)
+        locked.timings = merge_timings(locked.timings, manager.tracer.summary(), manager.tracer.slowest)
+        locked.save(update_fields=['timings'])
+    run.timings = locked.timings
+
+
+def record_results(run, manager):
+    """
+    Store the results and snapshot inventory of a manager in bulk, e.g. for one shard of a run.
+
+    With a checkpoint, the results were already stored as they came in and only the pending
+    ones are flushed.
+    """
+    with transaction.atomic():
+        if manager.checkpoint is not None:
+            manager.checkpoint.flush()
+        else:
+            InstanceResult.objects.bulk_create(build_instance_results(run, manager.snapshot_results), batch_size=500)
+        saved_snapshots = save_inventory(manager.inventory, run.account)
+    record_timings(run, manager)
+    logger.info(f"Saved {len(manager.snapshot_results)} instance results and {saved_snapshots} known snapshots of run {run.pk}")
+
+
+def close_run(run, error=None):
+    """
+    Close a Run, counting its stored instance results.
+    """
+    results = run.results.all()
+    run.finished_at = timezone.now()
+    run.status = Run.STATUS_FAILED if error else Run.STATUS_COMPLETED
+    run.error = str(error) if error else ''
+    run.total_instances = results.count()
+    run.successful_snapshots = results.filter(success=True).count()
+    run.skipped_instances = results.filter(status=InstanceResult.STATUS_SKIPPED).count()
+    run.failed_snapshots = run.total_instances - run.successful_snapshots - run.skipped_instances
+    run.save()
+    return run
+
+
+def finish_run(run, manager, error=None):
+    """
+    Store the results and snapshot inventory of a finished run in bulk and close the Run.
+    """
+    record_results(run, manager)
+    return close_run(run, error)
+
+
+def get_run_results(run):
+    """
+    Return the stored results of a run as snapshot_results entries, in instance order.
+    """
+    return [result.to_result() for result in run.results.order_by('id')]
+
+
+def load_inventory(max_age=None, account=None):
+    """
+    Build a SnapshotInventory from the stored snapshots of the account seen within max_age seconds.
+
+    Instances in the returned inventory are not fetched again by the manager, so only
+    recently seen snapshots should be trusted. Returns an empty inventory if max_age is 0.
+    """
+    if max_age is None:
+        max_age = getattr(settings, 'SNAPSHOT_INVENTORY_MAX_AGE', 0)
+    inventory = SnapshotInventory()
+    if not max_age:
+        return inventory
+
+    snapshots_by_instance = {}
+    recent_snapshots = Snapshot.objects.filter(account=account, last_seen_at__gte=timezone.now() - timedelta(seconds=max_age))
+    for snapshot in recent_snapshots.iterator():
+        snapshots_by_instance.setdefault(snapshot.instance_id, []).append(snapshot.to_api())
+    for instance_id, snapshots in snapshots_by_instance.items():
+        inventory.set(instance_id, snapshots)
+
+    logger.info(f"Loaded known snapshots of {len(inventory)} instances (seen in the last {max_age}s)")
+    return inventory
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from snapshots import history
+from snapshots.tasks import get_snapshot_manager
+
+
+class Command(BaseCommand):
+    help = 'Apply the snapshot retention policy (SNAPSHOT_KEEP_* / SNAPSHOT_MAX_AGE / SNAPSHOT_PINNED) to all instances'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only print the snapshots that would be deleted',
+        )
+
+    def handle(self, *args, **options):
+        manager = get_snapshot_manager()
+        if manager.retention_policy is None:
+            raise CommandError('No retention policy configured. Set SNAPSHOT_KEEP_HOURLY, SNAPSHOT_KEEP_DAILY, SNAPSHOT_KEEP_WEEKLY or SNAPSHOT_MAX_AGE.')
+
+        manager.inventory = history.load_inventory()
+        instance_ids = [instance.get('instanceId') for instance in manager.list_instances() if manager.should_process(instance)]
+        plan = manager.plan_retention(instance_ids)
+
+        self.stdout.write(f"=== Retention plan for {len(instance_ids)} instances ===")
+        for line in manager.format_retention_plan(plan):
+            self.stdout.write(line)
+        total = sum(map(len, plan.values()))
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING(f'Dry run: {total} snapshots of {len(plan)} instances would be deleted.'))
+            return
+
+        deleted = manager.execute_retention(plan)
+        history.save_inventory(manager.inventory)
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} of {total} snapshots.'))
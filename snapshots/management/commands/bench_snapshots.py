@@ -0,0 +1,90 @@
+import json
+import platform
+from datetime import datetime, timezone
+
+from django.core.management.base import BaseCommand, CommandError
+
+from snapshots.bench import ENGINES, LATENCY_PROFILES, run_benchmarks
+
+
+def parse_list(value, cast=str):
+    return [cast(item.strip()) for item in value.split(',') if item.strip()]
+
+
+class Command(BaseCommand):
+    help = 'Benchmark full snapshot runs against the local fake Contabo API'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--engines', default='sync,async', help='Comma separated engines: sync, async')
+        parser.add_argument('--fleets', default='10,100,1000,5000', help='Comma separated fleet sizes')
+        parser.add_argument('--latency-profiles', default='lan,wan', help=f"Comma separated profiles: {', '.join(LATENCY_PROFILES)}")
+        parser.add_argument('--quota-full-ratios', default='0,0.5', help='Comma separated shares of instances with a full snapshot quota')
+        parser.add_argument('--error-rate', type=float, default=0.0, help='Share of requests the fake API answers with 500')
+        parser.add_argument('--throttle-rate', type=float, default=0.0, help='Share of requests the fake API answers with 429')
+        parser.add_argument('--rate-limit', default='0', help='CONTABO_RATE_LIMIT of the manager (0 disables the client rate limit)')
+        parser.add_argument('--max-workers', default=None, help='SNAPSHOT_MAX_WORKERS of the sync engine')
+        parser.add_argument('--async-concurrency', default=None, help='SNAPSHOT_ASYNC_CONCURRENCY of the async engine')
+        parser.add_argument('--seed', type=int, default=1, help='Seed of the fake API')
+        parser.add_argument('--no-isolate', action='store_true', help='Run the managers in this process instead of forked children')
+        parser.add_argument('--json', dest='json_path', default=None, help="Write the report as JSON to this file ('-' for stdout)")
+        parser.add_argument('--verbose', action='store_true', help='Keep the INFO logging of the managers')
+
+    def handle(self, *args, **options):
+        engines = parse_list(options['engines'])
+        profiles = parse_list(options['latency_profiles'])
+        unknown = [engine for engine in engines if engine not in ENGINES] + [profile for profile in profiles if profile not in LATENCY_PROFILES]
+        if unknown:
+            raise CommandError(f"Unknown engines or latency profiles: {', '.join(unknown)}")
+
+        environ = {'CONTABO_RATE_LIMIT': options['rate_limit']}
+        if options['max_workers']:
+            environ['SNAPSHOT_MAX_WORKERS'] = options['max_workers']
+        if options['async_concurrency']:
+            environ['SNAPSHOT_ASYNC_CONCURRENCY'] = options['async_concurrency']
+
+        scenarios = run_benchmarks(
+            engines,
+            parse_list(options['fleets'], int),
+            profiles,
+            parse_list(options['quota_full_ratios'], float),
+            quiet=not options['verbose'],
+            environ=environ,
+            error_rate=options['error_rate'],
+            throttle_rate=options['throttle_rate'],
+            seed=options['seed'],
+            isolate=not options['no_isolate'],
+        )
+
+        report = {
+            'generated_at': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'environ': environ,
+            'scenarios': scenarios,
+        }
+        if options['json_path'] == '-':
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        if options['json_path']:
+            with open(options['json_path'], 'w') as report_file:
+                json.dump(report, report_file, indent=2)
+
+        for scenario in scenarios:
+            if 'error' in scenario:
+                self.stdout.write(self.style.ERROR(
+                    f"{scenario['engine']:<5} fleet={scenario['fleet_size']:<5} {scenario['latency_profile']:<5} "
+                    f"quota_full={scenario['quota_full_ratio']:<4} failed: {scenario['error']}"
+                ))
+                continue
+            self.stdout.write(self.style.SUCCESS(
+                f"{scenario['engine']:<5} fleet={scenario['fleet_size']:<5} {scenario['latency_profile']:<5} "
+                f"quota_full={scenario['quota_full_ratio']:<4} wall={scenario['wall_seconds']:>8.2f}s "
+                f"requests={scenario['requests']:<6} req/s={scenario['requests_per_second']:<8} peak_rss={scenario['peak_rss_mb']}MiB"
+            ))
+            for endpoint, latency in scenario['endpoints'].items():
+                self.stdout.write(
+                    f"    {endpoint:<55} n={latency['count']:<6} p50={latency['p50_ms']:>8.2f}ms "
+                    f"p95={latency['p95_ms']:>8.2f}ms p99={latency['p99_ms']:>8.2f}ms"
+                )
+        if options['json_path']:
+            self.stdout.write(f"Report written to {options['json_path']}")
@@ -0,0 +1,54 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from snapshots.fake_api import FakeContaboApi
+
+
+class Command(BaseCommand):
+    help = 'Serve a local stand-in for the Contabo API, for load and integration testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1', help='Address to listen on')
+        parser.add_argument('--port', type=int, default=8089, help='Port to listen on (0 picks a free port)')
+        parser.add_argument('--fleet-size', type=int, default=100, help='Number of instances')
+        parser.add_argument('--snapshot-limit', type=int, default=2, help='Snapshots per instance before creates fail with 402')
+        parser.add_argument('--quota-full-ratio', type=float, default=0.0, help='Share of instances that start with a full snapshot quota')
+        parser.add_argument('--latency', type=float, default=0.0, help='Seconds every request waits before it is answered')
+        parser.add_argument('--jitter', type=float, default=0.0, help='Maximum deviation in seconds from --latency')
+        parser.add_argument('--error-rate', type=float, default=0.0, help='Share of requests answered with 500')
+        parser.add_argument('--throttle-rate', type=float, default=0.0, help='Share of API requests answered with 429')
+        parser.add_argument('--disconnect-rate', type=float, default=0.0, help='Share of API requests whose connection is closed without an answer')
+        parser.add_argument('--retry-after', type=float, default=1, help='Retry-After of throttled requests in seconds')
+        parser.add_argument('--tags', default='', help='instanceIds per tag name as JSON, e.g. {"ephemeral": [1, 2]}')
+        parser.add_argument('--token-ttl', type=int, default=300, help='Lifetime of access tokens in seconds')
+        parser.add_argument('--seed', type=int, default=None, help='Seed for reproducible fleets and failures')
+
+    def handle(self, *args, **options):
+        api = FakeContaboApi(
+            host=options['host'],
+            port=options['port'],
+            fleet_size=options['fleet_size'],
+            snapshot_limit=options['snapshot_limit'],
+            quota_full_ratio=options['quota_full_ratio'],
+            latency=options['latency'],
+            jitter=options['jitter'],
+            error_rate=options['error_rate'],
+            throttle_rate=options['throttle_rate'],
+            retry_after=options['retry_after'],
+            tags=json.loads(options['tags']) if options['tags'] else None,
+            token_ttl=options['token_ttl'],
+            seed=options['seed'],
+            disconnect_rate=options['disconnect_rate'],
+        )
+        self.stdout.write(self.style.SUCCESS(f"Fake Contabo API with {options['fleet_size']} instances listening on {api.url}"))
+        self.stdout.write('Point the snapshot manager at it with:')
+        for name, value in api.environ().items():
+            self.stdout.write(f"  export {name}={value}")
+        try:
+            api.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            api.server_close()
+            self.stdout.write('Stopped.')
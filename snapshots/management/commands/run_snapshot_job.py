@@ -1,5 +1,6 @@
 from django.core.management.base import BaseCommand
 import logging
+import json
 import sys
 import os
 from datetime import datetime
@@ -10,8 +11,8 @@ from django_q.models import Schedule
 # Add the parent directory to the path so we can import lib
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))))
 
-from lib import ContaboSnapshotManager
-from snapshots.tasks import run_snapshot_job, setup_scheduled_task, run_test_job
+from snapshots import history
+from snapshots.tasks import run_snapshot_job, setup_scheduled_task, run_test_job, get_snapshot_manager
 
 
 class Command(BaseCommand):
@@ -33,6 +34,16 @@ class Command(BaseCommand):
             action='store_true',
             help='Run in test mode (skip actual snapshot operations)',
         )
+        parser.add_argument(
+            '--plan',
+            action='store_true',
+            help='Simulate a run with read-only API calls and print the planned creates/deletes, API calls and wall time',
+        )
+        parser.add_argument(
+            '--json',
+            action='store_true',
+            help='With --plan, print the plan as JSON',
+        )
         parser.add_argument(
             '--async',
             action='store_true',
@@ -50,6 +61,8 @@ class Command(BaseCommand):
             self.list_scheduled_tasks()
         elif options['test_mode']:
             self.run_test_job()
+        elif options['plan']:
+            self.run_plan(options['json'])
         elif options['async']:
             self.run_async_job()
         else:
@@ -65,7 +78,7 @@ class Command(BaseCommand):
                 self.style.SUCCESS(f'Starting Contabo snapshot management job at {current_time.strftime("%Y-%m-%d %H:%M:%S %Z")}...')
             )
             
-            manager = ContaboSnapshotManager()
+            manager = get_snapshot_manager()
             manager.manage_snapshots()
             
             self.stdout.write(
@@ -79,6 +92,26 @@ class Command(BaseCommand):
             logging.error(f"Error in snapshot job: {str(e)}")
             raise
 
+    def run_plan(self, as_json=False):
+        """Plan a snapshot run without creating or deleting anything."""
+        try:
+            manager = get_snapshot_manager()
+            manager.inventory = history.load_inventory()
+            plan = manager.plan_run()
+            if as_json:
+                self.stdout.write(json.dumps(plan, indent=2, default=str))
+                return
+            for line in manager.format_plan(plan):
+                self.stdout.write(line)
+            self.stdout.write(
+                self.style.SUCCESS('Plan completed, no snapshots were created or deleted.')
+            )
+        except Exception as e:
+            self.stdout.write(
+                self.style.ERROR(f'Error planning snapshot job: {str(e)}')
+            )
+            raise
+
     def setup_scheduled_task(self):
         """Setup the scheduled task using django-q."""
         try:
@@ -121,7 +154,8 @@ class Command(BaseCommand):
     def run_async_job(self):
         """Run the snapshot job asynchronously using django-q."""
         try:
-            task_id = async_task('snapshots.tasks.run_snapshot_job')
+            # force: an ad-hoc run also runs when the scheduled run of this window has completed
+            task_id = async_task('snapshots.tasks.run_snapshot_job', True)
             self.stdout.write(
                 self.style.SUCCESS(f'Snapshot job queued with task ID: {task_id}')
             )
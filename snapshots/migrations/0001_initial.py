@@ -0,0 +1,67 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:49
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Run',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('started_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('status', models.CharField(choices=[('running', 'Running'), ('completed', 'Completed'), ('failed', 'Failed')], default='running', max_length=20)),
+                ('engine', models.CharField(blank=True, max_length=50)),
+                ('total_instances', models.PositiveIntegerField(default=0)),
+                ('successful_snapshots', models.PositiveIntegerField(default=0)),
+                ('failed_snapshots', models.PositiveIntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+            ],
+            options={
+                'ordering': ['-started_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Snapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('snapshot_id', models.CharField(max_length=64, unique=True)),
+                ('instance_id', models.CharField(max_length=64)),
+                ('name', models.CharField(blank=True, max_length=255)),
+                ('description', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(blank=True, null=True)),
+                ('last_seen_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'ordering': ['instance_id', 'created_at'],
+                'indexes': [models.Index(fields=['instance_id', 'created_at'], name='snapshots_s_instanc_25494e_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='InstanceResult',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('instance_id', models.CharField(max_length=64)),
+                ('status', models.CharField(max_length=20)),
+                ('success', models.BooleanField(default=False)),
+                ('snapshot_name', models.CharField(blank=True, max_length=255)),
+                ('snapshot_id', models.CharField(blank=True, max_length=64)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('run', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='results', to='snapshots.run')),
+            ],
+            options={
+                'ordering': ['run', 'id'],
+                'indexes': [models.Index(fields=['instance_id', 'created_at'], name='snapshots_i_instanc_60cac7_idx')],
+            },
+        ),
+    ]
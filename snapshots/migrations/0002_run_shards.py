@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('snapshots', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='run',
+            name='shard_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='run',
+            name='shards_done',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='run',
+            name='summary_sent',
+            field=models.BooleanField(default=False),
+        ),
+    ]
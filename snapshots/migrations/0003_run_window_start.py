@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('snapshots', '0002_run_shards'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='run',
+            name='window_start',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
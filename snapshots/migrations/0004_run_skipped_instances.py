@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('snapshots', '0003_run_window_start'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='run',
+            name='skipped_instances',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('snapshots', '0004_run_skipped_instances'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InstanceFilterRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('action', models.CharField(choices=[('include', 'Include'), ('exclude', 'Exclude')], default='exclude', max_length=10)),
+                ('field', models.CharField(choices=[('instanceId', 'Instance ID'), ('displayName', 'Display name (glob, or regex with "re:" prefix)'), ('region', 'Region'), ('status', 'Status'), ('productId', 'Product ID'), ('tags', 'Tag')], max_length=20)),
+                ('value', models.CharField(max_length=255)),
+                ('enabled', models.BooleanField(default=True)),
+                ('description', models.CharField(blank=True, max_length=255)),
+            ],
+            options={
+                'ordering': ['action', 'field', 'value'],
+            },
+        ),
+    ]
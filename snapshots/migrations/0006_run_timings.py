@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('snapshots', '0005_instance_filter_rule'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='run',
+            name='timings',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:18
+
+import django.db.models.deletion
+import django.utils.timezone
+import snapshots.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('snapshots', '0006_run_timings'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContaboAccount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('client_id', models.CharField(max_length=255)),
+                ('client_secret', snapshots.fields.EncryptedTextField()),
+                ('api_user', models.CharField(max_length=255)),
+                ('api_password', snapshots.fields.EncryptedTextField()),
+                ('enabled', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'ordering': ['name'],
+            },
+        ),
+        migrations.AddField(
+            model_name='run',
+            name='account',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='runs', to='snapshots.contaboaccount'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def forget_mixed_snapshots(apps, schema_editor):
+    # The stored snapshots of several accounts could not be told apart, they are fetched again by the next run
+    if apps.get_model('snapshots', 'ContaboAccount').objects.exists():
+        apps.get_model('snapshots', 'Snapshot').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('snapshots', '0007_contabo_account'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='snapshot',
+            name='snapshots_s_instanc_25494e_idx',
+        ),
+        migrations.AddField(
+            model_name='snapshot',
+            name='account',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='snapshots.contaboaccount'),
+        ),
+        migrations.AddIndex(
+            model_name='snapshot',
+            index=models.Index(fields=['account', 'instance_id', 'created_at'], name='snapshots_s_account_38e7f4_idx'),
+        ),
+        migrations.RunPython(forget_mixed_snapshots, migrations.RunPython.noop),
+    ]
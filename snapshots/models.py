@@ -0,0 +1,187 @@
+"""
+Models for snapshot run history and the known snapshot inventory.
+"""
+from django.db import models
+from django.utils import timezone
+from .fields import EncryptedTextField
+
+
+class ContaboAccount(models.Model):
+    """A Contabo account whose instances are snapshotted by the scheduled job. The secrets are stored encrypted."""
+
+    name = models.CharField(max_length=100, unique=True)
+    client_id = models.CharField(max_length=255)
+    client_secret = EncryptedTextField()
+    api_user = models.CharField(max_length=255)
+    api_password = EncryptedTextField()
+    enabled = models.BooleanField(default=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['name']
+
+    def __str__(self):
+        return self.name
+
+    def get_credentials(self):
+        """Returns the credentials in the shape taken by ContaboSnapshotManager."""
+        return {
+            'client_id': self.client_id,
+            'client_secret': self.client_secret,
+            'api_user': self.api_user,
+            'api_password': self.api_password,
+        }
+
+
+class Run(models.Model):
+    """A single execution of the snapshot management job."""
+
+    STATUS_RUNNING = 'running'
+    STATUS_COMPLETED = 'completed'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_COMPLETED, 'Completed'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    started_at = models.DateTimeField(default=timezone.now, db_index=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_RUNNING)
+    engine = models.CharField(max_length=50, blank=True)
+    total_instances = models.PositiveIntegerField(default=0)
+    successful_snapshots = models.PositiveIntegerField(default=0)
+    failed_snapshots = models.PositiveIntegerField(default=0)
+    skipped_instances = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    # Sharded runs: number of shard tasks enqueued and finished, and whether the summary went out
+    shard_count = models.PositiveIntegerField(default=0)
+    shards_done = models.PositiveIntegerField(default=0)
+    summary_sent = models.BooleanField(default=False)
+    # Start of the schedule window the run belongs to; a retried job resumes the run of its window
+    window_start = models.DateTimeField(null=True, blank=True, db_index=True)
+    # Timing summary of the run (phase totals, slowest instances), see lib.SnapshotTracer.summary
+    timings = models.JSONField(default=dict, blank=True)
+    # The account of the run, or None for the account configured in the environment
+    account = models.ForeignKey(ContaboAccount, null=True, blank=True, on_delete=models.SET_NULL, related_name='runs')
+
+    class Meta:
+        ordering = ['-started_at']
+
+    @property
+    def group(self):
+        """The django-q group of the shard tasks of this run."""
+        return f"snapshot-run-{self.pk}"
+
+    def __str__(self):
+        return f"Run {self.pk} ({self.status}) started {self.started_at:%Y-%m-%d %H:%M}"
+
+
+class InstanceResult(models.Model):
+    """The outcome of one instance in a run, as tracked in ContaboSnapshotManager.snapshot_results."""
+
+    STATUS_SKIPPED = 'skipped'
+
+    run = models.ForeignKey(Run, on_delete=models.CASCADE, related_name='results')
+    instance_id = models.CharField(max_length=64)
+    status = models.CharField(max_length=20)
+    success = models.BooleanField(default=False)
+    snapshot_name = models.CharField(max_length=255, blank=True)
+    snapshot_id = models.CharField(max_length=64, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['run', 'id']
+        indexes = [
+            models.Index(fields=['instance_id', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.instance_id}: {self.status}"
+
+    def to_result(self):
+        """Returns the result in the shape of a ContaboSnapshotManager.snapshot_results entry."""
+        result = {
+            'id': self.instance_id,
+            'success': self.success,
+            'snapshot_name': self.snapshot_name,
+            'timestamp': timezone.localtime(self.created_at).strftime('%Y-%m-%d %H:%M:%S'),
+            'status': self.status,
+        }
+        if self.success:
+            result['snapshot_id'] = self.snapshot_id
+        else:
+            result['error'] = self.error
+        return result
+
+
+class Snapshot(models.Model):
+    """A snapshot known to exist on Contabo, as last seen by a run."""
+
+    snapshot_id = models.CharField(max_length=64, unique=True)
+    instance_id = models.CharField(max_length=64)
+    name = models.CharField(max_length=255, blank=True)
+    description = models.TextField(blank=True)
+    created_at = models.DateTimeField(null=True, blank=True)
+    last_seen_at = models.DateTimeField(default=timezone.now)
+    # The account the instance belongs to, or None for the account configured in the environment
+    account = models.ForeignKey(ContaboAccount, null=True, blank=True, on_delete=models.CASCADE, related_name='snapshots')
+
+    class Meta:
+        ordering = ['instance_id', 'created_at']
+        indexes = [
+            models.Index(fields=['account', 'instance_id', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.name or self.snapshot_id} ({self.instance_id})"
+
+    def to_api(self):
+        """Returns the snapshot in the shape of the Contabo API, as stored in a SnapshotInventory."""
+        return {
+            'snapshotId': self.snapshot_id,
+            'instanceId': self.instance_id,
+            'name': self.name,
+            'description': self.description,
+            'createdDate': self.created_at.isoformat() if self.created_at else None,
+        }
+
+
+class InstanceFilterRule(models.Model):
+    """An include or exclude rule of the instance filters, added to SNAPSHOT_INSTANCE_FILTERS (see lib.InstanceFilter)."""
+
+    ACTION_INCLUDE = 'include'
+    ACTION_EXCLUDE = 'exclude'
+    ACTION_CHOICES = [
+        (ACTION_INCLUDE, 'Include'),
+        (ACTION_EXCLUDE, 'Exclude'),
+    ]
+    FIELD_CHOICES = [
+        ('instanceId', 'Instance ID'),
+        ('displayName', 'Display name (glob, or regex with "re:" prefix)'),
+        ('region', 'Region'),
+        ('status', 'Status'),
+        ('productId', 'Product ID'),
+        ('tags', 'Tag'),
+    ]
+
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES, default=ACTION_EXCLUDE)
+    field = models.CharField(max_length=20, choices=FIELD_CHOICES)
+    value = models.CharField(max_length=255)
+    enabled = models.BooleanField(default=True)
+    description = models.CharField(max_length=255, blank=True)
+
+    class Meta:
+        ordering = ['action', 'field', 'value']
+
+    def __str__(self):
+        return f"{self.action} {self.field} = {self.value}"
+
+    @classmethod
+    def get_config(cls):
+        """Returns the enabled rules in the shape of SNAPSHOT_INSTANCE_FILTERS."""
+        config = {}
+        for rule in cls.objects.filter(enabled=True):
+            config.setdefault(rule.action, {}).setdefault(rule.field, []).append(rule.value)
+        return config
@@ -2,22 +2,155 @@
 Django-Q tasks for snapshot management.
 """
 import logging
-from django_q.tasks import schedule
+import os
+import socket
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+import pytz
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from django_q.tasks import schedule, async_task
 from django_q.models import Schedule
-from lib import ContaboSnapshotManager
+from lib import ContaboSnapshotManager, AsyncContaboSnapshotManager, InstanceFilter, build_report, dispatch_reports, get_notification_channels, get_metrics, prometheus_client
+from . import history
+from .models import Run, InstanceResult, InstanceFilterRule, ContaboAccount
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows
+    fcntl = None
 
 logger = logging.getLogger(__name__)
 
+# (pid, slot, lock file) of the metrics slot claimed by this process, see get_metrics_slot
+_metrics_slot = None
+
+
+def get_snapshot_manager_class():
+    """
+    Return the snapshot manager class for the engine selected by settings.SNAPSHOT_ENGINE.
+
+    'sync' (default) uses worker threads, 'async' uses asyncio with a single aiohttp session.
+    """
+    engine = getattr(settings, 'SNAPSHOT_ENGINE', 'sync')
+    if engine == 'async':
+        return AsyncContaboSnapshotManager
+    if engine != 'sync':
+        logger.warning(f"Unknown SNAPSHOT_ENGINE '{engine}', falling back to sync engine")
+    return ContaboSnapshotManager
+
+
+def get_instance_filter():
+    """
+    Compile the instance filters of settings.SNAPSHOT_INSTANCE_FILTERS and the enabled InstanceFilterRules.
+    """
+    config = {}
+    for source in (getattr(settings, 'SNAPSHOT_INSTANCE_FILTERS', {}), InstanceFilterRule.get_config()):
+        for action, rules in source.items():
+            for field, values in rules.items():
+                values = [values] if isinstance(values, (str, int)) else list(values)
+                config.setdefault(action, {}).setdefault(field, []).extend(values)
+    return InstanceFilter.from_config(config)
+
+
+def get_snapshot_manager(account=None):
+    """
+    Create the snapshot manager for the engine selected by settings.SNAPSHOT_ENGINE.
 
-def run_snapshot_job():
+    With a ContaboAccount the manager uses its credentials instead of the ones in the environment.
+    The verification deadline is capped at half of the django-q task timeout, so a run that
+    verifies its snapshots is not killed by the cluster while polling.
+    """
+    manager_class = get_snapshot_manager_class()
+    logger.info(f"Using {manager_class.__name__}" + (f" for account {account}" if account is not None else ""))
+    if account is None:
+        manager = manager_class()
+    else:
+        manager = manager_class(credentials=account.get_credentials(), account=account.name)
+    manager.instance_filter = get_instance_filter()
+    task_timeout = getattr(settings, 'Q_CLUSTER', {}).get('timeout')
+    if task_timeout and manager.verify_timeout > task_timeout / 2:
+        logger.warning(f"SNAPSHOT_VERIFY_TIMEOUT of {manager.verify_timeout}s exceeds half of the {task_timeout}s task timeout, using {task_timeout / 2}s")
+        manager.verify_timeout = task_timeout / 2
+    return manager
+
+
+def get_metrics_slot():
+    """
+    Return the lowest worker slot free on this host, claimed for the lifetime of this process.
+
+    A slot is an exclusive lock on a file in the temp directory. The lock is released however the
+    process exits, so a recycled django-q worker hands its slot to the next worker, and the number
+    of slots stays bounded by the number of concurrent workers. Without fcntl the pid is used.
+    """
+    global _metrics_slot
+    if _metrics_slot is not None and _metrics_slot[0] == os.getpid():
+        return _metrics_slot[1]
+    if fcntl is None:
+        return os.getpid()
+    slot = 0
+    while True:
+        lock_file = open(os.path.join(tempfile.gettempdir(), f"contabo-snapshots-metrics-{slot}.lock"), 'w')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            slot += 1
+            continue
+        _metrics_slot = (os.getpid(), slot, lock_file)
+        return slot
+
+
+def push_metrics():
+    """
+    Push the metrics of this worker process to the Pushgateway at settings.PROMETHEUS_PUSHGATEWAY_URL, if set.
+
+    Each worker pushes to the group of its host and worker slot (see get_metrics_slot), so the
+    cumulative counters of concurrent workers do not overwrite each other, while a recycled worker
+    reuses the group of the one it replaced instead of leaving a stale group behind; Prometheus
+    treats the restarted counters as a counter reset. A failed push is logged, not raised.
+    """
+    url = getattr(settings, 'PROMETHEUS_PUSHGATEWAY_URL', '')
+    if not url or get_metrics() is None:
+        return
+    try:
+        prometheus_client.pushadd_to_gateway(
+            url,
+            job=settings.PROMETHEUS_PUSH_JOB,
+            registry=prometheus_client.REGISTRY,
+            grouping_key={'instance': socket.gethostname(), 'worker': str(get_metrics_slot())},
+        )
+    except Exception as e:
+        logger.warning(f"Failed to push metrics to {url}: {e}")
+
+
+def run_snapshot_job(force=False):
     """
     Task function to run the snapshot management job.
     This function will be executed by django-q workers.
+
+    The job is idempotent per schedule window (settings.SNAPSHOT_RUN_WINDOW): a retried job
+    resumes the run of its window and only snapshots the instances that are still pending.
+    Manually queued jobs pass force to always start a new run.
+    With enabled ContaboAccounts, every account gets its own run, see run_multi_account_job.
     """
     try:
+        if ContaboAccount.objects.filter(enabled=True).exists():
+            return run_multi_account_job(force)
+        if getattr(settings, 'SNAPSHOT_SHARD_SIZE', 0) > 0:
+            return run_sharded_snapshot_job(force)
+
         logger.info("Starting Contabo snapshot management job via django-q...")
-        manager = ContaboSnapshotManager()
-        manager.manage_snapshots()
+        run = history.start_or_resume_run(get_snapshot_manager_class().__name__, force=force)
+        if run.status == Run.STATUS_COMPLETED:
+            logger.info(f"Run {run.pk} of this window already completed. Skipping.")
+            return "Snapshot job already completed in this window"
+        try:
+            process_run(run)
+        finally:
+            queue_run_reports([run.pk])
         logger.info("Snapshot management job completed successfully!")
         return "Snapshot job completed successfully"
     except Exception as e:
@@ -25,6 +158,250 @@ def run_snapshot_job():
         raise
 
 
+def process_run(run, account=None):
+    """
+    Snapshot the instances of the account (or of the credentials in the environment) and store the run.
+
+    Raises whatever the manager raised, after the run was stored as failed.
+    """
+    manager = get_snapshot_manager(account)
+    manager.run_id = run.pk
+    # The report is queued once the run is stored, so notifications do not lengthen this task
+    manager.notify_inline = False
+    manager.inventory = history.load_inventory(account=account)
+    if run.window_start is not None:
+        manager.checkpoint = history.RunCheckpoint(run)
+        # The summary of a resumed run also covers the instances done before the retry
+        manager.snapshot_results = manager.checkpoint.get_done_results()
+    try:
+        manager.manage_snapshots()
+    except Exception as e:
+        history.finish_run(run, manager, error=e)
+        raise
+    finally:
+        push_metrics()
+    history.finish_run(run, manager)
+    return run
+
+
+def run_account_job(account, force=False):
+    """
+    Snapshot one account in a worker thread of run_multi_account_job.
+
+    Returns:
+        tuple: The id of the account's run (None if its window already completed) and the
+        exception the run failed with, if any.
+    """
+    run = None
+    try:
+        run = history.start_or_resume_run(get_snapshot_manager_class().__name__, account, force)
+        if run.status == Run.STATUS_COMPLETED:
+            logger.info(f"Account {account}: run {run.pk} of this window already completed. Skipping.")
+            return None, None
+        logger.info(f"Account {account}: starting run {run.pk}")
+        process_run(run, account)
+        return run.pk, None
+    except Exception as e:
+        logger.error(f"Account {account}: snapshot run failed: {e}")
+        return (run.pk if run is not None else None), e
+    finally:
+        # Every thread opens its own database connection
+        connection.close()
+
+
+def run_multi_account_job(force=False):
+    """
+    Snapshot all enabled ContaboAccounts, settings.SNAPSHOT_ACCOUNT_WORKERS of them at a time.
+
+    Each account has its own manager, and so its own token cache entry, rate limiter, connection
+    pool and run. A failing account does not stop the others. The reports are queued per account,
+    or as one report with SNAPSHOT_ACCOUNT_REPORT=consolidated.
+    """
+    accounts = list(ContaboAccount.objects.filter(enabled=True))
+    logger.info(f"Starting snapshot job for {len(accounts)} accounts via django-q...")
+    with ThreadPoolExecutor(max_workers=max(1, min(settings.SNAPSHOT_ACCOUNT_WORKERS, len(accounts))), thread_name_prefix='account') as executor:
+        outcomes = list(executor.map(lambda account: run_account_job(account, force), accounts))
+
+    queue_run_reports([run_id for run_id, _ in outcomes if run_id], consolidated=settings.SNAPSHOT_ACCOUNT_REPORT == 'consolidated')
+    failed = [account.name for account, (_, error) in zip(accounts, outcomes) if error is not None]
+    if failed:
+        raise RuntimeError(f"Snapshot runs failed for accounts: {', '.join(failed)}")
+    return f"Snapshot job completed for {len(accounts)} accounts"
+
+
+def split_into_shards(instances, shard_size):
+    """
+    Split the instances into consecutive shards of at most shard_size instances.
+    """
+    return [instances[start:start + shard_size] for start in range(0, len(instances), shard_size)]
+
+
+def run_sharded_snapshot_job(force=False):
+    """
+    Coordinator task: list the instances and enqueue one shard task per SNAPSHOT_SHARD_SIZE instances.
+
+    The shard tasks run on any django-q worker (or node). collect_shard_result is their hook
+    and sends the summary email once the last shard of the run has finished.
+    """
+    logger.info("Starting sharded Contabo snapshot management job via django-q...")
+    run = history.start_or_resume_run(get_snapshot_manager_class().__name__, force=force)
+    if run.status == Run.STATUS_COMPLETED:
+        logger.info(f"Run {run.pk} of this window already completed. Skipping.")
+        return "Snapshot job already completed in this window"
+    if run.shards_done < run.shard_count:
+        # Shards of this run are still queued or running; they are retried by django-q themselves
+        logger.info(f"Run {run.pk}: {run.shard_count - run.shards_done} shards still pending. Not enqueuing again.")
+        return "Shards of this window still pending"
+
+    manager = get_snapshot_manager()
+    manager.run_id = run.pk
+    if run.window_start is not None:
+        manager.checkpoint = history.RunCheckpoint(run)
+    instances = [instance for instance in manager.list_instances() if manager.should_process(instance)]
+    if not instances:
+        history.close_run(run)
+        logger.info("No instances to manage.")
+        return "No instances to manage"
+
+    shards = split_into_shards(instances, settings.SNAPSHOT_SHARD_SIZE)
+    run.shard_count = run.shards_done + len(shards)
+    run.summary_sent = False
+    run.save(update_fields=['shard_count', 'summary_sent'])
+
+    for number, shard in enumerate(shards, start=1):
+        async_task(
+            'snapshots.tasks.run_snapshot_shard',
+            run.pk, shard,
+            group=run.group,
+            hook='snapshots.tasks.collect_shard_result',
+            task_name=f"{run.group}-shard-{number}-of-{len(shards)}",
+        )
+
+    logger.info(f"Run {run.pk}: enqueued {len(shards)} shards for {len(instances)} instances")
+    return f"Enqueued {len(shards)} shards for {len(instances)} instances"
+
+
+def run_snapshot_shard(run_id, instances):
+    """
+    Shard task: snapshot the given instances and store their results for the run.
+    """
+    run = Run.objects.get(pk=run_id)
+    logger.info(f"Run {run_id}: processing shard of {len(instances)} instances")
+    manager = get_snapshot_manager()
+    manager.run_id = run.pk
+    manager.inventory = history.load_inventory()
+    if run.window_start is not None:
+        manager.checkpoint = history.RunCheckpoint(run)
+    try:
+        manager.manage_instances(instances)
+    finally:
+        history.record_results(run, manager)
+        push_metrics()
+    return len(manager.snapshot_results)
+
+
+def collect_shard_result(task):
+    """
+    Hook of the shard tasks: count finished shards and send the summary once all of them are done.
+
+    Instances of a shard that crashed are recorded as errors. The Run row is locked while
+    counting, so the summary is sent exactly once even when shards finish at the same time.
+    """
+    run_id, instances = task.args[0], task.args[1]
+    with transaction.atomic():
+        run = Run.objects.select_for_update().get(pk=run_id)
+        if not task.success:
+            logger.error(f"Run {run_id}: shard {task.name} failed: {task.result}")
+            recorded = set(run.results.values_list('instance_id', flat=True))
+            InstanceResult.objects.bulk_create([
+                InstanceResult(
+                    run=run,
+                    instance_id=str(instance.get('instanceId')),
+                    status='error',
+                    error=f"Shard task failed: {task.result}",
+                )
+                for instance in instances if str(instance.get('instanceId')) not in recorded
+            ])
+        run.shards_done += 1
+        run.save(update_fields=['shards_done'])
+        if run.shards_done < run.shard_count or run.summary_sent:
+            return
+        run.summary_sent = True
+        history.close_run(run)
+
+    logger.info(f"Run {run_id}: all {run.shard_count} shards finished, queueing summary")
+    queue_run_reports([run_id])
+
+
+def queue_run_reports(run_ids, consolidated=False):
+    """
+    Queue send_run_reports for the given runs, skipping runs without any results.
+    """
+    run_ids = list(Run.objects.filter(pk__in=run_ids, total_instances__gt=0).values_list('pk', flat=True))
+    if not run_ids:
+        logger.info("No instances were processed, no summary to send.")
+        return None
+    return async_task('snapshots.tasks.send_run_reports', run_ids, None, 1, consolidated, group='snapshot-reports')
+
+
+def get_run_title(run):
+    """
+    Return the title distinguishing the report of a run among others sent together.
+    """
+    return run.account.name if run.account is not None else f"run {run.pk}"
+
+
+def build_run_reports(run_ids, consolidated=False):
+    """
+    Build the reports of the given runs: one per run, or a single one covering all of them.
+    """
+    tz = pytz.timezone(settings.TIME_ZONE)
+    runs = list(Run.objects.filter(pk__in=run_ids).select_related('account').order_by('pk'))
+    if consolidated and len(runs) > 1:
+        results, timings = [], {}
+        for run in runs:
+            title = get_run_title(run)
+            results += [{**result, 'account': title} for result in history.get_run_results(run)]
+            timings = history.merge_timings(timings, run.timings)
+        return [build_report(results, tz, timings, title=f"{len(runs)} accounts")]
+    return [
+        build_report(history.get_run_results(run), tz, run.timings,
+                     title=get_run_title(run) if len(runs) > 1 or run.account is not None else None)
+        for run in runs
+    ]
+
+
+def send_run_reports(run_ids, channel_names=None, attempt=1, consolidated=False):
+    """
+    Notification task: send the reports of the given runs through the notification channels.
+
+    All reports go out over one connection per channel (one SMTP login for a batch of runs).
+    Channels that fail are retried by scheduling this task again for them only, after
+    settings.NOTIFY_RETRY_DELAY seconds doubling per attempt, up to settings.NOTIFY_MAX_ATTEMPTS attempts.
+    """
+    channels = get_notification_channels(logger, channel_names)
+    if not channels:
+        return "No notification channels configured"
+
+    reports = build_run_reports(run_ids, consolidated)
+    failed = dispatch_reports(reports, channels, logger)
+    if not failed:
+        return f"Sent {len(reports)} report(s) via {', '.join(channel.name for channel in channels)}"
+
+    if attempt >= settings.NOTIFY_MAX_ATTEMPTS:
+        logger.error(f"Giving up on the reports of runs {list(run_ids)} via {', '.join(failed)} after {attempt} attempts")
+        return f"Failed to send via {', '.join(failed)}"
+    delay = settings.NOTIFY_RETRY_DELAY * 2 ** (attempt - 1)
+    logger.warning(f"Retrying the reports of runs {list(run_ids)} via {', '.join(failed)} in {delay}s")
+    schedule(
+        'snapshots.tasks.send_run_reports',
+        list(run_ids), failed, attempt + 1, consolidated,
+        schedule_type=Schedule.ONCE,
+        next_run=timezone.now() + timedelta(seconds=delay),
+    )
+    return f"Retrying via {', '.join(failed)}"
+
+
 def setup_scheduled_task():
     """
     Set up the scheduled task to run every 6 hours.
@@ -0,0 +1,177 @@
+import json
+import logging
+import os
+import socket
+import tempfile
+from collections import Counter
+from unittest import TestCase, mock
+
+from lib import AsyncContaboSnapshotManager, ContaboSnapshotManager, SnapshotTracer, log_request_id
+from .utils import fake_contabo_api
+
+# Fast retries, so injected faults do not slow the tests down
+RETRY_ENVIRON = {
+    'CONTABO_MAX_RETRIES': '10',
+    'CONTABO_BACKOFF_BASE': '0.001',
+    'CONTABO_BACKOFF_MAX': '0.05',
+    'SNAPSHOT_MAX_WORKERS': '8',
+    'SNAPSHOT_ASYNC_CONCURRENCY': '8',
+}
+
+
+def count_statuses(api):
+    statuses = Counter()
+    for (_, _, status), count in api.state.requests.items():
+        statuses[status] += count
+    return statuses
+
+
+class FakeApiRunTests(TestCase):
+    """Full runs of the managers against the fake Contabo API."""
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.addCleanup(logging.disable, logging.NOTSET)
+
+    def assertConsistent(self, api, results, fleet_size):
+        self.assertEqual(sorted(result['id'] for result in results), list(range(1, fleet_size + 1)))
+        for result in results:
+            snapshot_ids = [snapshot['snapshotId'] for snapshot in api.state.snapshots[result['id']]]
+            self.assertLessEqual(len(snapshot_ids), api.state.snapshot_limit)
+            if result['status'] == 'success':
+                self.assertIn(result['snapshot_id'], snapshot_ids)
+
+    def test_full_quota_is_rotated_after_402(self):
+        with fake_contabo_api(RETRY_ENVIRON, fleet_size=12, quota_full_ratio=1.0, seed=1) as api:
+            manager = ContaboSnapshotManager()
+            results = manager.manage_instances(manager.iter_instances())
+
+        self.assertConsistent(api, results, 12)
+        self.assertEqual(Counter(result['status'] for result in results), {'success': 12})
+        self.assertEqual(api.state.requests[('POST', 'snapshots', 402)], 12)
+        # Every request tagged the log records only while it was in flight
+        self.assertIsNone(log_request_id.get())
+        for instance_id in range(1, 13):
+            self.assertEqual([snapshot['name'] for snapshot in api.state.snapshots[instance_id]][0], 'seed-1')
+
+    def test_known_limit_rotates_before_creating(self):
+        with fake_contabo_api({**RETRY_ENVIRON, 'SNAPSHOT_LIMIT': '2'}, fleet_size=12, quota_full_ratio=0.5, seed=2) as api:
+            manager = ContaboSnapshotManager()
+            results = manager.manage_instances(manager.iter_instances())
+
+        self.assertConsistent(api, results, 12)
+        self.assertEqual(Counter(result['status'] for result in results), {'success': 12})
+        self.assertEqual(api.state.requests[('POST', 'snapshots', 402)], 0)
+
+    def test_rotation_survives_a_failing_delete(self):
+        environ = {**RETRY_ENVIRON, 'CONTABO_MAX_RETRIES': '1', 'SNAPSHOT_LIMIT': '2'}
+        for manager_class in (ContaboSnapshotManager, AsyncContaboSnapshotManager):
+            with self.subTest(engine=manager_class.__name__):
+                with fake_contabo_api(environ, fleet_size=30, quota_full_ratio=1.0, broken_deletes=[7]) as api:
+                    manager = manager_class()
+                    results = manager.manage_instances(manager.list_instances())
+
+                self.assertConsistent(api, results, 30)
+                statuses = {result['id']: result['status'] for result in results}
+                self.assertNotEqual(statuses.pop(7), 'success')
+                self.assertEqual(set(statuses.values()), {'success'})
+                self.assertEqual(api.state.requests[('POST', 'snapshots', 201)], 29)
+
+    def test_rotation_planning_survives_a_failing_listing(self):
+        environ = {**RETRY_ENVIRON, 'CONTABO_MAX_RETRIES': '1', 'SNAPSHOT_LIMIT': '2'}
+        for manager_class in (ContaboSnapshotManager, AsyncContaboSnapshotManager):
+            with self.subTest(engine=manager_class.__name__):
+                with fake_contabo_api(environ, fleet_size=30, quota_full_ratio=1.0, broken_listings=[7]) as api:
+                    manager = manager_class()
+                    results = manager.manage_instances(manager.list_instances())
+
+                self.assertConsistent(api, results, 30)
+                statuses = {result['id']: result['status'] for result in results}
+                # Instance 7 falls back to the 402 path, whose listing fails as well
+                self.assertEqual(statuses.pop(7), 'error')
+                self.assertEqual(set(statuses.values()), {'success'})
+                self.assertEqual(api.state.requests[('POST', 'snapshots', 201)], 29)
+                self.assertEqual(api.state.requests[('POST', 'snapshots', 402)], 1)
+
+    def test_throttling_server_errors_and_dropped_connections(self):
+        for manager_class in (ContaboSnapshotManager, AsyncContaboSnapshotManager):
+            with self.subTest(engine=manager_class.__name__):
+                with fake_contabo_api(RETRY_ENVIRON, fleet_size=40, quota_full_ratio=0.5, retry_after=0.01, seed=3) as api:
+                    # The token is requested by the constructor, before the faults start
+                    manager = manager_class()
+                    api.throttle_rate, api.error_rate, api.disconnect_rate = 0.1, 0.05, 0.05
+                    results = manager.manage_instances(manager.list_instances())
+
+                self.assertConsistent(api, results, 40)
+                statuses = count_statuses(api)
+                self.assertGreater(statuses[429], 0)
+                self.assertGreater(statuses[500], 0)
+                self.assertGreater(statuses['disconnect'], 0)
+                # Creates answered with 500 or dropped are not retried, everything else is
+                self.assertLessEqual(set(result['status'] for result in results), {'success', 'failed', 'error'})
+                self.assertGreater(Counter(result['status'] for result in results)['success'], 20)
+
+    def test_unreachable_listing_is_left_out_of_the_inventory(self):
+        environ = {**RETRY_ENVIRON, 'CONTABO_MAX_RETRIES': '1', 'SNAPSHOT_PREFETCH_INVENTORY': 'true'}
+        for manager_class in (ContaboSnapshotManager, AsyncContaboSnapshotManager):
+            with self.subTest(engine=manager_class.__name__):
+                with fake_contabo_api(environ, fleet_size=30, broken_listings=[7]) as api:
+                    manager = manager_class()
+                    results = manager.manage_instances(manager.list_instances())
+
+                self.assertConsistent(api, results, 30)
+                self.assertEqual(Counter(result['status'] for result in results), {'success': 30})
+                self.assertFalse(manager.inventory.has(7))
+                self.assertTrue(manager.inventory.has(8))
+
+    def test_pipeline_reports_stage_failures(self):
+        with fake_contabo_api({**RETRY_ENVIRON, 'SNAPSHOT_RUN_MODE': 'pipeline'}, fleet_size=6) as api:
+            manager = ContaboSnapshotManager()
+            should_process = manager.should_process
+
+            def failing_filter(instance):
+                if instance['instanceId'] == 4:
+                    raise RuntimeError('tag lookup failed')
+                return should_process(instance)
+
+            manager.should_process = failing_filter
+            results = manager.manage_instances(manager.iter_instances())
+
+        self.assertConsistent(api, results, 6)
+        self.assertEqual({result['id']: result['status'] for result in results}[4], 'error')
+        self.assertEqual(Counter(result['status'] for result in results)['success'], 5)
+
+
+class ConnectionErrorTests(TestCase):
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.addCleanup(logging.disable, logging.NOTSET)
+
+    def test_unreachable_auth_url(self):
+        with socket.socket() as unused:
+            unused.bind(('127.0.0.1', 0))
+            url = f"http://127.0.0.1:{unused.getsockname()[1]}"
+        with fake_contabo_api(RETRY_ENVIRON):
+            with mock.patch.dict(os.environ, {'CONTABO_AUTH_URL': url + '/token', 'CONTABO_MAX_RETRIES': '1'}):
+                manager = ContaboSnapshotManager()
+        self.assertIsNone(manager.access_token)
+
+    def test_failing_request_hook_does_not_break_requests(self):
+        with fake_contabo_api(RETRY_ENVIRON, fleet_size=3):
+            manager = ContaboSnapshotManager()
+            manager.api_client.request_hooks.append(mock.Mock(side_effect=RuntimeError('observer failed')))
+            self.assertEqual(len(manager.list_instances()), 3)
+
+    def test_tracer_records_connection_errors(self):
+        with tempfile.TemporaryDirectory() as directory:
+            tracer = SnapshotTracer(trace_file=os.path.join(directory, 'trace.jsonl'), otel=False)
+            tracer.start_run(engine='test', run_id='1')
+            tracer.observe_request('GET', 'https://api.contabo.com/v1/compute/instances', None, 0.1)
+            tracer.finish_run()
+            with open(tracer.trace_file) as trace_file:
+                spans = {span['name']: span for span in map(json.loads, trace_file)}
+
+        self.assertEqual(tracer.summary()['phases'], {'api': {'count': 1, 'total_seconds': 0.1, 'max_seconds': 0.1}})
+        self.assertEqual(spans['GET /v1/compute/instances']['status'], {'code': 2, 'message': 'connection error'})
+        self.assertEqual(spans['snapshot_run']['status'], {'code': 0})
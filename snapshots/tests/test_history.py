@@ -0,0 +1,60 @@
+from cryptography.fernet import Fernet
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from lib import SnapshotInventory
+from snapshots.history import load_inventory, merge_timings, save_inventory
+from snapshots.models import ContaboAccount
+
+
+def summary(wall_seconds, phases, slowest):
+    return {
+        'trace_id': 'abc',
+        'wall_seconds': wall_seconds,
+        'phases': {phase: {'count': count, 'total_seconds': total, 'max_seconds': maximum} for phase, (count, total, maximum) in phases.items()},
+        'slowest_instances': [{'id': instance_id, 'seconds': seconds} for instance_id, seconds in slowest],
+    }
+
+
+class MergeTimingsTests(SimpleTestCase):
+
+    def test_first_summary_is_stored_as_is(self):
+        first = summary(2.0, {'create': (2, 1.5, 1.0)}, [(1, 1.0)])
+        self.assertEqual(merge_timings(None, first), first)
+        self.assertEqual(merge_timings({}, first), first)
+
+    def test_shards_are_merged(self):
+        first = summary(2.0, {'create': (2, 1.5, 1.0), 'list': (1, 0.2, 0.2)}, [(1, 1.0), (2, 0.5)])
+        second = summary(3.0, {'create': (3, 2.25, 1.25), 'delete': (1, 0.1, 0.1)}, [(3, 1.25), (4, 0.25)])
+        merged = merge_timings(first, second, slowest=3)
+
+        self.assertEqual(merged['trace_id'], 'abc')
+        self.assertEqual(merged['wall_seconds'], 3.0)
+        self.assertEqual(merged['phases']['create'], {'count': 5, 'total_seconds': 3.75, 'max_seconds': 1.25})
+        self.assertEqual(merged['phases']['delete']['count'], 1)
+        self.assertEqual(list(merged['phases']), ['create', 'list', 'delete'])
+        self.assertEqual([instance['id'] for instance in merged['slowest_instances']], [3, 1, 2])
+
+    def test_stored_timings_are_not_modified(self):
+        first = summary(1.0, {'create': (1, 1.0, 1.0)}, [])
+        merge_timings(first, summary(1.0, {'create': (1, 1.0, 1.0)}, []))
+        self.assertEqual(first['phases']['create']['count'], 1)
+
+
+@override_settings(ACCOUNT_ENCRYPTION_KEY=Fernet.generate_key().decode())
+class InventoryTests(TestCase):
+
+    def inventory(self, snapshot_id):
+        inventory = SnapshotInventory()
+        inventory.set(1, [{'snapshotId': snapshot_id, 'createdDate': '2024-01-01T00:00:00Z'}])
+        return inventory
+
+    def test_accounts_keep_their_own_snapshots(self):
+        account = ContaboAccount.objects.create(name='other', client_id='test', client_secret='secret', api_user='test', api_password='password')
+        save_inventory(self.inventory('environment'))
+        save_inventory(self.inventory('other'), account)
+        # Saving an account's inventory again only replaces the snapshots of that account
+        save_inventory(self.inventory('replaced'), account)
+
+        self.assertEqual([snapshot['snapshotId'] for snapshot in load_inventory(3600).get(1)], ['environment'])
+        self.assertEqual([snapshot['snapshotId'] for snapshot in load_inventory(3600, account).get(1)], ['replaced'])
+        self.assertEqual(len(load_inventory(0, account)), 0)
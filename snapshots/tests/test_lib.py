@@ -0,0 +1,198 @@
+import time
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from unittest import TestCase
+
+import pytz
+
+from lib import InstanceFilter, RateLimiter, RetryPolicy, SnapshotInventory, log_request, log_request_id
+
+
+def snapshot(snapshot_id, created_date):
+    return {'snapshotId': snapshot_id, 'createdDate': created_date}
+
+
+class FakeResponse:
+
+    def __init__(self, headers):
+        self.headers = headers
+
+
+class InstanceFilterTests(TestCase):
+
+    instances = [
+        {'instanceId': 1, 'displayName': 'web-1', 'region': 'EU', 'status': 'running', 'productId': 'V45'},
+        {'instanceId': 2, 'displayName': 'web-2', 'region': 'US-central', 'status': 'stopped', 'productId': 'V45'},
+        {'instanceId': 3, 'displayName': 'test-db', 'region': 'EU', 'status': 'running', 'productId': 'V92'},
+    ]
+
+    def selected(self, instance_filter):
+        return [instance['instanceId'] for instance in self.instances if instance_filter.matches(instance)]
+
+    def test_empty_filter_selects_everything(self):
+        instance_filter = InstanceFilter.from_config('')
+        self.assertTrue(instance_filter.is_empty)
+        self.assertEqual(self.selected(instance_filter), [1, 2, 3])
+
+    def test_include_values_are_case_insensitive(self):
+        self.assertEqual(self.selected(InstanceFilter(include={'region': ['eu'], 'status': 'RUNNING'})), [1, 3])
+
+    def test_exclude_display_name_glob(self):
+        self.assertEqual(self.selected(InstanceFilter(exclude={'displayName': ['test-*']})), [1, 2])
+
+    def test_display_name_regular_expression(self):
+        self.assertEqual(self.selected(InstanceFilter(include={'displayName': ['re:web-[2-9]']})), [2])
+
+    def test_include_and_exclude_combine(self):
+        instance_filter = InstanceFilter.from_config('{"include": {"productId": ["V45"]}, "exclude": {"status": ["stopped"]}}')
+        self.assertEqual(self.selected(instance_filter), [1])
+
+    def test_tags(self):
+        instance_filter = InstanceFilter(exclude={'tags': ['Ephemeral']})
+        self.assertEqual(instance_filter.tags, frozenset({'ephemeral'}))
+        instance_filter.set_tagged_instances({'ephemeral': [2, 3]})
+        self.assertEqual(self.selected(instance_filter), [1])
+
+    def test_invalid_rules(self):
+        with self.assertRaises(ValueError):
+            InstanceFilter(include={'hostname': ['web-1']})
+        with self.assertRaises(ValueError):
+            InstanceFilter.from_config('["status"]')
+
+
+class RetryPolicyTests(TestCase):
+
+    def test_parse_retry_after_seconds(self):
+        policy = RetryPolicy()
+        self.assertEqual(policy.parse_retry_after('5'), 5.0)
+        self.assertEqual(policy.parse_retry_after('0.25'), 0.25)
+        self.assertEqual(policy.parse_retry_after('-3'), 0.0)
+
+    def test_parse_retry_after_http_date(self):
+        policy = RetryPolicy()
+        value = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=30), usegmt=True)
+        self.assertAlmostEqual(policy.parse_retry_after(value), 30, delta=2)
+        past = format_datetime(datetime.now(timezone.utc) - timedelta(seconds=30), usegmt=True)
+        self.assertEqual(policy.parse_retry_after(past), 0.0)
+
+    def test_parse_retry_after_invalid(self):
+        policy = RetryPolicy()
+        self.assertIsNone(policy.parse_retry_after(None))
+        self.assertIsNone(policy.parse_retry_after(''))
+        self.assertIsNone(policy.parse_retry_after('soon'))
+
+    def test_retry_after_is_capped(self):
+        policy = RetryPolicy(backoff_max=10)
+        self.assertEqual(policy.get_delay(0, FakeResponse({'Retry-After': '120'})), 10)
+        self.assertLessEqual(policy.get_delay(5, FakeResponse({})), 10)
+
+    def test_post_is_only_retried_when_not_processed(self):
+        policy = RetryPolicy(max_retries=2)
+        self.assertTrue(policy.should_retry('POST', 0, 429))
+        self.assertTrue(policy.should_retry('POST', 0, 503))
+        self.assertFalse(policy.should_retry('POST', 0, 500))
+        self.assertFalse(policy.should_retry('POST', 0, None))
+        self.assertTrue(policy.should_retry('GET', 0, 500))
+        self.assertTrue(policy.should_retry('DELETE', 0, None))
+        self.assertFalse(policy.should_retry('GET', 0, 404))
+        self.assertFalse(policy.should_retry('GET', 2, 500))
+
+
+class RateLimiterTests(TestCase):
+
+    def test_disabled(self):
+        limiter = RateLimiter(rate=0)
+        self.assertEqual([limiter.reserve() for _ in range(100)], [0.0] * 100)
+
+    def test_burst_then_rate(self):
+        limiter = RateLimiter(rate=10, burst=2)
+        self.assertEqual(limiter.reserve(), 0.0)
+        self.assertEqual(limiter.reserve(), 0.0)
+        self.assertAlmostEqual(limiter.reserve(), 0.1, delta=0.01)
+        self.assertAlmostEqual(limiter.reserve(), 0.2, delta=0.01)
+
+    def test_throttle_pauses_and_halves_the_rate_once(self):
+        limiter = RateLimiter(rate=10, burst=20, min_rate=1)
+        limiter.throttle(0.5)
+        limiter.throttle(0.5)
+        self.assertEqual(limiter.rate, 5)
+        self.assertGreater(limiter.reserve(), 0.4)
+
+    def test_rate_never_drops_below_min_rate(self):
+        limiter = RateLimiter(rate=4, min_rate=1)
+        for _ in range(5):
+            limiter.paused_until = 0
+            limiter.throttle(0)
+        self.assertEqual(limiter.rate, 1)
+
+    def test_recover_up_to_the_configured_rate(self):
+        limiter = RateLimiter(rate=10)
+        limiter.throttle(0)
+        for _ in range(30):
+            limiter.recover()
+        self.assertEqual(limiter.rate, 10)
+
+    def test_acquire_waits_for_a_token(self):
+        limiter = RateLimiter(rate=20, burst=1)
+        started = time.monotonic()
+        for _ in range(3):
+            limiter.acquire()
+        self.assertGreaterEqual(time.monotonic() - started, 0.09)
+
+
+class SnapshotInventoryTests(TestCase):
+
+    def test_snapshots_are_sorted_oldest_first(self):
+        inventory = SnapshotInventory()
+        inventory.set(1, [
+            snapshot('b', '2024-01-02T00:00:00.000Z'),
+            snapshot('undated', None),
+            snapshot('a', '2024-01-01T00:00:00.000Z'),
+        ])
+        self.assertEqual([entry['snapshotId'] for entry in inventory.get('1')], ['undated', 'a', 'b'])
+        self.assertEqual(inventory.oldest(1)['snapshotId'], 'undated')
+        self.assertEqual(inventory.newest(1)['snapshotId'], 'b')
+
+    def test_add_and_remove(self):
+        inventory = SnapshotInventory()
+        inventory.set(1, [snapshot('a', '2024-01-01T00:00:00.000Z')])
+        inventory.add(1, snapshot('c', '2024-01-03T00:00:00.000Z'))
+        inventory.add(1, snapshot('b', '2024-01-02T00:00:00.000Z'))
+        self.assertEqual([entry['snapshotId'] for entry in inventory.get(1)], ['a', 'b', 'c'])
+        inventory.remove(1, 'a')
+        self.assertEqual(inventory.count(1), 2)
+        self.assertEqual(inventory.oldest(1)['snapshotId'], 'b')
+
+    def test_unknown_instances(self):
+        inventory = SnapshotInventory()
+        inventory.add(2, snapshot('a', '2024-01-01T00:00:00.000Z'))
+        self.assertFalse(inventory.has(2))
+        self.assertEqual(inventory.get(2), [])
+        self.assertIsNone(inventory.newest(2))
+        inventory.set(2, [])
+        self.assertTrue(inventory.has(2))
+        inventory.discard(2)
+        self.assertEqual(len(inventory), 0)
+
+    def test_parse_created_date(self):
+        parse = SnapshotInventory.parse_created_date
+        self.assertEqual(parse(snapshot('a', '2024-01-01T12:00:00.000Z')), datetime(2024, 1, 1, 12, tzinfo=pytz.utc))
+        self.assertEqual(parse(snapshot('a', '2024-01-01T12:00:00')).tzinfo, pytz.utc)
+        self.assertIsNone(parse(snapshot('a', 'yesterday')))
+        self.assertIsNone(parse({}))
+
+
+class LogContextTests(TestCase):
+
+    def test_log_request_restores_the_outer_request_id(self):
+        with log_request('outer'):
+            with log_request('inner'):
+                self.assertEqual(log_request_id.get(), 'inner')
+            self.assertEqual(log_request_id.get(), 'outer')
+        self.assertIsNone(log_request_id.get())
+
+    def test_request_id_is_reset_when_the_block_raises(self):
+        with self.assertRaises(RuntimeError):
+            with log_request('failing'):
+                raise RuntimeError('request failed')
+        self.assertIsNone(log_request_id.get())
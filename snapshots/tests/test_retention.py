@@ -0,0 +1,83 @@
+import logging
+from datetime import datetime, timedelta
+from unittest import TestCase
+
+import pytz
+
+from lib import ContaboSnapshotManager, RetentionPolicy
+from .utils import fake_contabo_api
+
+DAY = 86400
+NOW = datetime(2024, 6, 15, 12, 0, tzinfo=pytz.utc)
+
+
+def snapshot(name, age, now=NOW):
+    return {'snapshotId': name, 'name': name, 'createdDate': (now - timedelta(seconds=age)).strftime('%Y-%m-%dT%H:%M:%S.000Z')}
+
+
+def names(snapshots):
+    return [snapshot['name'] for snapshot in snapshots]
+
+
+class RetentionPolicyTests(TestCase):
+
+    def test_daily_keeps_newest_snapshot_of_each_day(self):
+        snapshots = [snapshot('a', 3 * DAY), snapshot('b', DAY + 3600), snapshot('c', DAY), snapshot('d', 3600)]
+        keep, delete = RetentionPolicy(daily=2).plan(snapshots, NOW)
+        self.assertEqual(names(keep), ['c', 'd'])
+        self.assertEqual(names(delete), ['a', 'b'])
+
+    def test_max_age_deletes_expired_snapshots(self):
+        snapshots = [snapshot('a', 10 * DAY), snapshot('b', 5 * DAY), snapshot('c', DAY)]
+        keep, delete = RetentionPolicy(max_age=7 * DAY).plan(snapshots, NOW)
+        self.assertEqual(names(keep), ['b', 'c'])
+        self.assertEqual(names(delete), ['a'])
+
+    def test_max_age_keeps_newest_snapshot(self):
+        snapshots = [snapshot('a', 12 * DAY), snapshot('b', 11 * DAY), snapshot('c', 10 * DAY)]
+        keep, delete = RetentionPolicy(max_age=7 * DAY).plan(snapshots, NOW)
+        self.assertEqual(names(keep), ['c'])
+        self.assertEqual(names(delete), ['a', 'b'])
+
+    def test_max_age_with_tiers_keeps_newest_snapshot(self):
+        snapshots = [snapshot('a', 12 * DAY), snapshot('b', 11 * DAY), snapshot('c', 10 * DAY)]
+        keep, delete = RetentionPolicy(daily=7, max_age=7 * DAY).plan(snapshots, NOW)
+        self.assertEqual(names(keep), ['c'])
+        self.assertEqual(names(delete), ['a', 'b'])
+
+    def test_pinned_and_undated_snapshots_are_kept(self):
+        snapshots = [snapshot('release-1', 30 * DAY), {'snapshotId': 'x', 'name': 'undated'}, snapshot('a', 20 * DAY), snapshot('b', DAY)]
+        keep, delete = RetentionPolicy(max_age=7 * DAY, pinned=['release-*']).plan(snapshots, NOW)
+        self.assertEqual(sorted(names(keep)), ['b', 'release-1', 'undated'])
+        self.assertEqual(names(delete), ['a'])
+
+    def test_disabled_without_tiers_or_max_age(self):
+        self.assertFalse(RetentionPolicy(pinned=['keep-*']).is_enabled)
+
+
+class ApplyRetentionTests(TestCase):
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.addCleanup(logging.disable, logging.NOTSET)
+
+    def test_only_instances_with_a_new_snapshot_are_pruned(self):
+        with fake_contabo_api(fleet_size=4) as api:
+            manager = ContaboSnapshotManager()
+            manager.retention_policy = RetentionPolicy(max_age=7 * DAY)
+            now = manager.get_current_time()
+            for instance_id in (1, 2, 3, 4):
+                api.state.snapshots[instance_id] = [snapshot(f"{instance_id}-old", 20 * DAY, now), snapshot(f"{instance_id}-new", 60, now)]
+            results = [
+                {'id': 1, 'status': 'success'},
+                {'id': 2, 'status': 'unverified'},
+                {'id': 3, 'status': 'failed'},
+                {'id': 4, 'status': 'skipped'},
+            ]
+            deleted = manager.apply_retention(results)
+
+            self.assertEqual(deleted, 2)
+            self.assertEqual(names(api.state.snapshots[1]), ['1-new'])
+            self.assertEqual(names(api.state.snapshots[2]), ['2-new'])
+            self.assertEqual(names(api.state.snapshots[3]), ['3-old', '3-new'])
+            self.assertEqual(names(api.state.snapshots[4]), ['4-old', '4-new'])
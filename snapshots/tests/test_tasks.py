@@ -0,0 +1,176 @@
+import logging
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest import mock
+
+from cryptography.fernet import Fernet
+from django.test import TransactionTestCase, override_settings
+from django.utils import timezone
+from django_q.models import Schedule
+
+from lib import ContaboSnapshotManager, SlackChannel, WebhookChannel
+from snapshots import tasks
+from snapshots.models import ContaboAccount, InstanceResult, Run, Snapshot
+from .test_fake_api import RETRY_ENVIRON
+from .utils import fake_contabo_api
+
+NOTIFY_ENVIRON = {
+    'SNAPSHOT_NOTIFY_CHANNELS': 'webhook,slack',
+    'NOTIFY_WEBHOOK_URL': 'http://127.0.0.1:9/webhook',
+    'SLACK_WEBHOOK_URL': 'http://127.0.0.1:9/slack',
+}
+
+
+def queued(async_task, func):
+    """Returns the positional arguments of the calls of the mocked async_task for func."""
+    return [call.args[1:] for call in async_task.call_args_list if call.args[0] == func]
+
+
+# The runs are stored from the worker threads of the managers, which do not share the test's transaction
+@override_settings(SNAPSHOT_RUN_WINDOW=0, SNAPSHOT_SHARD_SIZE=0, SNAPSHOT_INVENTORY_MAX_AGE=3600, PROMETHEUS_PUSHGATEWAY_URL='')
+class SnapshotJobTests(TransactionTestCase):
+    """Scheduled jobs against the fake Contabo API, with async_task mocked out."""
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.addCleanup(logging.disable, logging.NOTSET)
+        patcher = mock.patch('snapshots.tasks.async_task')
+        self.async_task = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @override_settings(SNAPSHOT_SHARD_SIZE=4)
+    def test_sharded_run_is_closed_by_the_last_shard(self):
+        with fake_contabo_api(RETRY_ENVIRON, fleet_size=10):
+            tasks.run_snapshot_job()
+            shards = queued(self.async_task, 'snapshots.tasks.run_snapshot_shard')
+            self.assertEqual([len(instances) for _, instances in shards], [4, 4, 2])
+
+            run = Run.objects.get()
+            self.assertEqual((run.shard_count, run.shards_done), (3, 0))
+            for number, (run_id, instances) in enumerate(shards):
+                # The second shard crashes before storing any result
+                if number != 1:
+                    tasks.run_snapshot_shard(run_id, instances)
+                tasks.collect_shard_result(SimpleNamespace(
+                    args=(run_id, instances), success=number != 1, result='worker died', name=f"shard-{number}"
+                ))
+
+        run.refresh_from_db()
+        self.assertEqual(run.status, Run.STATUS_COMPLETED)
+        self.assertTrue(run.summary_sent)
+        self.assertEqual((run.total_instances, run.successful_snapshots, run.failed_snapshots), (10, 6, 4))
+        crashed = {str(instance['instanceId']) for instance in shards[1][1]}
+        self.assertEqual(set(run.results.filter(status='error').values_list('instance_id', flat=True)), crashed)
+        self.assertEqual(queued(self.async_task, 'snapshots.tasks.send_run_reports'), [([run.pk], None, 1, False)])
+
+    @override_settings(SNAPSHOT_RUN_WINDOW=21600)
+    def test_retried_job_resumes_the_run_of_its_window(self):
+        snapshot_instance = ContaboSnapshotManager.snapshot_instance
+
+        def failing_snapshot_instance(manager, instance_id):
+            if str(instance_id) == '3':
+                return manager.build_result(instance_id, 'test', False, 'failed', error='quota exceeded')
+            return snapshot_instance(manager, instance_id)
+
+        with fake_contabo_api(RETRY_ENVIRON, fleet_size=6) as api:
+            with mock.patch.object(ContaboSnapshotManager, 'snapshot_instance', failing_snapshot_instance):
+                tasks.run_snapshot_job()
+            run = Run.objects.get()
+            self.assertEqual((run.successful_snapshots, run.failed_snapshots), (5, 1))
+            self.assertEqual(api.state.requests[('POST', 'snapshots', 201)], 5)
+
+            tasks.run_snapshot_job()
+            # Only the failed instance is snapshotted again, in the same run
+            self.assertEqual(api.state.requests[('POST', 'snapshots', 201)], 6)
+            run = Run.objects.get()
+            self.assertEqual(run.status, Run.STATUS_COMPLETED)
+            self.assertEqual((run.total_instances, run.successful_snapshots, run.failed_snapshots), (6, 6, 0))
+
+            self.assertEqual(tasks.run_snapshot_job(), "Snapshot job already completed in this window")
+            self.assertEqual(api.state.requests[('POST', 'snapshots', 201)], 6)
+            tasks.run_snapshot_job(force=True)
+            self.assertEqual(Run.objects.count(), 2)
+
+    # Both accounts are served by the same fake API, so they take turns on its instances
+    @override_settings(ACCOUNT_ENCRYPTION_KEY=Fernet.generate_key().decode(), SNAPSHOT_ACCOUNT_WORKERS=1)
+    def test_every_enabled_account_gets_its_own_run(self):
+        credentials = {'client_id': 'test', 'client_secret': 'secret', 'api_user': 'test', 'api_password': 'password'}
+        first = ContaboAccount.objects.create(name='first', **credentials)
+        second = ContaboAccount.objects.create(name='second', **credentials)
+        ContaboAccount.objects.create(name='disabled', enabled=False, **credentials)
+
+        with fake_contabo_api({**RETRY_ENVIRON, 'SNAPSHOT_PREFETCH_INVENTORY': 'true'}, fleet_size=5):
+            tasks.run_snapshot_job()
+
+        runs = {run.account: run for run in Run.objects.select_related('account')}
+        self.assertEqual(set(runs), {first, second})
+        for account, run in runs.items():
+            self.assertEqual((run.status, run.successful_snapshots), (Run.STATUS_COMPLETED, 5))
+            # The instance ids of the accounts overlap, their stored snapshots do not
+            self.assertEqual(Snapshot.objects.filter(account=account).values('instance_id').distinct().count(), 5)
+        self.assertFalse(Snapshot.objects.filter(account=None).exists())
+        [(run_ids, _, _, consolidated)] = queued(self.async_task, 'snapshots.tasks.send_run_reports')
+        self.assertEqual(sorted(run_ids), sorted(run.pk for run in runs.values()))
+        self.assertFalse(consolidated)
+
+    @override_settings(ACCOUNT_ENCRYPTION_KEY=Fernet.generate_key().decode())
+    def test_failing_account_does_not_stop_the_others(self):
+        credentials = {'client_id': 'test', 'client_secret': 'secret', 'api_user': 'test', 'api_password': 'password'}
+        ContaboAccount.objects.create(name='healthy', **credentials)
+        ContaboAccount.objects.create(name='broken', **credentials)
+        process_run = tasks.process_run
+
+        def failing_process_run(run, account=None):
+            if account.name == 'broken':
+                raise RuntimeError('invalid credentials')
+            return process_run(run, account)
+
+        with fake_contabo_api(RETRY_ENVIRON, fleet_size=3):
+            with mock.patch('snapshots.tasks.process_run', failing_process_run):
+                with self.assertRaisesRegex(RuntimeError, 'broken'):
+                    tasks.run_snapshot_job()
+
+        run = Run.objects.get(account__name='healthy')
+        self.assertEqual((run.status, run.successful_snapshots), (Run.STATUS_COMPLETED, 3))
+        self.assertEqual(queued(self.async_task, 'snapshots.tasks.send_run_reports')[0][0], [run.pk])
+
+
+@override_settings(NOTIFY_MAX_ATTEMPTS=3, NOTIFY_RETRY_DELAY=60)
+class SendRunReportsTests(TransactionTestCase):
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.addCleanup(logging.disable, logging.NOTSET)
+        self.run = Run.objects.create(engine='test', status=Run.STATUS_COMPLETED, total_instances=1, successful_snapshots=1)
+        InstanceResult.objects.create(run=self.run, instance_id='1', status='success', success=True, snapshot_name='test')
+        for patcher in (
+            mock.patch.dict('os.environ', NOTIFY_ENVIRON),
+            mock.patch.object(WebhookChannel, 'send'),
+            mock.patch.object(SlackChannel, 'send', side_effect=ConnectionError('slack is down')),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_only_the_failed_channel_is_retried(self):
+        with mock.patch('snapshots.tasks.schedule') as schedule:
+            tasks.send_run_reports([self.run.pk])
+
+        WebhookChannel.send.assert_called_once()
+        schedule.assert_called_once()
+        self.assertEqual(schedule.call_args.args, ('snapshots.tasks.send_run_reports', [self.run.pk], ['slack'], 2, False))
+        self.assertEqual(schedule.call_args.kwargs['schedule_type'], Schedule.ONCE)
+        self.assertAlmostEqual(schedule.call_args.kwargs['next_run'], timezone.now() + timedelta(seconds=60), delta=timedelta(seconds=5))
+
+        SlackChannel.send.side_effect = None
+        with mock.patch('snapshots.tasks.schedule') as schedule:
+            self.assertEqual(tasks.send_run_reports([self.run.pk], ['slack'], 2), "Sent 1 report(s) via slack")
+        WebhookChannel.send.assert_called_once()
+        schedule.assert_not_called()
+
+    def test_retry_delay_doubles_until_the_last_attempt(self):
+        with mock.patch('snapshots.tasks.schedule') as schedule:
+            tasks.send_run_reports([self.run.pk], ['slack'], 2)
+            self.assertAlmostEqual(schedule.call_args.kwargs['next_run'], timezone.now() + timedelta(seconds=120), delta=timedelta(seconds=5))
+            schedule.reset_mock()
+            self.assertEqual(tasks.send_run_reports([self.run.pk], ['slack'], 3), "Failed to send via slack")
+        schedule.assert_not_called()
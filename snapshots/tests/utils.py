@@ -0,0 +1,32 @@
+"""
+Helpers shared by the tests of the snapshots app.
+"""
+import os
+from contextlib import contextmanager
+from unittest import mock
+
+from snapshots.fake_api import FakeContaboApi
+
+# Placeholders for the credentials, which the fake API does not check
+TEST_ENVIRON = {
+    'CLIENT_ID': 'test',
+    'CLIENT_SECRET': 'test',
+    'API_USER': 'test',
+    'API_PASSWORD': 'test',
+    'CONTABO_TOKEN_CACHE': 'memory',
+    'CONTABO_RATE_LIMIT': '0',
+}
+
+
+@contextmanager
+def fake_contabo_api(environ=None, **options):
+    """
+    Serves a FakeContaboApi and points the managers created inside the block at it.
+
+    Parameters:
+        environ (dict): Extra environment variables for the managers, e.g. SNAPSHOT_MAX_WORKERS.
+        options: The FakeContaboApi options, e.g. fleet_size or error_rate.
+    """
+    with FakeContaboApi(**options) as api:
+        with mock.patch.dict(os.environ, {**TEST_ENVIRON, **(environ or {}), **api.environ()}):
+            yield api
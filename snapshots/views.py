@@ -0,0 +1,17 @@
+"""
+HTTP views of the snapshots app.
+"""
+from django.http import HttpResponse
+from lib import get_metrics, prometheus_client
+
+
+def metrics(request):
+    """
+    Expose the snapshot and Contabo API metrics of this process in the Prometheus text format.
+
+    Runs executed by django-q workers push their metrics to the Pushgateway instead, see
+    snapshots.tasks.push_metrics.
+    """
+    if get_metrics() is None:
+        return HttpResponse('Metrics are disabled or prometheus_client is not installed.\n', status=501, content_type='text/plain')
+    return HttpResponse(prometheus_client.generate_latest(prometheus_client.REGISTRY), content_type=prometheus_client.CONTENT_TYPE_LATEST)
@@ -18,6 +18,10 @@ log "  LOG_BACKUP_COUNT: ${LOG_BACKUP_COUNT:-5}"
 log "Running Django migrations..."
 python manage.py migrate --noinput
 
+# Create the cache table (shared access token cache)
+log "Creating cache table..."
+python manage.py createcachetable
+
 # Collect static files
 log "Collecting static files..."
 python manage.py collectstatic --noinput --clear